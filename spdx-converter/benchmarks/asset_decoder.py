@@ -0,0 +1,157 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Benchmark of the validation of retrieved assets
+The payload of a synthetic document (see synthetic.py), decoded from JSON as it is retrieved, is checked:
+ - baseline: GatewayAsset.from_dict as it was before the compiled validators (first commit of this tree), which
+   only checks the top-level fields, with asserts, and reads the date with dateutil
+ - compiled_cold: dbom_wrapper.schema.asset_errors, checking the whole asset, with an empty date cache
+ - compiled: asset_errors again, the dates of the asset memoized
+ - invalid: asset_errors on a copy of the payload with one error in every file, all of them reported
+ - convert: the conversion the validation guards, create_sbom without its check
+The cost of the full validation is reported as the time it adds to the baseline, and as a share of convert.
+The compile time of the validator is reported on its own
+
+Run it from the spdx-converter directory: python benchmarks/asset_decoder.py --files 1000 10000
+"""
+
+import argparse
+import copy
+import json
+import os
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def baseline_from_dict(obj):
+    """
+    GatewayAsset.from_dict of the first commit of dbom_wrapper/types.py, with its helpers inlined
+    :return: The tuple of the fields GatewayAsset was made of
+    """
+    import dateutil.parser
+
+    def from_int(x):
+        assert isinstance(x, int) and not isinstance(x, bool)
+        return x
+
+    def from_str(x):
+        assert isinstance(x, str)
+        return x
+
+    assert isinstance(obj, dict)
+    standard_version = from_int(obj.get("standardVersion"))
+    document_name = from_str(obj.get("documentName"))
+    document_creator = from_str(obj.get("documentCreator"))
+    document_created_date = dateutil.parser.parse(obj.get("documentCreatedDate"))
+    asset_metadata = obj.get("assetMetadata")
+    asset_type = from_str(obj.get("assetType"))
+    asset_sub_type = from_str(obj.get("assetSubType"))
+    asset_manufacturer = from_str(obj.get("assetManufacturer"))
+    asset_model_number = from_str(obj.get("assetModelNumber"))
+    asset_description = from_str(obj.get("assetDescription"))
+    manufacture_signature = from_str(obj.get("manufactureSignature"))
+    return (document_name, document_creator, document_created_date, asset_metadata, asset_type, asset_sub_type,
+            asset_manufacturer, asset_model_number, asset_description, manufacture_signature, standard_version)
+
+
+def timed(fn, repeat: int, setup=None) -> float:
+    """
+    Run fn repeat times, after setup if given
+    :return: The median duration in seconds
+    """
+    durations = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations)
+
+
+def measure(files: int, args) -> dict:
+    from dbom_wrapper import schema
+    from dbom_wrapper.convert import convert_spdx_to_payload, create_sbom
+    from synthetic import generate_sbom
+
+    text = ''.join(generate_sbom(files, int(files * args.snippets_per_file), args.annotations, args.reviews))
+    payload = json.loads(json.dumps(convert_spdx_to_payload(text, shared_licenses=args.license_table)))
+    if schema.asset_errors(payload):
+        raise ValueError('The synthetic payload is not a valid asset')
+    invalid = copy.deepcopy(payload)
+    for file in invalid['assetMetadata']['package']['files']:
+        file['type'] = str(file['type'])
+
+    start = time.perf_counter()
+    schema.compile_schema.cache_clear()
+    schema.compile_schema(schema.ASSET_V1)
+    compile_seconds = time.perf_counter() - start
+
+    stages = {
+        'baseline': timed(lambda: baseline_from_dict(payload), args.repeat),
+        'compiled_cold': timed(lambda: schema.asset_errors(payload), args.repeat, schema.parse_datetime.cache_clear),
+        'compiled': timed(lambda: schema.asset_errors(payload), args.repeat),
+        'invalid': timed(lambda: schema.asset_errors(invalid), args.repeat),
+        'convert': timed(lambda: create_sbom(payload, check=False), args.repeat),
+    }
+    added = stages['compiled_cold'] - stages['baseline']
+    return {
+        'files': files,
+        'payload_bytes': len(json.dumps(payload)),
+        'errors_reported': len(schema.asset_errors(invalid)),
+        'compile_seconds': round(compile_seconds, 4),
+        'seconds': {name: round(seconds, 4) for name, seconds in stages.items()},
+        'added_seconds': round(added, 4),
+        'added_share_of_convert': round(added / stages['convert'], 3),
+    }
+
+
+def main(args):
+    results = []
+    for files in args.files:
+        result = measure(files, args)
+        results.append(result)
+        print(f"{files} files: " + ', '.join(f"{name} {s}s" for name, s in result['seconds'].items()) +
+              f", validation adds {result['added_seconds']}s ({result['added_share_of_convert']:.1%} of convert)",
+              file=sys.stderr)
+    return results
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description='Benchmark of the validation of retrieved assets')
+    parser.add_argument('--files', type=int, nargs='+', default=[1000, 10000],
+                        help='Numbers of files of the generated documents, one measurement per number')
+    parser.add_argument('--snippets-per-file', type=float, default=0.1, help='Number of snippets per file')
+    parser.add_argument('--annotations', type=int, default=100, help='Number of annotations')
+    parser.add_argument('--reviews', type=int, default=10, help='Number of reviews')
+    parser.add_argument('-L', '--license-table', action='store_true',
+                        help='Give the payloads a licenses table, see spdx_to_dbom.py --license-table')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs of each measurement, the median is reported')
+    parser.add_argument('-o', '--output', type=str, help='Write the results to this file instead of stdout')
+    args = parser.parse_args()
+
+    report = json.dumps(main(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
@@ -0,0 +1,321 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Benchmark of the conversions and gateway paths on synthetic documents of increasing size
+For every size, a fresh process generates a document (see synthetic.py) and times each stage:
+ - parse: tag-value text to spdx-tools Document
+ - to_payload: Document to asset payload (make_files, rec_make_license...)
+ - fast_read: tag-value text straight to asset payload with dbom_wrapper.tagreader, the payload is checked against
+   the one of parse and to_payload
+ - json_parse / json_to_payload: the same document in SPDX JSON, loaded and mapped straight to the asset payload
+   by dbom_wrapper.spdxjson. The payload is checked against the one of the tag-value path
+ - encode: asset payload to JSON
+ - stream_convert: spdx_to_dbom.py --stream conversion, parse and payload at once
+ - to_document: asset payload back to Document (create_sbom)
+ - write: Document to tag-value text (tvwriter.write_document)
+ - upload / download: the payload sent to and read back from a stub gateway running in its own process
+Peak RSS is reported per size. Batches of small assets are then uploaded and retrieved over the pooled connections.
+Results are printed (or written to --output) as JSON, to be compared between releases
+
+Run it from the spdx-converter directory: python benchmarks/conversion.py --files 100 1000 10000
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed(fn, repeat: int):
+    """
+    Run fn repeat times
+    :return: A tuple of the median duration in seconds and the result of the last run
+    """
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - start)
+    return statistics.median(durations), result
+
+
+def peak_rss_mb() -> float:
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in kilobytes, except on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def stage(seconds: float, items: int, size: int) -> dict:
+    return {
+        'seconds': round(seconds, 4),
+        'items_per_s': round(items / seconds, 1) if seconds else None,
+        'mb_per_s': round(size / seconds / 1024 / 1024, 2) if seconds else None,
+    }
+
+
+def measure_conversion(config: dict) -> dict:
+    """
+    Time the conversion stages of one synthetic document. Runs in its own process
+    :param config: The document shape, the number of repeats and the stub gateway address
+    :return: Dict of the results
+    """
+    import spdx.writers.tagvalue as tvwriter
+    import spdx_to_dbom
+    from dbom_wrapper.convert import create_dbom_asset_payload, create_sbom
+    from dbom_wrapper.jsonstream import iterencode
+    from dbom_wrapper.spdxjson import convert_spdx_json, load_spdx_json
+    from dbom_wrapper.tagreader import read_tag_value
+    from dbom_wrapper.types import json_default
+    from synthetic import generate_document, tag_value_lines
+
+    files = config['files']
+    snippets = config['snippets']
+    items = files + snippets
+    repeat = config['repeat']
+    generated = generate_document(files, snippets, config['annotations'], config['reviews'], config['license_depth'])
+    text = ''.join(tag_value_lines(generated))
+    size = len(text.encode('utf-8'))
+    json_text = json.dumps(generated).encode('utf-8')
+    del generated
+    path = os.path.join(config['tmp'], f"synthetic-{files}.tag")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+    start = time.perf_counter()
+    parser = spdx_to_dbom.get_tag_parser()
+    parser_build = time.perf_counter() - start
+    baseline = peak_rss_mb()
+
+    def parse():
+        parser.lex.lexer.lineno = 1
+        document, error = parser.parse(text)
+        if error:
+            raise ValueError('Errors encountered while parsing the synthetic document')
+        return document
+
+    stages = {}
+    seconds, document = timed(parse, repeat)
+    stages['parse'] = stage(seconds, items, size)
+    seconds, payload = timed(lambda: create_dbom_asset_payload(document, records=True), repeat)
+    stages['to_payload'] = stage(seconds, items, size)
+    seconds, fast = timed(lambda: read_tag_value(text, records=True), repeat)
+    stages['fast_read'] = stage(seconds, items, size)
+    fast_matches = fast is not None and fast[1] == payload
+    fast = None
+    seconds, spdx_json = timed(lambda: load_spdx_json(json_text), repeat)
+    stages['json_parse'] = stage(seconds, items, len(json_text))
+    seconds, json_payload = timed(lambda: convert_spdx_json(spdx_json, records=True), repeat)
+    stages['json_to_payload'] = stage(seconds, items, len(json_text))
+    json_matches = json_payload == payload
+    spdx_json = json_payload = None
+    seconds, encoded = timed(lambda: json.dumps(payload, default=json_default).encode('utf-8'), repeat)
+    stages['encode'] = stage(seconds, items, len(encoded))
+    seconds, _ = timed(lambda: ''.join(iterencode(spdx_to_dbom.stream_file(path)[2])), repeat)
+    stages['stream_convert'] = stage(seconds, items, size)
+    seconds, sbom = timed(lambda: create_sbom(payload), repeat)
+    stages['to_document'] = stage(seconds, items, len(encoded))
+
+    def write():
+        out = io.StringIO()
+        tvwriter.write_document(sbom, out)
+        return out.getvalue()
+
+    seconds, written = timed(write, repeat)
+    stages['write'] = stage(seconds, items, len(written.encode('utf-8')))
+
+    if config.get('gateway'):
+        from dbom_wrapper.api import GatewayAPI
+
+        api = GatewayAPI(config['gateway'])
+        # A new asset ID per run, an asset that already exists would not be sent again
+        runs = iter(range(repeat))
+        asset_id = f"synthetic-{files}-0"
+        with contextlib.redirect_stdout(io.StringIO()):
+            seconds, _ = timed(lambda: api.create_asset('bench', 'bench', f"synthetic-{files}-{next(runs)}", payload),
+                               repeat)
+        stages['upload'] = stage(seconds, items, len(encoded))
+        seconds, _ = timed(lambda: json.loads(b''.join(
+            api.retreive_asset_stream('bench', 'bench', asset_id, verbose=False))), repeat)
+        stages['download'] = stage(seconds, items, len(encoded))
+        api.close()
+
+    return {
+        'files': files,
+        'snippets': snippets,
+        'document_bytes': size,
+        'json_document_bytes': len(json_text),
+        'json_payload_matches': json_matches,
+        'fast_payload_matches': fast_matches,
+        'payload_bytes': len(encoded),
+        'parser_build_seconds': round(parser_build, 4),
+        'stages': stages,
+        'rss_baseline_mb': baseline,
+        'rss_peak_mb': peak_rss_mb(),
+    }
+
+
+def measure_batch(config: dict) -> dict:
+    """
+    Time the upload and retrieval of a batch of small assets over the pooled connections. Runs in its own process
+    :param config: The batch size, the pool size and the stub gateway address
+    :return: Dict of the results
+    """
+    from dbom_wrapper.api import GatewayAPI
+    from dbom_wrapper.convert import convert_spdx_to_payload
+    from synthetic import generate_sbom
+
+    payload = convert_spdx_to_payload(''.join(generate_sbom(files=10, snippets=1)))
+    asset_ids = [f"batch-{index}" for index in range(config['batch'])]
+    api = GatewayAPI(config['gateway'], pool_size=config['pool_size'])
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        uploaded = api.create_assets('bench', 'bench', ((asset_id, payload) for asset_id in asset_ids))
+        upload = time.perf_counter() - start
+        start = time.perf_counter()
+        retrieved = list(api.retreive_assets('bench', 'bench', asset_ids))
+        download = time.perf_counter() - start
+    api.close()
+    return {
+        'assets': len(asset_ids),
+        'pool_size': config['pool_size'],
+        'upload': {'seconds': round(upload, 4), 'assets_per_s': round(len(asset_ids) / upload, 1),
+                   'failed': sum(1 for result in uploaded if not result.success)},
+        'download': {'seconds': round(download, 4), 'assets_per_s': round(len(asset_ids) / download, 1),
+                     'failed': sum(1 for result in retrieved if not result.success)},
+    }
+
+
+def in_child(kind: str, config: dict) -> dict:
+    """
+    Run a measurement in a new interpreter, so that every measurement starts from the same memory state
+    """
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', kind, json.dumps(config)],
+                            cwd=ROOT, check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+@contextlib.contextmanager
+def stub_gateway(latency: float):
+    """
+    Start a stub gateway in its own process, so that it does not compete with the client for the GIL
+    :return: The address of the gateway
+    """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    process = subprocess.Popen([sys.executable, '-m', 'dbom_wrapper.stub', '--port', str(port),
+                                '--latency', str(latency)], cwd=ROOT, stdout=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 10
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.05)
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def metadata() -> dict:
+    try:
+        from importlib import metadata as importlib_metadata
+        spdx_tools = importlib_metadata.version('spdx-tools')
+    except Exception:
+        spdx_tools = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, universal_newlines=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'spdx_tools': spdx_tools,
+    }
+
+
+def main(args):
+    import tempfile
+
+    results = {'metadata': metadata(), 'config': vars(args), 'conversion': []}
+    with tempfile.TemporaryDirectory() as tmp, contextlib.ExitStack() as stack:
+        gateway = None if args.no_gateway else stack.enter_context(stub_gateway(args.latency))
+        for files in args.files:
+            config = {
+                'files': files, 'snippets': int(files * args.snippets_per_file), 'annotations': args.annotations,
+                'reviews': args.reviews, 'license_depth': args.license_depth, 'repeat': args.repeat,
+                'gateway': gateway, 'tmp': tmp,
+            }
+            result = in_child('conversion', config)
+            results['conversion'].append(result)
+            print(f"{files} files: " + ', '.join(f"{name} {s['seconds']}s" for name, s in result['stages'].items()) +
+                  f", peak RSS {result['rss_peak_mb']}MB", file=sys.stderr)
+        if gateway is not None and args.batch:
+            results['batch'] = in_child('batch', {'batch': args.batch, 'pool_size': args.pool_size,
+                                                  'gateway': gateway})
+    return results
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, ROOT)
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        measure = measure_conversion if sys.argv[2] == 'conversion' else measure_batch
+        print(json.dumps(measure(json.loads(sys.argv[3]))))
+        raise SystemExit(0)
+
+    parser = argparse.ArgumentParser(description='Benchmark of the conversions and gateway paths')
+    parser.add_argument('--files', type=int, nargs='+', default=[100, 1000, 10000],
+                        help='Numbers of files of the generated documents, one measurement per number')
+    parser.add_argument('--snippets-per-file', type=float, default=0.1, help='Number of snippets per file')
+    parser.add_argument('--annotations', type=int, default=10, help='Number of annotations')
+    parser.add_argument('--reviews', type=int, default=2, help='Number of reviews')
+    parser.add_argument('--license-depth', type=int, default=2,
+                        help='Number of nested AND/OR operators in the license expressions')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each stage, the median is reported')
+    parser.add_argument('--no-gateway', action='store_true', help='Skip the gateway paths')
+    parser.add_argument('--latency', type=float, default=0.0, help='Latency of the stub gateway, in seconds')
+    parser.add_argument('--batch', type=int, default=200, help='Number of small assets of the batch measurement')
+    parser.add_argument('-p', '--pool-size', type=int, default=10, help='Pooled connections of the batch measurement')
+    parser.add_argument('-o', '--output', type=str, help='Write the results to this file instead of stdout')
+    args = parser.parse_args()
+
+    report = json.dumps(main(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
@@ -0,0 +1,107 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Benchmark of the time taken to build the tag-value parser in a new process
+Each mode is measured in fresh interpreters, as a container launch would:
+ - cold: build_parser with an empty table cache
+ - cached: build_parser with the tables cached by a previous process
+ - in-memory: tables generated without any cache, as when the cache directory cannot be written
+
+Run it from the spdx-converter directory: python benchmarks/parser_startup.py --runs 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SNIPPET = '''
+import time
+start = time.perf_counter()
+from dbom_wrapper.tagvalue import build_parser
+imported = time.perf_counter()
+build_parser({cache_dir!r})
+built = time.perf_counter()
+print((imported - start) * 1000, (built - imported) * 1000)
+'''
+
+
+def measure(cache_dir: str):
+    """
+    Build the parser in a new interpreter
+    :param cache_dir: The table cache directory to use
+    :return: A tuple of the import time and the build time, in milliseconds
+    """
+    output = subprocess.run([sys.executable, '-c', SNIPPET.format(cache_dir=cache_dir)], cwd=ROOT, check=True,
+                            stdout=subprocess.PIPE, universal_newlines=True).stdout
+    imported, built = output.split()
+    return float(imported), float(built)
+
+
+def summarize(samples):
+    return {
+        'median_ms': round(statistics.median(samples), 2),
+        'min_ms': round(min(samples), 2),
+        'max_ms': round(max(samples), 2),
+    }
+
+
+def run(runs: int):
+    """
+    Measure every mode
+    :param runs: Number of processes per mode
+    :return: Dict of the results, per mode
+    """
+    results = {}
+    imports = []
+    with tempfile.TemporaryDirectory() as tmp:
+        cold = []
+        for run_index in range(runs):
+            imported, built = measure(os.path.join(tmp, f"cold-{run_index}"))
+            imports.append(imported)
+            cold.append(built)
+        results['cold'] = summarize(cold)
+
+        warm = os.path.join(tmp, 'cached')
+        measure(warm)
+        results['cached'] = summarize([measure(warm)[1] for _ in range(runs)])
+
+        # A regular file cannot hold the cache, which forces tables generated in memory
+        blocked = os.path.join(tmp, 'blocked')
+        open(blocked, 'w').close()
+        results['in-memory'] = summarize([measure(os.path.join(blocked, 'cache'))[1] for _ in range(runs)])
+    results['import'] = summarize(imports)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark of the tag-value parser build time in a new process')
+    parser.add_argument('--runs', type=int, default=5, help='Number of processes per mode')
+    parser.add_argument('--budget-ms', type=float,
+                        help='Fail if the median build time with cached tables exceeds this many milliseconds')
+    args = parser.parse_args()
+
+    results = run(args.runs)
+    print(json.dumps(results, indent=2))
+    if args.budget_ms is not None and results['cached']['median_ms'] > args.budget_ms:
+        raise SystemExit(f"Cached parser build takes {results['cached']['median_ms']}ms, "
+                         f"over the budget of {args.budget_ms}ms")
@@ -0,0 +1,134 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Benchmark of the memory taken by asset payloads
+The payload of a synthetic document (see synthetic.py) is made by convert_spdx_to_payload with records=True, then
+turned into the plain dicts it returns by default by dbom_wrapper.types.plain. For both, the memory the payload
+holds is measured with tracemalloc, along with the size of its pickle (what batch workers send back) and the time
+to pickle it and to encode it to JSON, with json.dumps and into the chunks uploads are made of. The strings of the
+document are shared by both, only the containers differ
+
+Run it from the spdx-converter directory: python benchmarks/payload_memory.py --files 10000 50000
+"""
+
+import argparse
+import gc
+import json
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def held(make):
+    """
+    :return: A tuple of what make returns and the bytes it still holds once made
+    """
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    value = make()
+    gc.collect()
+    return value, tracemalloc.get_traced_memory()[0] - before
+
+
+def timed(fn, repeat: int) -> float:
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def describe(payload, size: int, repeat: int) -> dict:
+    from dbom_wrapper.jsonstream import iter_bytes
+    from dbom_wrapper.types import json_default
+
+    pickled = pickle.dumps(payload, pickle.HIGHEST_PROTOCOL)
+    return {
+        'held_mb': round(size / 1024 / 1024, 2),
+        'pickle_mb': round(len(pickled) / 1024 / 1024, 2),
+        'pickle_seconds': round(timed(lambda: pickle.dumps(payload, pickle.HIGHEST_PROTOCOL), repeat), 4),
+        'unpickle_seconds': round(timed(lambda: pickle.loads(pickled), repeat), 4),
+        'dumps_seconds': round(timed(lambda: json.dumps(payload, default=json_default), repeat), 4),
+        'upload_encode_seconds': round(timed(lambda: sum(map(len, iter_bytes(payload))), repeat), 4),
+    }
+
+
+def measure(files: int, args) -> dict:
+    from dbom_wrapper.convert import convert_spdx_to_payload
+    from dbom_wrapper.types import plain
+    from synthetic import generate_sbom
+
+    text = ''.join(generate_sbom(files, int(files * args.snippets_per_file), args.annotations, args.reviews))
+
+    def convert():
+        return convert_spdx_to_payload(text, shared_licenses=args.license_table, records=True)
+
+    tracemalloc.start()
+    try:
+        payload, records_size = held(convert)
+        dicts, copy_size = held(lambda: plain(payload))
+        # The dicts refer to the strings of the records, only the containers of the records go with them
+        payload, containers_size = None, tracemalloc.get_traced_memory()[0]
+        gc.collect()
+        containers_size -= tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    records = describe(convert(), records_size, args.repeat)
+    return {
+        'files': files,
+        'records': records,
+        'dicts': describe(dicts, records_size - containers_size + copy_size, args.repeat),
+    }
+
+
+def main(args):
+    results = []
+    for files in args.files:
+        result = measure(files, args)
+        results.append(result)
+        print(f"{files} files: records {result['records']['held_mb']}MB, dicts {result['dicts']['held_mb']}MB, "
+              f"pickles {result['records']['pickle_mb']}MB and {result['dicts']['pickle_mb']}MB", file=sys.stderr)
+    return results
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description='Benchmark of the memory taken by asset payloads')
+    parser.add_argument('--files', type=int, nargs='+', default=[10000, 50000],
+                        help='Numbers of files of the generated documents, one measurement per number')
+    parser.add_argument('--snippets-per-file', type=float, default=0.1, help='Number of snippets per file')
+    parser.add_argument('--annotations', type=int, default=10, help='Number of annotations')
+    parser.add_argument('--reviews', type=int, default=2, help='Number of reviews')
+    parser.add_argument('-L', '--license-table', action='store_true',
+                        help='Give the payloads a licenses table, see spdx_to_dbom.py --license-table')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each timing, the best is reported')
+    parser.add_argument('-o', '--output', type=str, help='Write the results to this file instead of stdout')
+    args = parser.parse_args()
+
+    report = json.dumps(main(args), indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
@@ -0,0 +1,122 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Startup-time budget of the converter CLIs
+Each scenario runs in fresh interpreters with -X importtime, the time spent importing modules is summed from its
+report. The benchmark fails when the median import time of a scenario is over the budget, or when a scenario
+loads one of HEAVY_MODULES, which the CLIs only import on the code paths that need them
+
+Run it from the spdx-converter directory: python benchmarks/startup_time.py --runs 10
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that take tens to hundreds of milliseconds to import
+HEAVY_MODULES = ('spdx', 'ply', 'rdflib', 'pkg_resources', 'requests', 'aiohttp', 'dateutil', 'multiprocessing')
+
+SCENARIOS = {
+    'spdx_to_dbom --help': ['spdx_to_dbom.py', '--help'],
+    'dbom_to_spdx --help': ['dbom_to_spdx.py', '--help'],
+    'import spdx_to_dbom': ['-c', 'import spdx_to_dbom'],
+    'import dbom_to_spdx': ['-c', 'import dbom_to_spdx'],
+}
+
+DEFAULT_BUDGET_MS = 150
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def measure(command: [str]):
+    """
+    Run a command in a new interpreter with -X importtime
+    :param command: The interpreter arguments
+    :return: A tuple of the process wall time in milliseconds and of the dict of the cumulative import time,
+        in milliseconds, of every top-level import
+    """
+    start = time.perf_counter()
+    stderr = subprocess.run([sys.executable, '-X', 'importtime'] + command, cwd=ROOT, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, universal_newlines=True).stderr
+    wall = (time.perf_counter() - start) * 1000
+    imports = {}
+    loaded = set()
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match is None:
+            continue
+        _, cumulative, indent, name = match.groups()
+        loaded.add(name.split('.')[0])
+        if len(indent) == 1:
+            imports[name] = int(cumulative) / 1000
+    return wall, imports, loaded
+
+
+def run(runs: int):
+    """
+    Measure every scenario
+    :param runs: Number of processes per scenario
+    :return: Dict of the results, per scenario
+    """
+    results = {}
+    for name, command in SCENARIOS.items():
+        walls = []
+        totals = []
+        slowest = {}
+        heavy = set()
+        for _ in range(runs):
+            wall, imports, loaded = measure(command)
+            walls.append(wall)
+            totals.append(sum(imports.values()))
+            for module, elapsed in imports.items():
+                slowest[module] = max(slowest.get(module, 0), elapsed)
+            heavy.update(module for module in HEAVY_MODULES if module in loaded)
+        results[name] = {
+            'import_ms': round(statistics.median(totals), 2),
+            'wall_ms': round(statistics.median(walls), 2),
+            'slowest_imports_ms': {module: round(elapsed, 2) for module, elapsed in
+                                   sorted(slowest.items(), key=lambda item: -item[1])[:5]},
+            'heavy_modules': sorted(heavy),
+        }
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Startup-time budget of the converter CLIs')
+    parser.add_argument('--runs', type=int, default=5, help='Number of processes per scenario')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help=f"Median import time allowed per scenario, in milliseconds (default: {DEFAULT_BUDGET_MS})")
+    args = parser.parse_args()
+
+    results = run(args.runs)
+    print(json.dumps(results, indent=2))
+    failures = []
+    for name, result in results.items():
+        if result['import_ms'] > args.budget_ms:
+            failures.append(f"{name} spends {result['import_ms']}ms importing modules, over the budget of "
+                            f"{args.budget_ms}ms")
+        if result['heavy_modules']:
+            failures.append(f"{name} imports {', '.join(result['heavy_modules'])}")
+    if failures:
+        raise SystemExit('\n'.join(failures))
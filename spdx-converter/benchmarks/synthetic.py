@@ -0,0 +1,258 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Generator of synthetic SPDX tag-value documents, shaped like sbom.tag, for benchmarks
+The documents are deterministic for a given seed and valid for the spdx-tools parser and for both converters
+
+Write one with: python benchmarks/synthetic.py --files 10000 --snippets 1000 -o big.tag
+"""
+
+import argparse
+import hashlib
+import random
+from typing import Iterator
+
+LICENSES = ('Apache-1.0', 'Apache-2.0', 'MPL-1.1', 'MIT', 'BSD-3-Clause', 'GPL-2.0-only', 'LGPL-2.1-only', 'ISC')
+FILE_TYPES = ('SOURCE', 'BINARY', 'ARCHIVE', 'OTHER')
+
+
+def license_expression(rng: random.Random, depth: int) -> str:
+    """
+    Build a license expression nesting depth conjunctions and disjunctions
+    :param rng: Random generator
+    :param depth: Number of nested AND/OR operators, 0 for a single license
+    :return: E.g. (MIT AND (Apache-2.0 OR ISC)) for depth 2
+    """
+    if depth <= 0:
+        return rng.choice(LICENSES)
+    operator = rng.choice(('AND', 'OR'))
+    return f"({rng.choice(LICENSES)} {operator} {license_expression(rng, depth - 1)})"
+
+
+def checksum(*parts) -> str:
+    return hashlib.sha1('/'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def generate_document(files: int = 100, snippets: int = 10, annotations: int = 5, reviews: int = 2,
+                      license_depth: int = 2, packages: int = 1, seed: int = 0) -> dict:
+    """
+    Generate an SPDX document in the SPDX JSON layout
+    :param files: Number of files per package
+    :param snippets: Number of snippets per package
+    :param annotations: Number of annotations of the document
+    :param reviews: Number of reviews of the document
+    :param license_depth: Nesting of the license expressions of the packages and files, see license_expression
+    :param packages: Number of packages. Packages after the first one are CONTAINED_BY the first one
+    :param seed: Seed of the random choices
+    :return: The document, as a dict to dump as JSON or to write as tag-value with tag_value_lines
+    """
+    rng = random.Random(seed)
+    document = {
+        'spdxVersion': 'SPDX-2.1',
+        'dataLicense': 'CC0-1.0',
+        'name': f"Synthetic-{files}-files",
+        'SPDXID': 'SPDXRef-DOCUMENT',
+        'documentNamespace': f"https://spdx.org/spdxdocs/synthetic-{seed}-{files}-{snippets}",
+        'comment': 'Synthetic document generated for benchmarks',
+        'creationInfo': {
+            'creators': ['Person: Bench Creator', 'Organization: Bench Inc', 'Tool: Synthetic Generator'],
+            'created': '2020-02-03T00:00:00Z',
+        },
+        'reviewers': [{'reviewer': f"Person: Reviewer {index}", 'reviewDate': f"2020-03-{index % 28 + 1:02d}T00:00:00Z",
+                       'comment': f"Review number {index}"} for index in range(reviews)],
+        'annotations': [{'annotator': f"Person: Annotator {index}", 'annotationType': 'REVIEW',
+                         'annotationDate': f"2020-04-{index % 28 + 1:02d}T00:00:00Z",
+                         'comment': f"Annotation number {index}"} for index in range(annotations)],
+        'packages': [],
+        'files': [],
+        'snippets': [],
+        'relationships': [{'spdxElementId': f"SPDXRef-Package-{package}", 'relationshipType': 'CONTAINED_BY',
+                           'relatedSpdxElement': 'SPDXRef-Package-0'} for package in range(1, packages)],
+    }
+    for package in range(packages):
+        _package(document, rng, package, files, snippets, license_depth)
+    return document
+
+
+def _package(document, rng, package, files, snippets, license_depth):
+    document['packages'].append({
+        'name': f"Synthetic Package {package}",
+        'SPDXID': f"SPDXRef-Package-{package}",
+        'versionInfo': f"Version {package}.0.{files}",
+        'downloadLocation': f"http://example.com/package-{package}",
+        'summary': f"Synthetic package {package}",
+        'sourceInfo': f"Version {package} of the synthetic package",
+        'packageFileName': f"package-{package}.tar.gz",
+        'supplier': 'Organization: Bench Supplier',
+        'originator': 'Organization: Bench Team',
+        'checksums': [{'algorithm': 'SHA1', 'checksumValue': checksum('package', package)}],
+        'packageVerificationCode': {'packageVerificationCodeValue': checksum('verification', package)},
+        'description': f"Synthetic package {package} with {files} files",
+        'comment': 'Generated for benchmarks.',
+        'copyrightText': 'Copyright 2020 Bench Inc',
+        'licenseDeclared': license_expression(rng, license_depth),
+        'licenseConcluded': license_expression(rng, license_depth),
+        'licenseInfoFromFiles': list(LICENSES[:3]),
+        'licenseComments': 'Synthetic license information',
+        'externalRefs': [{'referenceCategory': 'SECURITY', 'referenceType': 'cpe23Type',
+                          'referenceLocator': f"cpe:2.3:a:bench:synthetic:{package}.0:*:*:*:*:*:*:",
+                          'comment': 'Synthetic reference'}],
+        'hasFiles': [f"SPDXRef-File-{package}-{index}" for index in range(files)],
+    })
+    for index in range(files):
+        file = {
+            'fileName': f"src/package{package}/dir{index // 100}/file{index}.c",
+            'SPDXID': f"SPDXRef-File-{package}-{index}",
+            'fileTypes': [FILE_TYPES[index % len(FILE_TYPES)]],
+            'checksums': [{'algorithm': 'SHA1', 'checksumValue': checksum('file', package, index)}],
+            'licenseConcluded': license_expression(rng, license_depth),
+            'licenseInfoInFiles': [rng.choice(LICENSES)],
+            'copyrightText': f"Copyright 2020 Author {index}",
+        }
+        if index % 3 == 0:
+            file['comment'] = f"Comment of file {index}"
+        document['files'].append(file)
+    for index in range(snippets):
+        document['snippets'].append({
+            'SPDXID': f"SPDXRef-Snippet-{package}-{index}",
+            'snippetFromFile': f"SPDXRef-File-{package}-{index % max(files, 1)}",
+            'copyrightText': f"Copyright 2020 Snippet Author {index}",
+            'comment': f"Snippet number {index}",
+            'name': f"snippet {index}",
+            'licenseConcluded': rng.choice(LICENSES),
+            'licenseInfoInSnippets': [rng.choice(LICENSES)],
+        })
+
+
+def tag_value_lines(document: dict) -> Iterator[str]:
+    """
+    Write a document made by generate_document in the tag-value format
+    Each package is followed by its files and snippets, the annotations all refer to the document
+    :param document: The document
+    :return: Generator of the lines of the document
+    """
+    yield f"SPDXVersion: {document['spdxVersion']}\n"
+    yield f"DataLicense: {document['dataLicense']}\n"
+    yield f"DocumentName: {document['name']}\n"
+    yield f"SPDXID: {document['SPDXID']}\n"
+    yield f"DocumentNamespace: {document['documentNamespace']}\n"
+    yield f"DocumentComment: <text>{document['comment']}</text>\n\n"
+
+    yield '## Creation Information\n'
+    for creator in document['creationInfo']['creators']:
+        yield f"Creator: {creator}\n"
+    yield f"Created: {document['creationInfo']['created']}\n\n"
+
+    yield '## Review Information\n'
+    for review in document['reviewers']:
+        yield f"Reviewer: {review['reviewer']}\n"
+        yield f"ReviewDate: {review['reviewDate']}\n"
+        yield f"ReviewComment: <text>{review['comment']}</text>\n\n"
+
+    yield '## Annotation Information\n'
+    for annotation in document['annotations']:
+        yield f"Annotator: {annotation['annotator']}\n"
+        yield f"AnnotationType: {annotation['annotationType']}\n"
+        yield f"AnnotationDate: {annotation['annotationDate']}\n"
+        yield f"AnnotationComment: <text>{annotation['comment']}</text>\n"
+        yield f"SPDXREF: {document['SPDXID']}\n\n"
+
+    files = {file['SPDXID']: file for file in document['files']}
+    for package in document['packages']:
+        owned = set(package['hasFiles'])
+        yield '## Package Information\n'
+        yield f"PackageName: {package['name']}\n"
+        yield f"SPDXID: {package['SPDXID']}\n"
+        yield f"PackageVersion: {package['versionInfo']}\n"
+        yield f"PackageDownloadLocation: {package['downloadLocation']}\n"
+        yield f"PackageSummary: <text>{package['summary']}</text>\n"
+        yield f"PackageSourceInfo: <text>{package['sourceInfo']}</text>\n"
+        yield f"PackageFileName: {package['packageFileName']}\n"
+        yield f"PackageSupplier: {package['supplier']}\n"
+        yield f"PackageOriginator: {package['originator']}\n"
+        yield f"PackageChecksum: SHA1: {package['checksums'][0]['checksumValue']}\n"
+        yield f"PackageVerificationCode: {package['packageVerificationCode']['packageVerificationCodeValue']}\n"
+        yield f"PackageDescription: <text>{package['description']}</text>\n"
+        yield f"PackageComment: <text>{package['comment']}</text>\n"
+        yield f"PackageCopyrightText: <text>{package['copyrightText']}</text>\n"
+        yield f"PackageLicenseDeclared: {package['licenseDeclared']}\n"
+        yield f"PackageLicenseConcluded: {package['licenseConcluded']}\n"
+        for license_id in package['licenseInfoFromFiles']:
+            yield f"PackageLicenseInfoFromFiles: {license_id}\n"
+        yield f"PackageLicenseComments: <text>{package['licenseComments']}</text>\n"
+        for ref in package['externalRefs']:
+            yield f"ExternalRef: {ref['referenceCategory']} {ref['referenceType']} {ref['referenceLocator']}\n"
+            yield f"ExternalRefComment: <text>{ref['comment']}</text>\n\n"
+
+        yield '## File Information\n'
+        for file_id in package['hasFiles']:
+            file = files[file_id]
+            yield f"FileName: {file['fileName']}\n"
+            yield f"SPDXID: {file['SPDXID']}\n"
+            yield f"FileType: {file['fileTypes'][0]}\n"
+            yield f"FileChecksum: SHA1: {file['checksums'][0]['checksumValue']}\n"
+            yield f"LicenseConcluded: {file['licenseConcluded']}\n"
+            for license_id in file['licenseInfoInFiles']:
+                yield f"LicenseInfoInFile: {license_id}\n"
+            yield f"FileCopyrightText: <text>{file['copyrightText']}</text>\n"
+            if 'comment' in file:
+                yield f"FileComment: <text>{file['comment']}</text>\n"
+            yield '\n'
+
+        yield '## Snippet Information\n'
+        for snippet in document['snippets']:
+            if snippet['snippetFromFile'] not in owned:
+                continue
+            yield f"SnippetSPDXID: {snippet['SPDXID']}\n"
+            yield f"SnippetFromFileSPDXID: {snippet['snippetFromFile']}\n"
+            yield f"SnippetCopyrightText: <text>{snippet['copyrightText']}</text>\n"
+            yield f"SnippetComment: <text>{snippet['comment']}</text>\n"
+            yield f"SnippetName: {snippet['name']}\n"
+            yield f"SnippetLicenseConcluded: {snippet['licenseConcluded']}\n"
+            for license_id in snippet['licenseInfoInSnippets']:
+                yield f"LicenseInfoInSnippet: {license_id}\n"
+            yield '\n'
+
+    for relationship in document['relationships']:
+        yield (f"Relationship: {relationship['spdxElementId']} {relationship['relationshipType']} "
+               f"{relationship['relatedSpdxElement']}\n")
+
+
+def generate_sbom(files: int = 100, snippets: int = 10, annotations: int = 5, reviews: int = 2,
+                  license_depth: int = 2, packages: int = 1, seed: int = 0) -> Iterator[str]:
+    """
+    Generate an SPDX tag-value document, see generate_document for the parameters
+    :return: Generator of the lines of the document
+    """
+    return tag_value_lines(generate_document(files, snippets, annotations, reviews, license_depth, packages, seed))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate a synthetic SPDX tag-value document')
+    parser.add_argument('--files', type=int, default=100, help='Number of files per package')
+    parser.add_argument('--snippets', type=int, default=10, help='Number of snippets per package')
+    parser.add_argument('--annotations', type=int, default=5, help='Number of annotations')
+    parser.add_argument('--reviews', type=int, default=2, help='Number of reviews')
+    parser.add_argument('--license-depth', type=int, default=2,
+                        help='Number of nested AND/OR operators in the license expressions')
+    parser.add_argument('--packages', type=int, default=1, help='Number of packages')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random choices')
+    parser.add_argument('-o', '--output', type=str, required=True, help='The SPDX KV Tag to create')
+    args = parser.parse_args()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.writelines(generate_sbom(args.files, args.snippets, args.annotations, args.reviews, args.license_depth,
+                                   args.packages, args.seed))
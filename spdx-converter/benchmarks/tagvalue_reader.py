@@ -0,0 +1,246 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Differential check of the fast tag-value reader (dbom_wrapper.tagreader) against the spdx-tools parser
+Every document is converted both ways:
+ - the payload of the fast reader must equal the payload made from the spdx-tools document
+ - when spdx-tools reports errors, or the payload cannot be made from its document, the fast reader must give up
+ - the fast reader may also give up on a valid document, it is then parsed by spdx-tools
+The documents are sbom.tag, synthetic documents (see synthetic.py), the files given on the command line and
+random mutations of them: lines removed, repeated, swapped, values replaced by keywords, lines added.
+Documents the fast reader reads are also read in shards of blocks, as spdx_to_dbom.py does with large files,
+and must give the same payload or be read as a whole.
+Both conversions are then timed on a large synthetic document. The exit status is 1 if a payload differs
+
+Run it from the spdx-converter directory: python benchmarks/tagvalue_reader.py --mutations 2000
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from typing import Tuple
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# Lines added by the mutations, beside the lines of the document itself
+EXTRA_LINES = (
+    'ExternalRef: SECURITY cpe23Type cpe:2.3:a:example:sample:1.0:*:*:*:*:*:*:*',
+    'ExternalRef: PACKAGE-MANAGER purl pkg:pypi/sample@1.0',
+    'ExternalRef: OTHER bad type locator',
+    'ExternalRefComment: <text>Reference comment</text>',
+    'PackageHomePage: https://example.com/sample',
+    'PackageHomePage: NONE',
+    'PackageVersion: 1.0',
+    'PackageSupplier: NOASSERTION',
+    'PackageOriginator: Organization: Example (contact@example.com)',
+    'PackageLicenseConcluded: (MIT AND Apache-2.0)',
+    'PackageLicenseDeclared: MIT WITH Classpath-exception-2.0',
+    'PackageLicenseDeclared: NOASSERTION',
+    'FileName: ./extra/file.c',
+    'FileType: OTHER',
+    'FileType: TEXT',
+    'FileChecksum: SHA1: 0123456789abcdef0123456789abcdef01234567',
+    'FileNotice: <text>Notice</text>',
+    'FileContributor: Jane Doe',
+    'FileDependency: ./other/file.c',
+    'LicenseConcluded: (MIT  AND ISC)',
+    'LicenseConcluded: LicenseRef-1',
+    'LicenseInfoInFile: MIT AND ISC',
+    'LicenseInfoInFile: NONE',
+    'ArtifactOfProjectName: Sample',
+    'ArtifactOfProjectHomePage: https://example.com/project',
+    'ArtifactOfProjectURI: UNKNOWN',
+    'LicenseID: LicenseRef-1',
+    'ExtractedText: <text>License text</text>',
+    'LicenseName: Sample License',
+    'LicenseCrossReference: https://example.com/license',
+    'LicenseComment: <text>License comment</text>',
+    'SnippetSPDXID: SPDXRef-Snippet-extra',
+    'SnippetFromFileSPDXID: SPDXRef-File-extra',
+    'SnippetLicenseConcluded: MIT OR ISC',
+    'LicenseInfoInSnippet: MIT',
+    'SnippetCopyrightText: <text>Copyright</text>',
+    'Reviewer: Tool: Reviewer',
+    'ReviewDate: 2020-02-30T00:00:00Z',
+    'Annotator: Tool: Annotator',
+    'AnnotationDate: 2020-05-01T00:00:00Z',
+    'AnnotationType: OTHER',
+    'SPDXREF: SPDXRef-DOCUMENT',
+    'SPDXID: SPDXRef-extra',
+    'Relationship: SPDXRef-DOCUMENT DESCRIBES SPDXRef-Package',
+    'FilesAnalyzed: true',
+    'CreatorComment: <text>Comment</text>',
+    'LicenseListVersion: 3.9',
+    '# A comment',
+    '',
+    'PackageComment: <text>unterminated',
+    'FileComment: <text></text>',
+    'FileComment: <text>a</text> trailing',
+    'DocumentComment:',
+    'Nonsense line',
+)
+KEYWORD_VALUES = ('NONE', 'NOASSERTION', 'UNKNOWN', 'OTHER', 'PackageName', '<text>x</text>', 'Tool: x',
+                  'Person: x', 'SHA1: 0123456789abcdef0123456789abcdef01234567', 'DocumentRef-x',
+                  '2020-01-01T00:00:00Z')
+
+
+def full_payload(text: str):
+    """
+    :return: The payload made from the document parsed by spdx-tools, None if it cannot be made
+    """
+    from dbom_wrapper.convert import create_dbom_asset_payload, parse_spdx
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return create_dbom_asset_payload(parse_spdx(text))
+    except Exception:
+        return None
+
+
+def compare(name: str, text: str, failures: list) -> Tuple[bool, bool]:
+    """
+    Convert a document both ways and record a failure if the fast reader disagrees with spdx-tools
+    :return: A tuple of whether the fast reader and spdx-tools converted the document
+    """
+    from dbom_wrapper.tagreader import read_tag_value
+
+    expected = full_payload(text)
+    try:
+        fast = read_tag_value(text)
+    except Exception as e:
+        failures.append((name, f"fast reader raised {e!r}", text))
+        return False, expected is not None
+    if fast is None:
+        return False, expected is not None
+    compare_shards(name, text, fast, failures)
+    if expected is None:
+        failures.append((name, 'fast reader read a document spdx-tools rejects', text))
+    elif fast[1] != expected:
+        failures.append((name, 'payloads differ', text))
+    return True, expected is not None
+
+
+def compare_shards(name: str, text: str, fast, failures: list):
+    """
+    Read a document in shards of blocks and record a failure if they disagree with the whole document
+    """
+    from dbom_wrapper.tagreader import read_blocks, read_tag_value
+    from dbom_wrapper.tagvalue import index_blocks, shard_blocks
+
+    data = text.encode('utf-8')
+    shards = shard_blocks(index_blocks(data), len(data), 3)
+    if not shards:
+        return
+    blocks = [read_blocks(data[start:end].decode('utf-8')) for start, end in shards]
+    try:
+        sharded = read_tag_value(data[:shards[0][0]].decode('utf-8'), blocks=blocks)
+    except Exception as e:
+        failures.append((name, f"sharded read raised {e!r}", text))
+        return
+    if sharded is not None and sharded != fast:
+        failures.append((name, 'sharded read differs', text))
+
+
+def mutate(rng: random.Random, lines: [str]) -> [str]:
+    lines = list(lines)
+    for _ in range(rng.randint(1, 3)):
+        kind = rng.randrange(5)
+        position = rng.randrange(len(lines))
+        if kind == 0:
+            del lines[position]
+        elif kind == 1:
+            lines.insert(position, lines[position])
+        elif kind == 2:
+            other = rng.randrange(len(lines))
+            lines[position], lines[other] = lines[other], lines[position]
+        elif kind == 3 and ':' in lines[position]:
+            lines[position] = lines[position].split(':', 1)[0] + ': ' + rng.choice(KEYWORD_VALUES)
+        else:
+            lines.insert(position, rng.choice(EXTRA_LINES))
+    return lines
+
+
+def timed(fn, repeat: int) -> float:
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - start)
+    return sorted(durations)[len(durations) // 2]
+
+
+def main(args) -> int:
+    from dbom_wrapper.convert import create_dbom_asset_payload, parse_spdx
+    from dbom_wrapper.tagreader import read_tag_value
+    from synthetic import generate_sbom
+
+    documents = []
+    for path in [os.path.join(os.path.dirname(ROOT), 'sbom.tag')] + args.files:
+        with open(path, encoding='utf-8') as f:
+            documents.append((path, f.read()))
+    for seed in range(args.seeds):
+        for depth in (0, 1, 3):
+            documents.append((f"synthetic seed {seed} depth {depth}",
+                              ''.join(generate_sbom(files=20, snippets=4, annotations=seed, reviews=seed % 3,
+                                                    license_depth=depth, seed=seed))))
+
+    failures = []
+    results = [compare(name, text, failures) for name, text in documents]
+    print(f"{len(documents)} documents: {sum(fast for fast, _ in results)} read by the fast reader, "
+          f"{sum(full for _, full in results)} converted by spdx-tools")
+
+    rng = random.Random(args.seed)
+    results = []
+    for index in range(args.mutations):
+        name, text = rng.choice(documents[:1] + documents[-3:])
+        lines = mutate(rng, text.split('\n'))
+        results.append(compare(f"{name}, mutation {index}", '\n'.join(lines), failures))
+    print(f"{args.mutations} mutated documents: {sum(fast for fast, _ in results)} read by the fast reader, "
+          f"{sum(full for _, full in results)} converted by spdx-tools")
+
+    if args.benchmark_files:
+        text = ''.join(generate_sbom(files=args.benchmark_files, snippets=args.benchmark_files // 10))
+        full = timed(lambda: create_dbom_asset_payload(parse_spdx(text)), args.repeat)
+        fast = timed(lambda: read_tag_value(text), args.repeat)
+        print(f"{args.benchmark_files} files: spdx-tools {full:.3f}s, fast reader {fast:.3f}s, "
+              f"speedup {full / fast:.1f}x")
+
+    for name, problem, text in failures[:args.show]:
+        print(f"\n{name}: {problem}\n{text}", file=sys.stderr)
+    if failures:
+        print(f"{len(failures)} failures", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(ROOT))
+    sys.path.insert(0, ROOT)
+    parser = argparse.ArgumentParser(description='Differential check of the fast tag-value reader')
+    parser.add_argument('files', nargs='*', help='More .tag documents to check')
+    parser.add_argument('--seeds', type=int, default=5, help='Number of seeds of the synthetic documents')
+    parser.add_argument('--mutations', type=int, default=500, help='Number of mutated documents to check')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the mutations')
+    parser.add_argument('--benchmark-files', type=int, default=10000,
+                        help='Number of files of the timed document, 0 to skip the timing')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each conversion, the median is reported')
+    parser.add_argument('--show', type=int, default=3, help='Number of failing documents to print')
+    raise SystemExit(main(parser.parse_args()))
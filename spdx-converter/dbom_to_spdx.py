@@ -19,293 +19,400 @@ limitations under the License.
 """
 Python script to take a read a DBoM asset and write it to a SPDX KV (.tag) file
 This does read any sub-asset dependencies at the moment
+A file name ending in .gz or .zst writes the document gzip or zstd compressed
 
 NOTE: This script needs Python 3.7+ since it uses dataclasses (PEP 557)
 To know which arguments to specify, run this script with the --help argument
+
+The script can be imported: main() runs it with a list of arguments. spdx-tools and the HTTP client are
+slow to import, so they are imported by the code paths that need them rather than here
 """
 
 import argparse
-import json
-
-from spdx.creationinfo import *
-from spdx.annotation import Annotation
-from spdx.creationinfo import CreationInfo
-from spdx.document import Document
-from spdx.document import License
-from spdx.document import LicenseConjunction
-from spdx.file import File
-from spdx.creationinfo import Person
-from spdx.creationinfo import Organization
-from spdx.creationinfo import Tool
-from spdx.package import Package
-from spdx.package import ExternalPackageRef
-from spdx.parsers.loggers import StandardLogger
-from spdx.parsers.tagvalue import Parser
-from spdx.parsers.tagvaluebuilders import Builder
-from spdx.review import Review
-from spdx.creationinfo import Organization
-from spdx.checksum import Algorithm
-import spdx.writers.tagvalue as tvwriter
-import codecs
-from dateutil.parser import parse
-from spdx.snippet import Snippet
-
-from dbom_wrapper.api import GatewayAPI
-from dbom_wrapper.types import GatewayAsset
-
-parser = argparse.ArgumentParser(description='Utility to create SPDX tag-value files from a DBoM ')
-parser.add_argument('-g', '--gateway', type=str,
-                    help='The full address (with schema) at which the gateway can be reached', required=True)
-parser.add_argument('-r', '--repo', type=str,
-                    help='The repository ID on which the channel you want to use exists', required=True)
-parser.add_argument('-c', '--channel', type=str,
-                    help='The channel ID on which you want to retreive the BoM', required=True)
-parser.add_argument('-a', '--asset', type=str,
-                    help='The asset ID on which you want to retreive the BoM', required=True)
-parser.add_argument('-f', '--file', type=str,
-                    help='The SPDX KV Tag that has to be created', required=True)
-parser.add_argument('-i', '--idextra', type=str,
-                    help='String to append to the id. For testing purposes')
-
-args = parser.parse_args()
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from dbom_wrapper.compression import SUFFIXES, atomic_output
+from dbom_wrapper.convert import (ConversionError, LicenseResolver, convert_asset_to_spdx, create_sbom, parse_file,
+                                  parse_snippet)
+from dbom_wrapper.jsonstream import JSONReader, SpooledArray
+from dbom_wrapper.metrics import NO_METRICS, Metrics, measured, profiled
+from dbom_wrapper.retry import RetryPolicy
+from dbom_wrapper.schema import ASSET_HEADER_V1, FILE, SNIPPET, table_ids, validate
+
+
+def build_arg_parser():
+    """
+    Build the command line parser of this script
+    :return: An argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description='Utility to create SPDX tag-value files from a DBoM ')
+    parser.add_argument('-g', '--gateway', type=str,
+                        help='The full address (with schema) at which the gateway can be reached', required=True)
+    parser.add_argument('-r', '--repo', type=str,
+                        help='The repository ID on which the channel you want to use exists', required=True)
+    parser.add_argument('-c', '--channel', type=str,
+                        help='The channel ID on which you want to retreive the BoM', required=True)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('-a', '--asset', type=str,
+                        help='The asset ID on which you want to retreive the BoM')
+    source.add_argument('-A', '--assets', type=str, nargs='+',
+                        help='Several asset IDs to export to --output-dir')
+    source.add_argument('-m', '--manifest', type=str,
+                        help='A file listing one asset ID per line to export to --output-dir')
+    parser.add_argument('-f', '--file', type=str,
+                        help='The SPDX KV Tag that has to be created (with -a), compressed if it ends in .gz or .zst')
+    parser.add_argument('-o', '--output-dir', type=str,
+                        help='The directory in which the SPDX KV Tags are created, one per asset named after its ID '
+                             '(with -A or -m)')
+    parser.add_argument('-z', '--compress', choices=sorted(SUFFIXES),
+                        help='Compress the SPDX KV Tags created in --output-dir, which get a .gz or .zst extension')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='Number of worker processes converting and writing the assets in batch mode '
+                             '(default: CPU count)')
+    parser.add_argument('-p', '--pool-size', type=int, default=10,
+                        help='Number of pooled keep-alive connections (and concurrent retrievals) to the gateway')
+    parser.add_argument('-s', '--stream', action='store_true',
+                        help='Parse the asset while it is downloaded and write the files and snippets one by one, '
+                             'keeping memory use flat for very large assets')
+    parser.add_argument('-i', '--idextra', type=str,
+                        help='String to append to the id. For testing purposes')
+    RetryPolicy.add_arguments(parser)
+    Metrics.add_arguments(parser)
+    return parser
+
+args = None
+metrics = NO_METRICS
+_api = None
+
+
+def get_api():
+    """
+    Return the gateway client shared by all retrievals of this run
+    :return: A GatewayAPI instance
+    """
+    global _api
+    if _api is None:
+        from dbom_wrapper.api import GatewayAPI
+
+        _api = GatewayAPI(address=args.gateway, pool_size=args.pool_size, retry_policy=RetryPolicy.from_args(args),
+                          metrics=metrics)
+    return _api
+
+
+def make_asset_id(asset_id: str):
+    """
+    Append the testing suffix, if any, to an asset ID
+    :param asset_id: A string with assetID
+    :return: The asset ID to use on the gateway
+    """
+    return f"{asset_id}-{args.idextra}" if args.idextra else asset_id
 
 
 def retrieve_asset(asset_id: str):
     """
-    Send the asset payload with the provided asset_id to the gateway
+    Retrieve the asset with the provided asset_id from the gateway
     :param asset_id: A string with assetID
-    :param payload: A dict representing the payload
-    :return: None
+    :return: The asset, as a dict
     """
-    api = GatewayAPI(address=args.gateway)
-    if args.idextra:
-        asset_id = f"{asset_id}-{args.idextra}"
+    api = get_api()
+    asset_id = make_asset_id(asset_id)
     print(f"Retrieve asset {args.asset} on channel {args.channel} on repo {args.repo}")
     return  api.retreive_asset(args.repo, args.channel, asset_id)
 
-def parse_creator_string(creator):
-    """
-    Creates a string from the creator information in the SPDX document
-    :param creators: Array of creationinfo objects
-    :return: string equivalent
+def stream_asset(asset_id: str):
     """
-    print('Begin Parsing Creator')
-    creators = []
-    creator_list = creator.replace(" ", "").split(',')
-    for c in creator_list:
-        if c[0] != '[':
-            creators.append(c)
-        else:
-            c = c[7:]
-            c = c[:-1]
-            creators.append(c)
-    print('Completed Parsing Creator')
-    return creators
-
-def parse_review_list(reviews: []):
+    Retrieve the asset with the provided asset_id from the gateway without holding it in memory
+    :param asset_id: A string with assetID
+    :return: Generator of the bytes chunks of the asset
     """
-    Make Review List from SPDX review spec
+    api = get_api()
+    asset_id = make_asset_id(asset_id)
+    print(f"Retrieve asset {args.asset} on channel {args.channel} on repo {args.repo}")
+    return api.retreive_asset_stream(args.repo, args.channel, asset_id)
 
-    :param reviews: SPDX review Object
-    :return: List of dicts with metadata of reviews
+FILES_PATH = ('assetMetadata', 'package', 'files')
+SNIPPETS_PATH = ('assetMetadata', 'snippets')
+# Keys create_sbom needs besides the files and snippets, that is everything written before the first file
+# The optional licenses table is written before the package, so it has been read once these keys are
+ASSET_KEYS = ('documentName', 'documentCreator', 'documentCreatedDate', 'assetMetadata')
+METADATA_KEYS = ('reviews', 'extrefs', 'id', 'namespace', 'comment', 'dataLicense', 'annotations', 'package')
+PACKAGE_KEYS = ('name', 'id', 'version', 'downloadLocation', 'summary', 'sourceInfo', 'fileName', 'supplierName',
+                'supplierEmail', 'originatorName', 'originatorEmail', 'checksumAlgorithm', 'checksum',
+                'verificationCode', 'description', 'comment', 'copyright', 'license')
+NO_FILES_MESSAGE = 'Package must have at least one file.'
+
+
+class StreamingSbomWriter:
     """
-    print("Begin Parsing Review List")
-    proc_reviews = []
-    for review in reviews:
-        proc_review = Review()
-        proc_review.reviewer = Person(review['reviewer'],'')
-        proc_review.review_date = datetime.strptime(review['reviewDate'], '%Y-%m-%dT%H:%M:%fZ')
-        if review['comment']:
-          # proc_review.has_comment = True
-          proc_review.comment = review['comment']
-        proc_reviews.append(proc_review)
-    print("Completed Parsing Review List")
-    return proc_reviews
-
-def parse_pkgref_list(refs: []):
+    Writes a tag-value document while the asset is being read
+    The document information, creation info, reviews, annotations and package are written as soon as the asset
+    holds all of them. From then on files and snippets are written one by one as they are read. Those read
+    earlier are spooled to disk and written once the document header is out.
+    Files are written in the order of the asset instead of being sorted by name. The header, then each file and
+    snippet, are checked against the asset schema before they are written
     """
-      Make PkgRef List from SPDX review spec
-
-      :param refs: SPDX ExtPkgRef Object
-      :return: List of dicts with metadata of Refs
-      """
-    print("Begin Parsing Ref List")
-    proc_refs = []
-    for ref in refs:
-        proc_ref = ExternalPackageRef()
-        proc_ref.category = ref["category"]
-        proc_ref.locator = ref["locator"]
-        proc_ref.pkg_ext_ref_type = ref["type"]
-        if ref["comment"]:
-            proc_ref.comment = ref["comment"]
-        proc_refs.append(proc_ref)
-    print("Completed Parsing Ref List")
-    return proc_refs
-
-def rec_parse_license(license):
-    if type(license) == dict:
-      p_license = License(license["name"],license["id"])
-    else:
-      p_license = LicenseConjunction(rec_parse_license(license[0]), rec_parse_license(license[1]))
-
-    #  license_dict = [rec_make_license(license.license_1), rec_make_license(license.license_2)]
-    return p_license
-
-def parse_license_list(licenses : []):
-    license_list = []
-    for lic in licenses:
-      license = License(lic["name"], lic["id"])
-      license_list.append(license)
-
-    return license_list
-
-def parse_license(package, package_dict):
-
-    package.license_comment = package_dict["comment"]
-    package.license_declared = rec_parse_license(package_dict["declared"])
-    package.conc_lics = rec_parse_license(package_dict["concluded"])
-    package.licenses_from_files = parse_license_list(package_dict["fromFile"])
-
-    return package
-
-def parse_license_file(file, package_dict):
-
-    file.license_comment = package_dict["comment"]
-    file.conc_lics = rec_parse_license(package_dict["concluded"])
-    file.licenses_in_file = parse_license_list(package_dict["fromFile"])
-
-    return file
-
-def parse_license_snippet(snippet, snippet_dict):
-
-    snippet.license_comment = snippet_dict["comment"]
-    snippet.conc_lics = rec_parse_license(snippet_dict["concluded"])
-    snippet.licenses_in_snippet = parse_license_list(snippet_dict["inSnippet"])
-
-    return snippet
-
-def parse_files(package_dict):
-
-    files = []
-    for f in package_dict["files"]:
-      file = File(f['name'])
-      file.type = f['type']
-      file.spdx_id = f['id']
-      file = parse_license_file(file, f['license'])
-      file.copyright = f['copyright']
-      file.comment = f['comment']
-      file.chk_sum = Algorithm(f["checksumAlgorithm"], f["checksum"])
-      files.append(file)
-    return files
-
-def parse_annotation_list(annotations : []):
-
-    annotation_list = []
-    for a in annotations:
-      annotation = Annotation()
-      annotation.spdx_id = a['id']
-      annotation.comment = a['comment']
-      annotation.annotation_type = a['type']
-      annotation.annotation_date = datetime.strptime(a['date'], '%Y-%m-%dT%H:%M:%fZ') 
-      annotation.annotator = Person(a['annotator']['name'], a['annotator']['email'])
-      annotation_list.append(annotation)
-    return annotation_list
-
-def parse_snippet_list(snippets : []):
-
-    snippet_list = []
-    for s in snippets:
-      snippet = Snippet()
-      snippet.spdx_id = s['id']
-      snippet.name = s['name']
-      snippet.comment = s['comment']
-      snippet.copyright = s['copyright']
-      snippet.snip_from_file_spdxid = s['fromFileID']
-      snippet = parse_license_snippet(snippet, s['license'])
-      snippet_list.append(snippet)
-    return snippet_list
-
-def parse_package(package_dict):
+
+    def __init__(self, out):
+        self.out = out
+        self.licenses = None
+        self.license_ids = frozenset()
+        self.header_written = False
+        self.package_closed = False
+        self.file_count = 0
+        self.snippet_count = 0
+        self.spooled_files = SpooledArray()
+        self.spooled_snippets = SpooledArray()
+
+    def write(self, chunks):
+        """
+        Read an asset and write it as a tag-value document
+        :param chunks: Iterable of the bytes chunks of the asset JSON document
+        :return: None
+        """
+        from spdx.writers.tagvalue import InvalidDocumentError
+
+        reader = JSONReader(chunks, [FILES_PATH, SNIPPETS_PATH])
+        for path, item in reader.events():
+            if not self.header_written and header_ready(reader.document):
+                self.write_header(reader.document)
+            if path == FILES_PATH:
+                if self.header_written:
+                    self.write_file(item)
+                else:
+                    self.spooled_files.append(item)
+            elif self.header_written and 'files' in reader.document['assetMetadata']['package']:
+                # The files array is contiguous, reading a snippet after it started means it is complete
+                self.close_package()
+                self.write_snippet(item)
+            else:
+                self.spooled_snippets.append(item)
+
+        if not self.header_written:
+            self.write_header(reader.document)
+        self.close_package()
+        for item in self.spooled_snippets:
+            self.write_snippet(item)
+        if not self.file_count:
+            raise InvalidDocumentError([NO_FILES_MESSAGE])
+        self.out.write('# Extracted Licenses\n\n')
+
+    def write_header(self, asset):
+        """
+        Write everything that precedes the first file, mirroring spdx.writers.tagvalue.write_document
+        """
+        import spdx.writers.tagvalue as tvwriter
+
+        header = dict(asset, assetMetadata=dict(asset['assetMetadata'], snippets=[]))
+        header['assetMetadata']['package'] = dict(header['assetMetadata']['package'], files=[])
+        self.check(ASSET_HEADER_V1, header, '$')
+        document = create_sbom(header, check=False)
+        self.licenses = LicenseResolver(asset['assetMetadata'].get('licenses', ()))
+        self.license_ids = table_ids(asset['assetMetadata'].get('licenses'))
+        # The files are validated one by one as they are written
+        messages = [m for m in document.validate([]) if m != NO_FILES_MESSAGE]
+        if messages:
+            raise tvwriter.InvalidDocumentError(messages)
+
+        out = self.out
+        out.write('# Document Information\n\n')
+        tvwriter.write_value('SPDXVersion', str(document.version), out)
+        tvwriter.write_value('DataLicense', document.data_license.identifier, out)
+        if document.name:
+            tvwriter.write_value('DocumentName', document.name, out)
+        tvwriter.write_value('SPDXID', 'SPDXRef-DOCUMENT', out)
+        if document.namespace:
+            tvwriter.write_value('DocumentNamespace', document.namespace, out)
+        if document.has_comment:
+            tvwriter.write_text_value('DocumentComment', document.comment, out)
+        tvwriter.write_separators(out)
+        tvwriter.write_creation_info(document.creation_info, out)
+        tvwriter.write_separators(out)
+        for review in sorted(document.reviews):
+            tvwriter.write_review(review, out)
+            tvwriter.write_separators(out)
+        for annotation in sorted(document.annotations):
+            tvwriter.write_annotation(annotation, out)
+            tvwriter.write_separators(out)
+        tvwriter.write_package(document.package, out)
+        self.header_written = True
+
+        for item in self.spooled_files:
+            self.write_file(item)
+
+    def write_file(self, item):
+        import spdx.writers.tagvalue as tvwriter
+
+        self.check(FILE, item, f"$.assetMetadata.package.files[{self.file_count}]")
+        file = parse_file(item, self.licenses)
+        messages = file.validate([])
+        if messages:
+            raise tvwriter.InvalidDocumentError(messages)
+        tvwriter.write_separators(self.out)
+        tvwriter.write_file(file, self.out)
+        self.file_count += 1
+
+    def check(self, schema, item, path: str):
+        """
+        Raise ConversionError listing the problems of a part of the asset
+        :param path: JSON path of the part in the asset
+        """
+        errors = validate(schema, item, path, self.license_ids)
+        if errors:
+            raise ConversionError('Invalid asset', errors)
+
+    def close_package(self):
+        import spdx.writers.tagvalue as tvwriter
+
+        if not self.package_closed:
+            tvwriter.write_separators(self.out)
+            self.package_closed = True
+
+    def write_snippet(self, item):
+        import spdx.writers.tagvalue as tvwriter
+
+        self.check(SNIPPET, item, f"$.assetMetadata.snippets[{self.snippet_count}]")
+        self.snippet_count += 1
+        snippet = parse_snippet(item, self.licenses)
+        messages = snippet.validate([])
+        if messages:
+            raise tvwriter.InvalidDocumentError(messages)
+        tvwriter.write_snippet(snippet, self.out)
+        tvwriter.write_separators(self.out)
+
+
+def header_ready(asset):
     """
-      Make PkgRef List from SPDX review spec
-
-      :param refs: SPDX ExtPkgRef Object
-      :return: List of dicts with metadata of Refs
-      """
-    package = Package()
-    package.name = package_dict["name"] 
-    package.spdx_id = package_dict["id"]
-    package.version = package_dict["version"]
-    package.download_location = package_dict["downloadLocation"]
-    package.summary = package_dict["summary"]
-    package.source_info = package_dict["sourceInfo"]
-    package.file_name = package_dict["fileName"]
-    package.supplier =  Organization( package_dict["supplierName"], package_dict["supplierEmail"])
-    package.originator =  Organization( package_dict["originatorName"], package_dict["originatorEmail"])
-    package.check_sum = Algorithm( package_dict["checksumAlgorithm"],package_dict["checksum"])
-    package.files = parse_files(package_dict)
-    package.verif_code = package_dict["verificationCode"]
-    package.description = package_dict["description"]
-    package.comment = package_dict["comment"]
-    package.cr_text = package_dict["copyright"]
-    package = parse_license(package, package_dict["license"])
-    return package
-
-def create_dbom_asset_payload(spdx_document: Document):
+    Check whether a partially read asset holds everything needed to write the document up to the first file
+    :param asset: The asset read so far
+    :return: True if the header can be written
     """
-    Creates a payload that the gateway would accept using ONLY package information from spdx_document
+    if not isinstance(asset, dict) or not all(key in asset for key in ASSET_KEYS):
+        return False
+    metadata = asset['assetMetadata']
+    if not all(key in metadata for key in METADATA_KEYS):
+        return False
+    return all(key in metadata['package'] for key in PACKAGE_KEYS)
+
 
-    :param spdx_document: An SPDX document object generated by the SPDX Python SDK
-    :return: A valid asset payload for the gateway
+def write_sbom(asset, file: str, metrics: Metrics = NO_METRICS):
     """
-    metadata_dict = {
-        "reviews": make_review_list(spdx_document.reviews),
-        "license": document.package.license_declared.identifier,
-        "extrefs": make_pkgref_list(spdx_document.package.pkg_ext_refs)
-    }
-
-    payload = GatewayAsset(
-        document_name=spdx_document.package.name,
-        document_creator=make_creator_string(document.creation_info.creators),
-        document_created_date=document.creation_info.created,
-        asset_type="SoftwareComponent",
-        asset_sub_type="BuildArtifact",
-        asset_manufacturer=f"{document.package.originator.name} [{document.package.supplier.name}]",
-        asset_description=document.package.description,
-        asset_model_number=document.package.version,
-        asset_metadata=metadata_dict,
-        manufacture_signature="NOT SIGNED (DEMO)"
-    )
-    return payload.to_dict()
-
-def create_sbom(asset):
+    Convert an asset to an SPDX document and write it. Runs inside the batch worker processes
+    :param asset: The asset retrieved from the gateway
+    :param file: Path of the SPDX KV Tag to create, compressed according to its extension
+    :param metrics: Metrics recording the convert and write stages
+    :return: The size of the created file in bytes. The file is not created if the asset fails to convert
     """
-    Creates a payload that the gateway would accept using ONLY package information from spdx_document
+    with atomic_output(file) as out:
+        convert_asset_to_spdx(asset, out, metrics)
+    size = os.path.getsize(file)
+    metrics.count('output_bytes', size)
+    return size
 
-    :param spdx_document: An SPDX document object generated by the SPDX Python SDK
-    :return: A valid asset payload for the gateway
+
+def collect_asset_ids(cli_args):
+    """
+    Collect the list of assets to export from the batch arguments (asset list or manifest)
+    :param cli_args: The parsed command line arguments
+    :return: A list of asset IDs
+    """
+    if cli_args.assets:
+        return cli_args.assets
+    asset_ids = []
+    with open(cli_args.manifest) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                asset_ids.append(line)
+    return asset_ids
+
+
+def asset_file_name(asset_id: str, compression: str = None):
+    """
+    Name of the SPDX KV Tag an asset is exported to
+    :param asset_id: A string with assetID
+    :param compression: 'gzip' or 'zstd' to name a compressed file
+    :return: The asset ID, made safe to use as a file name, with the .tag extension and the compression one if any
     """
+    return re.sub(r'[^A-Za-z0-9._-]', '_', asset_id) + '.tag' + (SUFFIXES[compression] if compression else '')
 
-    document = Document()
-    creator = parse_creator_string(asset['documentCreator'])
-    document.creation_info = CreationInfo()
-    document.creation_info.created = datetime.strptime(asset['documentCreatedDate'], '%Y-%m-%dT%H:%M:%f')
-    document.creation_info.creators.append(Person( name= creator[0], email= ''))
-    document.creation_info.creators.append(Organization( name= creator[1], email= ''))
-    document.creation_info.creators.append(Tool (name= creator[2]))
-    document.reviews = parse_review_list(asset['assetMetadata']['reviews'])
-    document.package = parse_package(asset['assetMetadata']['package'])
-    document.annotations = parse_annotation_list(asset['assetMetadata']['annotations'])
-    document.snippet = parse_snippet_list(asset['assetMetadata']['snippets'])
-    document.package.pkg_ext_refs = parse_pkgref_list(asset['assetMetadata']['extrefs'])
-
-    document.version = 'SPDX-2.1'
-    document.data_license = rec_parse_license(asset['assetMetadata']['dataLicense'])
-    document.name = asset['documentName']
-    document.spdx_id = asset['assetMetadata']['id']
-    document.namespace = asset['assetMetadata']['namespace']
-    document.comment = asset['assetMetadata']['comment']
-    return document
+
+def export_assets(asset_ids: [str], output_dir: str):
+    """
+    Retrieve assets concurrently over the pooled connections, convert and write them in worker processes
+    and print the progress and a per-asset summary
+    :param asset_ids: List of asset IDs
+    :param output_dir: Directory in which the SPDX KV Tags are created
+    :return: True if every asset was exported
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    from dbom_wrapper.api import DbomException
+
+    files = {}
+    exported_as = {}
+    for asset_id in asset_ids:
+        name = asset_file_name(asset_id, args.compress)
+        if exported_as.setdefault(name, asset_id) != asset_id:
+            # One would silently replace the other
+            raise SystemExit(f"Assets {exported_as[name]} and {asset_id} would both be exported to {name}")
+        files[asset_id] = os.path.join(output_dir, name)
+
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = max(1, min(args.jobs or 1, len(asset_ids)))
+    print(f"Exporting {len(asset_ids)} assets from channel {args.channel} on repo {args.repo} using {jobs} workers")
+    errors = {}
+    exported = 0
+    written = 0
+    start = time.monotonic()
+
+    def report(done):
+        nonlocal exported, written
+        for future in done:
+            asset_id, file = running.pop(future)
+            try:
+                size, summary = future.result()
+            except Exception as e:
+                errors[asset_id] = f"Conversion failed: {e}"
+                continue
+            metrics.merge(summary)
+            written += size
+            exported += 1
+            elapsed = time.monotonic() - start
+            print(f"[{exported + len(errors)}/{len(asset_ids)}] {asset_id} -> {file} "
+                  f"({exported / elapsed:.1f} assets/s)")
+
+    running = {}
+    pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else ThreadPoolExecutor(max_workers=1)
+    with pool:
+        gateway_ids = [make_asset_id(asset_id) for asset_id in asset_ids]
+        for asset_id, result in zip(asset_ids, get_api().retreive_assets(args.repo, args.channel, gateway_ids)):
+            if not result.success:
+                message = result.error.message if isinstance(result.error, DbomException) else result.error
+                errors[asset_id] = f"Retrieval failed: {message}"
+                continue
+            # Bound the number of retrieved assets waiting for a worker
+            while len(running) >= 2 * jobs:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                report(done)
+            file = files[asset_id]
+            running[pool.submit(measured, write_sbom, result.asset, file)] = asset_id, file
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            report(done)
+    elapsed = time.monotonic() - start
+
+    printsep()
+    print("Summary:")
+    for asset_id in asset_ids:
+        error = errors.get(asset_id)
+        print(f"{'OK    ' if error is None else 'FAILED'} {asset_id}" + ('' if error is None else f" ({error})"))
+    print(f"{exported} exported, {len(errors)} failed in {elapsed:.1f}s "
+          f"({exported / elapsed:.1f} assets/s, {written / elapsed / 1024 / 1024:.2f} MB/s written)")
+    printsep()
+    return not errors
 
 
 def printsep():
@@ -316,18 +423,56 @@ def printsep():
     print("=" * 80)
 
 
-if __name__ == '__main__':
-    p = Parser(Builder(), StandardLogger())
-    p.build()
+def main(argv: [str] = None):
+    """
+    Run the exporter
+    :param argv: The command line arguments, defaults to sys.argv[1:]
+    :return: The exit status
+    """
+    global args, metrics
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if not args.asset and not args.output_dir:
+        parser.error('-o/--output-dir is required with -A/--assets and -m/--manifest')
+    if args.asset and not args.file:
+        parser.error('-f/--file is required with -a/--asset')
+    metrics = Metrics()
+    try:
+        with profiled(args.profile):
+            return run()
+    finally:
+        metrics.report(args)
+
+
+def run():
+    """
+    Retrieve and write the assets given by the command line arguments
+    :return: The exit status
+    """
+    if not args.asset:
+        asset_ids = collect_asset_ids(args)
+        if not asset_ids:
+            raise SystemExit('No asset IDs given')
+        return 0 if export_assets(asset_ids, args.output_dir) else 1
+
     file = args.file
     print("Retrieving BoM from gateway")
+    if args.stream:
+        print('Begin Streaming Write SBoM')
+        # The asset is converted and written while it is retrieved, the write stage includes the waits on the gateway
+        with metrics.stage('write'), atomic_output(file) as out:
+            StreamingSbomWriter(out).write(stream_asset(args.asset))
+        metrics.count('output_bytes', os.path.getsize(file))
+        print('Completed Write SBoM')
+        return 0
+
     asset = retrieve_asset(args.asset)
-    while asset is None:
-        pass
-    sbom = create_sbom(asset)
 
     print('Begin Write SBoM')
-    with codecs.open(file, mode='w', encoding='utf-8') as out:
-      tvwriter.write_document(sbom, out)
+    write_sbom(asset, file, metrics)
     print('Completed Write SBoM')
-    
\ No newline at end of file
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -16,7 +16,20 @@ limitations under the License.
 
 import http
 import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Tuple
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from .compression import gzip_chunks
+from .jsonstream import iter_bytes
+from .metrics import NO_METRICS, Metrics
+from .retry import NOT_PROCESSED_STATUSES, RetryPolicy, parse_retry_after
 
 
 class DbomException(Exception):
@@ -37,47 +50,373 @@ class APIException(DbomException):
         self.message = message
 
 
+def same_asset(body: bytes, payload) -> bool:
+    """
+    Whether an asset body returned by the gateway holds payload
+    Both are compared once decoded from JSON, so that the formatting of the gateway does not matter
+    """
+    try:
+        stored = json.loads(body)
+    except ValueError:
+        return False
+    return stored == json.loads(b''.join(iter_bytes(payload)))
+
+
+@dataclass
+class AssetResult:
+    """
+    Outcome of a single asset operation in a bulk call
+    """
+    asset_id: str
+    status_code: int = None
+    error: Exception = None
+    asset: dict = None
+
+    @property
+    def success(self) -> bool:
+        return self.error is None
+
+
 class GatewayAPI:
     """
     Class for abstracting DBoM gateway operations
-    Currently only supports asset creation
+    Requests go through a pooled session so that connections to the gateway are kept alive and reused
+    Failed requests are retried according to retry_policy. The bytes sent and received, the retries and the time spent
+    encoding request bodies (the serialize stage) are recorded in metrics
+    With compress, asset payloads are uploaded gzip compressed (Content-Encoding: gzip). Responses are always
+    accepted gzip compressed, the bytes_* counters are then the compressed sizes and the uncompressed_bytes_* ones
+    the sizes of the JSON bodies
     """
 
-    def __init__(self, address):
+    def __init__(self, address, pool_size: int = 10, keep_alive: bool = True, retry_policy: RetryPolicy = None,
+                 metrics: Metrics = NO_METRICS, compress: bool = False):
         self.address = address
+        self.pool_size = pool_size
+        self.compress = compress
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.metrics = metrics
+        self.retries = 0
+        self._retries_lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        """
+        Close the pooled connections of this client
+        """
+        self.session.close()
+
+    def asset_url(self, repo: str, channel: str, asset_id) -> str:
+        return f"{self.address}/api/v1/repo/{repo}/chan/{channel}/asset/{asset_id}"
 
-    def create_asset(self, repo: str, channel: str, asset_id, payload: dict):
-        print(f"Attempting to contact gateway at {self.address}")
+    def _send(self, method: str, url: str, already_done=None, body=None, **kwargs):
+        """
+        Send a request, retrying it according to the retry policy
 
-        url = f"{self.address}/api/v1/repo/{repo}/chan/{channel}/asset/{asset_id}"
+        :param method: HTTP method
+        :param url: Request URL
+        :param body: Function returning the request body. It is called for every attempt, so that a body
+            streamed from a generator can be sent again
+        :param already_done: For requests that are not idempotent, a function called with the retry state before
+            a retry that may duplicate a request the gateway already processed. It returns a response standing in
+            for the successful request, or None if the request has to be sent again
+        :return: The last response received. Raises the last connection error if there is no response, or
+            requests.Timeout if the deadline passed before the first attempt
+        """
+        state = self.retry_policy.start()
+        response = error = None
+        while True:
+            if state.expired():
+                # The deadline ran out before an attempt, during its backoff or the idempotency check
+                if response is None:
+                    raise error or requests.Timeout(f"Deadline of {self.retry_policy.deadline}s exceeded")
+                return response
+            state.attempt += 1
+            retry_after = None
+            if body is not None:
+                kwargs['data'] = self.metrics.counted(body(), 'bytes_sent', 'serialize')
+            try:
+                response = self.session.request(method, url, timeout=state.timeout(), **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                response, error = None, e
+            else:
+                retry = self.retry_policy.should_retry(response.status_code)
+                # Failed responses are read even when streamed, so that they can be released to the pool
+                if retry or not kwargs.get('stream'):
+                    self._count_received(response, len(response.content))
+                if not retry:
+                    return response
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                error = response.status_code
+
+            delay = state.next_delay(retry_after)
+            if delay is None:
+                if response is None:
+                    raise error
+                return response
+            if response is not None:
+                # Its body has been read, closing only gives its connection back for the next attempt
+                response.close()
+            with self._retries_lock:
+                self.retries += 1
+            self.metrics.count('retries')
+            print(f"Gateway request failed ({error}), attempt {state.attempt} of "
+                  f"{self.retry_policy.max_attempts}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+            if already_done is not None and (response is None or response.status_code not in NOT_PROCESSED_STATUSES):
+                done = already_done(state)
+                if done is not None:
+                    return done
+
+    def _encode(self, payload) -> Iterator[bytes]:
+        """
+        :return: Generator of the bytes of a payload as they are sent, gzip compressed if compress is set
+        """
+        chunks = self.metrics.counted(iter_bytes(payload), 'uncompressed_bytes_sent')
+        return gzip_chunks(chunks) if self.compress else chunks
+
+    def _count_received(self, response, size: int):
+        """
+        Count the bytes of a response that has been read
+        :param size: Size of the body once decompressed
+        """
+        self.metrics.count('uncompressed_bytes_received', size)
+        # urllib3 does not count the bytes of chunked responses
+        self.metrics.count('bytes_received', response.raw.tell() or size)
+
+    def _asset_exists(self, url: str, payload):
+        """
+        Idempotency check for asset creation: a previous POST may have been stored even if its response was lost
+        The asset only counts as created if the gateway holds payload, an older version of it is sent again
+        """
+
+        def check(state):
+            if state.expired():
+                return None
+            try:
+                response = self.session.request("GET", url, timeout=state.timeout())
+            except (requests.ConnectionError, requests.Timeout):
+                return None
+            if response.status_code == http.HTTPStatus.OK and same_asset(response.content, payload):
+                print("Asset was already created by a previous attempt")
+                return response
+            return None
+
+        return check
+
+    def create_asset(self, repo: str, channel: str, asset_id, payload: dict, verbose: bool = True):
+        """
+        Create an asset on the gateway
+
+        :param repo: The repository ID
+        :param channel: The channel ID
+        :param asset_id: The asset ID
+        :param payload: The asset payload
+        :param verbose: Print the gateway address and its response
+        :return: The response of the gateway. Raises APIException if the asset was not created
+        """
+        if verbose:
+            print(f"Attempting to contact gateway at {self.address}")
+
+        url = self.asset_url(repo, channel, asset_id)
 
-        payload = json.dumps(payload)
         headers = {
             'Content-Type': 'application/json'
         }
+        if self.compress:
+            headers['Content-Encoding'] = 'gzip'
 
-        response = requests.request("POST", url, headers=headers, data=payload)
+        # The payload is encoded while it is sent (chunked transfer encoding) instead of into one string
+        with self.metrics.stage('upload'):
+            response = self._send("POST", url, already_done=self._asset_exists(url, payload), headers=headers,
+                                  body=lambda: self._encode(payload))
 
         if response.status_code in [http.HTTPStatus.OK, http.HTTPStatus.CREATED]:
-            print(f"Success Response From Gateway:\n{response.text.encode('utf8')}")
+            if verbose:
+                print(f"Success Response From Gateway:\n{response.text.encode('utf8')}")
+            return response
         else:
             raise APIException(response.status_code, payload, response.text.encode('utf8'))
 
-    def retreive_asset(self, repo: str, channel: str, asset_id):
-        print(f"Attempting to contact gateway at {self.address}")
-
-        url = f"{self.address}/api/v1/repo/{repo}/chan/{channel}/asset/{asset_id}"
+    def attach_subasset(self, repo: str, channel: str, asset_id, sub_repo: str, sub_channel: str, sub_asset_id,
+                        role: str, sub_role: str = None):
+        """
+        Attach an existing asset to another one as its sub-asset
+        :param repo: The repository ID of the parent asset
+        :param channel: The channel ID of the parent asset
+        :param asset_id: The parent asset ID
+        :param sub_repo: The repository ID of the sub-asset
+        :param sub_channel: The channel ID of the sub-asset
+        :param sub_asset_id: The sub-asset ID
+        :param role: The role of the sub-asset, e.g. the SPDX relationship
+        :param sub_role: An optional refinement of role
+        :return: The response of the gateway
+        """
+        url = f"{self.asset_url(repo, channel, asset_id)}/attach"
 
         headers = {
             'Content-Type': 'application/json'
         }
 
-        response = requests.request("GET", url, headers=headers)
+        payload = {
+            "repoID": sub_repo,
+            "channelID": sub_channel,
+            "assetID": sub_asset_id,
+            "role": role,
+            "subRole": sub_role or ""
+        }
 
-        if response.status_code in [http.HTTPStatus.OK, http.HTTPStatus.OK]:
-            print(f"Success Response From Gateway:\n{response.text.encode('utf8')}")
-            asset = json.loads(response.text.encode('utf8'))
-            print(asset['standardVersion'])
-            return asset
+        response = self._send("POST", url, headers=headers, data=json.dumps(payload))
+
+        if response.status_code in [http.HTTPStatus.OK, http.HTTPStatus.CREATED]:
+            return response
         else:
             raise APIException(response.status_code, payload, response.text.encode('utf8'))
+
+    def create_assets(self, repo: str, channel: str, assets: Iterable[Tuple[str, dict]]) -> [AssetResult]:
+        """
+        Create many assets, keeping up to pool_size uploads in flight over the pooled connections
+        A failed upload does not stop the others, its error is reported in the matching result instead
+
+        :param repo: The repository ID
+        :param channel: The channel ID
+        :param assets: Iterable of (asset_id, payload) tuples. It is consumed lazily
+        :return: List of AssetResult, in the order of assets
+        """
+
+        def upload(asset_id, payload):
+            try:
+                response = self.create_asset(repo, channel, asset_id, payload, verbose=False)
+                return AssetResult(asset_id, response.status_code)
+            except APIException as e:
+                return AssetResult(asset_id, e.status_code, e)
+            except Exception as e:
+                return AssetResult(asset_id, error=e)
+
+        futures = []
+        window = deque()
+        with ThreadPoolExecutor(max_workers=self.pool_size) as pool:
+            for asset_id, payload in assets:
+                # Bound the number of queued payloads so that a lazy iterable is not drained into memory
+                while len(window) >= 2 * self.pool_size:
+                    window.popleft().result()
+                future = pool.submit(upload, asset_id, payload)
+                futures.append(future)
+                window.append(future)
+        return [f.result() for f in futures]
+
+    def retreive_asset(self, repo: str, channel: str, asset_id, verbose: bool = True):
+        """
+        Retrieve an asset from the gateway
+
+        :param repo: The repository ID
+        :param channel: The channel ID
+        :param asset_id: The asset ID
+        :param verbose: Print the gateway address and the size of its response
+        :return: The asset, as a dict. Raises APIException if it was not retrieved
+        """
+        if verbose:
+            print(f"Attempting to contact gateway at {self.address}")
+
+        url = self.asset_url(repo, channel, asset_id)
+
+        headers = {
+            'Content-Type': 'application/json'
+        }
+
+        with self.metrics.stage('retrieve'):
+            response = self._send("GET", url, headers=headers)
+
+        if response.status_code == http.HTTPStatus.OK:
+            if verbose:
+                # Assets can be large, printing them would hold another copy in memory
+                print(f"Success Response From Gateway, {len(response.content)} bytes")
+            return json.loads(response.content)
+        else:
+            raise APIException(response.status_code, None, response.text.encode('utf8'))
+
+    def retreive_assets(self, repo: str, channel: str, asset_ids: Iterable[str]) -> Iterator[AssetResult]:
+        """
+        Retrieve many assets, keeping up to pool_size requests in flight over the pooled connections
+        A failed retrieval does not stop the others, its error is reported in the matching result instead
+
+        :param repo: The repository ID
+        :param channel: The channel ID
+        :param asset_ids: Iterable of asset IDs. It is consumed lazily
+        :return: Generator of AssetResult holding the retrieved asset, in the order of asset_ids
+        """
+
+        headers = {
+            'Content-Type': 'application/json'
+        }
+
+        def download(asset_id):
+            try:
+                with self.metrics.stage('retrieve'):
+                    response = self._send("GET", self.asset_url(repo, channel, asset_id), headers=headers)
+                if response.status_code != http.HTTPStatus.OK:
+                    raise APIException(response.status_code, None, response.text.encode('utf8'))
+                return AssetResult(asset_id, response.status_code, asset=response.json())
+            except APIException as e:
+                return AssetResult(asset_id, e.status_code, e)
+            except Exception as e:
+                return AssetResult(asset_id, error=e)
+
+        window = deque()
+        with ThreadPoolExecutor(max_workers=self.pool_size) as pool:
+            for asset_id in asset_ids:
+                # Bound the number of retrieved assets waiting for the consumer
+                if len(window) >= 2 * self.pool_size:
+                    yield window.popleft().result()
+                window.append(pool.submit(download, asset_id))
+            while window:
+                yield window.popleft().result()
+
+    def retreive_asset_stream(self, repo: str, channel: str, asset_id, chunk_size: int = 64 * 1024,
+                              verbose: bool = True):
+        """
+        Retrieve an asset without loading the response body in memory
+
+        :param repo: The repository ID
+        :param channel: The channel ID
+        :param asset_id: The asset ID
+        :param chunk_size: Size of the chunks read from the connection
+        :param verbose: Print the gateway address and whether it answered
+        :return: Generator of the bytes chunks of the asset JSON document, to feed jsonstream.JSONReader
+        """
+        if verbose:
+            print(f"Attempting to contact gateway at {self.address}")
+
+        url = self.asset_url(repo, channel, asset_id)
+
+        headers = {
+            'Content-Type': 'application/json'
+        }
+
+        start = time.perf_counter()
+        response = self._send("GET", url, headers=headers, stream=True)
+        with response:
+            if response.status_code != http.HTTPStatus.OK:
+                raise APIException(response.status_code, None, response.text.encode('utf8'))
+            if verbose:
+                print("Success Response From Gateway, streaming asset")
+            # The time the caller spends on each chunk is left out of the retrieve stage
+            size = 0
+            try:
+                for chunk in self.metrics.counted(response.iter_content(chunk_size), 'uncompressed_bytes_received',
+                                                  'retrieve', time.perf_counter() - start):
+                    size += len(chunk)
+                    yield chunk
+            finally:
+                self.metrics.count('bytes_received', response.raw.tell() or size)
@@ -0,0 +1,284 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+asyncio client for the DBoM gateway, mirroring GatewayAPI
+"""
+
+import asyncio
+import dataclasses
+import http
+import json
+from typing import AsyncIterable, Iterable, Tuple, Union
+
+import aiohttp
+
+from .api import APIException, AssetResult, same_asset
+from .compression import decode_body, gzip_chunks
+from .jsonstream import iter_bytes
+from .metrics import NO_METRICS, Metrics
+from .retry import NOT_PROCESSED_STATUSES, RetryPolicy, parse_retry_after
+
+
+class AsyncGatewayAPI:
+    """
+    Class for abstracting DBoM gateway operations with asyncio
+    At most max_in_flight requests are sent at the same time, every request is bounded by a timeout
+    and cancelling the awaiting task aborts the request. Failed requests are retried according to retry_policy
+    The bytes sent and received and the retries are recorded in metrics. compress is as in GatewayAPI
+    """
+
+    def __init__(self, address, max_in_flight: int = 100, timeout: float = None, retry_policy: RetryPolicy = None,
+                 metrics: Metrics = NO_METRICS, compress: bool = False):
+        self.address = address
+        self.metrics = metrics
+        self.compress = compress
+        self.max_in_flight = max_in_flight
+        self.retry_policy = retry_policy or RetryPolicy()
+        if timeout is not None:
+            self.retry_policy = dataclasses.replace(self.retry_policy, timeout=timeout)
+        self.retries = 0
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self):
+        """
+        Close the pooled connections of this client
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def asset_url(self, repo: str, channel: str, asset_id) -> str:
+        return f"{self.address}/api/v1/repo/{repo}/chan/{channel}/asset/{asset_id}"
+
+    def _get_session(self):
+        # Created lazily so that the session and semaphore belong to the running event loop
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.max_in_flight)
+            # Bodies are decompressed in _attempt, once their size on the wire is counted
+            self._session = aiohttp.ClientSession(connector=connector, auto_decompress=False)
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._session
+
+    async def _attempt(self, method: str, url: str, timeout: float, body=None, **kwargs):
+        if body is not None:
+            kwargs['data'] = body()
+        async with self._semaphore:
+            async with self._session.request(method, url, timeout=aiohttp.ClientTimeout(total=timeout),
+                                             **kwargs) as response:
+                content = await response.read()
+                self.metrics.count('bytes_received', len(content))
+                try:
+                    content = decode_body(content, response.headers.get('Content-Encoding'))
+                except ValueError as e:
+                    raise aiohttp.ClientPayloadError(str(e)) from e
+                self.metrics.count('uncompressed_bytes_received', len(content))
+                return response.status, response.headers, content
+
+    async def _request(self, method: str, url: str, timeout: float = None, already_done=None, **kwargs):
+        """
+        Send a request, retrying it according to the retry policy. Mirrors GatewayAPI._send
+
+        :return: A tuple of the status and body of the last response received.
+            Raises the last connection error if there is no response, or asyncio.TimeoutError if the deadline
+            passed before the first attempt
+        """
+        self._get_session()
+        state = self.retry_policy.start()
+        status = error = body = None
+        while True:
+            if state.expired():
+                # The deadline ran out before an attempt, during its backoff or the idempotency check
+                if status is None:
+                    raise error or asyncio.TimeoutError(f"Deadline of {self.retry_policy.deadline}s exceeded")
+                return status, body
+            state.attempt += 1
+            retry_after = None
+            try:
+                status, headers, body = await self._attempt(method, url, state.timeout(timeout), **kwargs)
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError) as e:
+                status, error = None, e
+            else:
+                if not self.retry_policy.should_retry(status):
+                    return status, body
+                retry_after = parse_retry_after(headers.get('Retry-After'))
+                error = status
+
+            delay = state.next_delay(retry_after)
+            if delay is None:
+                if status is None:
+                    raise error
+                return status, body
+            self.retries += 1
+            self.metrics.count('retries')
+            await asyncio.sleep(delay)
+
+            if already_done is not None and (status is None or status not in NOT_PROCESSED_STATUSES):
+                done = await already_done(state, timeout)
+                if done is not None:
+                    return done
+
+    def _asset_exists(self, url: str, payload):
+        """
+        Idempotency check for asset creation: a previous POST may have been stored even if its response was lost
+        The asset only counts as created if the gateway holds payload, an older version of it is sent again
+        """
+
+        async def check(state, timeout):
+            if state.expired():
+                return None
+            try:
+                status, _, body = await self._attempt("GET", url, state.timeout(timeout))
+            except (asyncio.TimeoutError, aiohttp.ClientConnectionError):
+                return None
+            return (status, body) if status == http.HTTPStatus.OK and same_asset(body, payload) else None
+
+        return check
+
+    async def create_asset(self, repo: str, channel: str, asset_id, payload: dict, timeout: float = None):
+        url = self.asset_url(repo, channel, asset_id)
+
+        headers = {
+            'Content-Type': 'application/json'
+        }
+        if self.compress:
+            headers['Content-Encoding'] = 'gzip'
+
+        def encode():
+            chunks = self.metrics.counted(iter_bytes(payload), 'uncompressed_bytes_sent')
+            if self.compress:
+                chunks = gzip_chunks(chunks)
+            return _aiter(self.metrics.counted(chunks, 'bytes_sent', 'serialize'))
+
+        with self.metrics.stage('upload'):
+            status, body = await self._request("POST", url, timeout, self._asset_exists(url, payload), headers=headers,
+                                               body=encode)
+
+        if status in [http.HTTPStatus.OK, http.HTTPStatus.CREATED]:
+            return status
+        else:
+            raise APIException(status, payload, body)
+
+    async def retreive_asset(self, repo: str, channel: str, asset_id, timeout: float = None):
+        url = self.asset_url(repo, channel, asset_id)
+
+        headers = {
+            'Content-Type': 'application/json'
+        }
+
+        with self.metrics.stage('retrieve'):
+            status, body = await self._request("GET", url, timeout, headers=headers)
+
+        if status == http.HTTPStatus.OK:
+            return json.loads(body)
+        else:
+            raise APIException(status, None, body)
+
+    async def _gather(self, calls) -> [AssetResult]:
+        """
+        Run (asset_id, coroutine function) calls concurrently, turning each outcome into an AssetResult
+        Calls are started as in-flight slots free up so that a lazy source is not drained up front
+        Any error of a call is reported in its result, as in GatewayAPI, and the calls still running are cancelled
+        if the gather is interrupted
+        """
+
+        async def run(asset_id, call):
+            try:
+                result = await call()
+                if isinstance(result, dict):
+                    return AssetResult(asset_id, http.HTTPStatus.OK, asset=result)
+                return AssetResult(asset_id, result)
+            except APIException as e:
+                return AssetResult(asset_id, e.status_code, e)
+            except asyncio.CancelledError:
+                # An Exception before Python 3.8
+                raise
+            except Exception as e:
+                return AssetResult(asset_id, error=e)
+
+        self._get_session()
+        tasks = []
+        pending = set()
+        try:
+            async for asset_id, call in calls:
+                while len(pending) >= 2 * self.max_in_flight:
+                    _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                task = asyncio.ensure_future(run(asset_id, call))
+                tasks.append(task)
+                pending.add(task)
+            return list(await asyncio.gather(*tasks))
+        finally:
+            # Only left unfinished when the gather or the source of the calls failed
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def create_assets(self, repo: str, channel: str,
+                            assets: Union[Iterable[Tuple[str, dict]], AsyncIterable[Tuple[str, dict]]],
+                            timeout: float = None) -> [AssetResult]:
+        """
+        Create many assets concurrently, with at most max_in_flight uploads at a time
+        A failed upload does not stop the others, its error is reported in the matching result instead
+
+        :param repo: The repository ID
+        :param channel: The channel ID
+        :param assets: Iterable or async iterable of (asset_id, payload) tuples. It is consumed lazily
+        :param timeout: Per-request timeout in seconds, defaults to the client timeout
+        :return: List of AssetResult, in the order of assets
+        """
+
+        async def calls():
+            async for asset_id, payload in _aiter(assets):
+                yield asset_id, (lambda a=asset_id, p=payload: self.create_asset(repo, channel, a, p, timeout))
+
+        return await self._gather(calls())
+
+    async def retreive_assets(self, repo: str, channel: str, asset_ids: Iterable[str],
+                              timeout: float = None) -> [AssetResult]:
+        """
+        Retrieve many assets concurrently, with at most max_in_flight requests at a time
+
+        :param repo: The repository ID
+        :param channel: The channel ID
+        :param asset_ids: Iterable of asset IDs
+        :param timeout: Per-request timeout in seconds, defaults to the client timeout
+        :return: List of AssetResult holding the retrieved asset, in the order of asset_ids
+        """
+
+        async def calls():
+            async for asset_id in _aiter(asset_ids):
+                yield asset_id, (lambda a=asset_id: self.retreive_asset(repo, channel, a, timeout))
+
+        return await self._gather(calls())
+
+
+async def _aiter(items):
+    """
+    Iterate over a sync or async iterable from a coroutine
+    """
+    if hasattr(items, '__aiter__'):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
@@ -0,0 +1,270 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+On-disk cache of converted asset payloads, keyed by the content of the converted file
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from .jsonstream import iterencode
+
+PAYLOAD_SUFFIX = '.payload.json'
+META_SUFFIX = '.meta.json'
+
+
+@dataclass
+class CacheEntry:
+    """
+    A cached conversion
+
+    :param key: The cache key of the converted file
+    :param asset_id: The asset ID of the converted document, without any testing suffix
+    :param payload_path: Path of the JSON encoded asset payload
+    :param upload: The last target the payload was successfully sent to, see PayloadCache.upload_target
+    """
+    key: str
+    asset_id: str
+    payload_path: str
+    upload: Optional[dict] = None
+
+    def load_payload(self) -> dict:
+        with open(self.payload_path, encoding='utf-8') as f:
+            return json.load(f)
+
+
+@dataclass
+class _Indexed:
+    """
+    What the index of a PayloadCache knows of an entry
+    """
+    asset_id: str
+    size: int
+    used: float
+    upload: Optional[dict] = None
+
+
+class PayloadCache:
+    """
+    Content-addressed cache of asset payloads with LRU eviction
+    Entries are keyed by a hash of the input file and of the converter version, so changing either one
+    is a cache miss. Reading an entry marks it as recently used, and the least recently used entries are
+    removed once the cache grows over max_bytes
+    The directory is scanned once, on first use, into an in-memory index that the lookups and evictions of the
+    run then work on. Entries added by concurrent runs afterwards are still found by get
+
+    :param directory: Directory holding the cache, created if needed
+    :param max_bytes: Upper bound of the size of the cached payloads
+    :param version: Version of the conversion, part of every key
+    """
+
+    def __init__(self, directory: str, max_bytes: int, version: str):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = version
+        self._index = None
+        # Upload target -> (time it was recorded, key of the entry sent to it)
+        self._uploads = {}
+        self._total = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, file: str) -> str:
+        """
+        Compute the cache key of a file
+        :param file: Path of the file to convert
+        :return: Hex digest of the converter version and the file content
+        """
+        digest = hashlib.sha256(self.version.encode('utf-8') + b'\0')
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """
+        Look up a cached conversion and mark it as recently used
+        :param key: A key returned by key()
+        :return: The CacheEntry, or None on a miss
+        """
+        index = self._load()
+        indexed = index.get(key)
+        if indexed is None:
+            indexed = self._read(key)
+            if indexed is None:
+                return None
+            self._add(key, indexed)
+        payload_path = self._path(key, PAYLOAD_SUFFIX)
+        try:
+            os.utime(payload_path)
+        except OSError:
+            # Evicted by a concurrent run
+            self._forget(key)
+            return None
+        indexed.used = time.time()
+        return CacheEntry(key, indexed.asset_id, payload_path, indexed.upload)
+
+    def put(self, key: str, asset_id: str, payload) -> CacheEntry:
+        """
+        Store a converted payload, then evict least recently used entries if the cache is over its size
+        :param key: A key returned by key()
+        :param asset_id: The asset ID of the converted document
+        :param payload: The asset payload, anything dbom_wrapper.jsonstream.iterencode can encode
+        :return: The new CacheEntry
+        """
+        self._load()
+        payload_path = self._path(key, PAYLOAD_SUFFIX)
+        size = self._write(payload_path, iterencode(payload))
+        self._write_meta(key, {'assetId': asset_id, 'upload': None})
+        self._forget(key)
+        self._add(key, _Indexed(asset_id, size, time.time()))
+        if self._total > self.max_bytes:
+            self.evict()
+        return CacheEntry(key, asset_id, payload_path)
+
+    def record_upload(self, entry: CacheEntry, target: dict):
+        """
+        Remember that the payload of entry was sent to target
+        :param entry: A CacheEntry
+        :param target: A dict returned by upload_target()
+        """
+        entry.upload = target
+        indexed = self._load().get(entry.key)
+        if indexed is None:
+            # Evicted in the meantime
+            return
+        self._write_meta(entry.key, {'assetId': entry.asset_id, 'upload': target})
+        indexed.upload = target
+        self._uploads[_target_key(target)] = time.time(), entry.key
+
+    def find_upload(self, target: dict) -> Optional[CacheEntry]:
+        """
+        Find the payload last sent to a target, whatever file it was converted from
+        :param target: A dict returned by upload_target()
+        :return: The CacheEntry recorded last for target, or None
+        """
+        self._load()
+        found = self._uploads.get(_target_key(target))
+        return None if found is None else self.get(found[1])
+
+    @staticmethod
+    def upload_target(gateway: str, repo: str, channel: str, asset_id: str) -> dict:
+        return {'gateway': gateway.rstrip('/'), 'repo': repo, 'channel': channel, 'assetId': asset_id}
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits in max_bytes
+        """
+        index = self._load()
+        for _, key in sorted((indexed.used, key) for key, indexed in index.items()):
+            if self._total <= self.max_bytes:
+                break
+            self._remove(key)
+            self._forget(key)
+
+    def _load(self) -> dict:
+        """
+        Build the index from the cache directory the first time it is needed
+        :return: The index, cache key -> _Indexed
+        """
+        if self._index is not None:
+            return self._index
+        self._index = {}
+        names = set(os.listdir(self.directory))
+        for name in names:
+            if not name.endswith(META_SUFFIX):
+                continue
+            key = name[:-len(META_SUFFIX)]
+            if key + PAYLOAD_SUFFIX not in names:
+                self._remove(key)
+                continue
+            indexed = self._read(key)
+            if indexed is not None:
+                self._add(key, indexed)
+        return self._index
+
+    def _read(self, key) -> Optional[_Indexed]:
+        """
+        Read an entry from the cache directory
+        :return: The _Indexed entry, or None if it is missing or incomplete
+        """
+        meta_path = self._path(key, META_SUFFIX)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            recorded = os.stat(meta_path).st_mtime
+            stat = os.stat(self._path(key, PAYLOAD_SUFFIX))
+        except (OSError, ValueError):
+            return None
+        indexed = _Indexed(meta['assetId'], stat.st_size, stat.st_mtime, meta.get('upload'))
+        if indexed.upload is not None:
+            target = _target_key(indexed.upload)
+            if target not in self._uploads or recorded > self._uploads[target][0]:
+                self._uploads[target] = recorded, key
+        return indexed
+
+    def _add(self, key, indexed: _Indexed):
+        self._index[key] = indexed
+        self._total += indexed.size
+
+    def _forget(self, key):
+        indexed = self._index.pop(key, None)
+        if indexed is None:
+            return
+        self._total -= indexed.size
+        if indexed.upload is not None:
+            target = _target_key(indexed.upload)
+            if self._uploads.get(target, (None, None))[1] == key:
+                del self._uploads[target]
+
+    def _remove(self, key):
+        for suffix in (META_SUFFIX, PAYLOAD_SUFFIX):
+            try:
+                os.remove(self._path(key, suffix))
+            except OSError:
+                pass
+
+    def _path(self, key, suffix):
+        return os.path.join(self.directory, key + suffix)
+
+    def _write_meta(self, key, meta):
+        self._write(self._path(key, META_SUFFIX), [json.dumps(meta)])
+
+    def _write(self, path, chunks) -> int:
+        """
+        :return: The size of the written file
+        """
+        # Write then rename, so that concurrent runs never read a partial entry
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with open(fd, 'w', encoding='utf-8') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+            size = os.path.getsize(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        return size
+
+
+def _target_key(target: dict) -> tuple:
+    return tuple(sorted(target.items()))
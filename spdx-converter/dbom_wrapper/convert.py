@@ -0,0 +1,900 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Conversion between SPDX tag-value documents and DBoM asset payloads, usable in-process
+convert_spdx_to_payload and convert_asset_to_spdx keep no state between calls and can run in several threads
+at once: each thread parses with its own spdx-tools parser, built the first time it converts a document.
+Like the command line scripts, spdx-tools is only imported once a conversion needs it
+
+Payloads hold the compact records of dbom_wrapper.types (File, Snippet, Package...) where they would hold dicts.
+Licenses are converted once per document (LicenseTable, LicenseResolver): the files and snippets sharing a license
+share its record in the payload and its License object in the SPDX document. Payloads can also list the licenses once
+in the "licenses" table of their metadata and refer to them by ID, which create_sbom resolves
+"""
+
+import threading
+from typing import IO, TYPE_CHECKING, Union
+
+from . import types
+from .metrics import NO_METRICS, Metrics
+from .schema import parse_datetime
+from .tagvalue import build_parser, count_packages, reset_parser, split_packages
+
+if TYPE_CHECKING:
+    from spdx.annotation import Annotation
+    from spdx.document import Document, License
+    from spdx.package import ExternalPackageRef
+    from spdx.review import Review
+    from spdx.snippet import Snippet
+
+_local = threading.local()
+# The types of the NOASSERTION, NONE and UNKNOWN values of spdx-tools, imported by spdx_value on first use
+_special_types = None
+
+
+class ConversionError(ValueError):
+    """
+    A document or asset could not be converted
+
+    :param message: What failed
+    :param messages: The errors reported by the spdx-tools parser or validation
+    """
+
+    def __init__(self, message: str, messages: [str] = ()):
+        self.message = message
+        self.messages = list(messages)
+        super().__init__(f"{message}: {'; '.join(self.messages)}" if self.messages else message)
+
+    def __reduce__(self):
+        # Keep the messages when the error is sent back from a worker process
+        return ConversionError, (self.message, self.messages)
+
+
+def spdx_value(value):
+    """
+    Replace the NOASSERTION, NONE and UNKNOWN values spdx-tools parses by the strings they stand for
+    Every value the payload takes from an SPDX object goes through it, those objects are not JSON serializable
+    :param value: A value of an SPDX object
+    :return: "NOASSERTION", "NONE" or "UNKNOWN" for those values, the value itself otherwise
+    """
+    global _special_types
+    if _special_types is None:
+        from spdx.utils import NoAssert, SPDXNone, UnKnown
+
+        _special_types = (NoAssert, SPDXNone, UnKnown)
+    return value.to_value() if type(value) in _special_types else value
+
+
+class LicenseTable:
+    """
+    Licenses of one document converted to a payload, each distinct license and license expression converted once
+    Every file and snippet under the same license then shares one record (and every equal expression one list)
+    instead of getting its own copy. With shared=True, licenses are instead listed once in entries, to be sent as
+    the licenses table of the asset, and referred to by ID. A license whose ID is already in the table with another
+    name stays inline
+
+    :param shared: Refer to the licenses by ID in the payload and collect them in entries
+    """
+
+    def __init__(self, shared: bool = False):
+        self.shared = shared
+        self.entries = []
+        self._license_type = None
+        self._licenses = {}
+        self._expressions = {}
+        self._ids = set()
+
+    def make(self, license):
+        """
+        Convert a license or a conjunction/disjunction of licenses
+        :param license: SPDX License Object, or NOASSERTION or NONE
+        :return: The License record (or ID) of the license, or for expressions a list of the two converted operands
+        """
+        if self._license_type is None:
+            # Imported on first use, tables filled from SPDX JSON documents never need spdx-tools
+            from spdx.document import License
+
+            self._license_type = License
+        if type(license) != self._license_type and spdx_value(license) is license:
+            key = self._key(license)
+            made = self._expressions.get(key)
+            if made is None:
+                made = self._expressions[key] = [self.make(license.license_1), self.make(license.license_2)]
+            return made
+        return self.leaf(license)
+
+    def leaf(self, license):
+        """
+        Convert a single license, whatever its type
+        :param license: SPDX License Object, or NOASSERTION or NONE
+        :return: The License record (or ID) of the license
+        """
+        value = spdx_value(license)
+        if value is not license:
+            # Named after their ID, as dbom_wrapper.spdxjson does
+            return self.entry(value, value)
+        return self.entry(license.identifier, license.full_name)
+
+    def entry(self, identifier: str, full_name: str):
+        """
+        Convert a single license given by its ID and name
+        :param identifier: SPDX license ID, or LicenseRef
+        :param full_name: Name of the license
+        :return: The License record (or ID) of the license
+        """
+        key = (identifier, full_name)
+        made = self._licenses.get(key)
+        if made is None:
+            made = types.License(identifier, f"http://spdx.org/licenses/{identifier}", full_name)
+            if self.shared and identifier not in self._ids:
+                self._ids.add(identifier)
+                self.entries.append(made)
+                made = identifier
+            self._licenses[key] = made
+        return made
+
+    def _key(self, license):
+        if type(license) == self._license_type:
+            return license.identifier, license.full_name
+        return self._key(license.license_1), self._key(license.license_2)
+
+
+class LicenseResolver:
+    """
+    Licenses of one payload converted back to SPDX License objects, each distinct license and expression once
+    IDs referring to the licenses table of the asset are resolved against it
+
+    :param entries: The licenses table of the asset, if it has one
+    """
+
+    def __init__(self, entries: [dict] = ()):
+        from spdx.document import License, LicenseConjunction
+
+        self._license_type = License
+        self._conjunction_type = LicenseConjunction
+        self._table = {entry["id"]: entry for entry in entries}
+        self._licenses = {}
+        self._expressions = {}
+
+    def parse(self, license):
+        """
+        Convert a license, or a list of two operands, to an SPDX License or LicenseConjunction
+        :param license: A license dict, ID or list as made by LicenseTable.make
+        :return: The SPDX License Object
+        """
+        if type(license) == list:
+            key = self._key(license)
+            parsed = self._expressions.get(key)
+            if parsed is None:
+                parsed = self._expressions[key] = self._conjunction_type(self.parse(license[0]),
+                                                                         self.parse(license[1]))
+            return parsed
+        return self.leaf(license)
+
+    def leaf(self, license):
+        """
+        :param license: A license dict or ID
+        :return: The SPDX License Object
+        """
+        license = self._resolve(license)
+        key = (license["name"], license["id"])
+        parsed = self._licenses.get(key)
+        if parsed is None:
+            parsed = self._licenses[key] = self._license_type(license["name"], license["id"])
+        return parsed
+
+    def _resolve(self, license):
+        if type(license) != str:
+            return license
+        entry = self._table.get(license)
+        if entry is None:
+            raise ConversionError('Invalid asset', [f"License {license} is not in the licenses table of the asset"])
+        return entry
+
+    def _key(self, license):
+        if type(license) == list:
+            return tuple(self._key(operand) for operand in license)
+        license = self._resolve(license)
+        return license["name"], license["id"]
+
+
+class MessageLogger:
+    """
+    spdx-tools parser logger keeping the messages instead of printing them
+    """
+
+    def __init__(self):
+        self.messages = []
+
+    def log(self, msg):
+        self.messages.append(msg)
+
+
+def get_parser():
+    """
+    Return the tag-value parser of the calling thread, building it on first use
+    :return: A built spdx tag-value Parser
+    """
+    parser = getattr(_local, 'parser', None)
+    if parser is None:
+        parser = _local.parser = build_parser()
+    return parser
+
+
+def parse_spdx(text: str) -> 'Document':
+    """
+    Parse a single-package SPDX tag-value document with the parser of the calling thread
+    :param text: The document
+    :return: The SPDX document. Raises ConversionError if the document has errors
+    """
+    p = get_parser()
+    p.logger = logger = MessageLogger()
+    reset_parser(p)
+    document, error = p.parse(text)
+    if error:
+        raise ConversionError('Errors encountered while parsing', logger.messages)
+    return document
+
+
+def convert_spdx_to_payload(source: Union[str, bytes, IO], metrics: Metrics = NO_METRICS,
+                            shared_licenses: bool = False, fast_reader: bool = True, records: bool = False) -> dict:
+    """
+    Convert an SPDX tag-value or JSON document to a DBoM asset payload
+    A document describing several packages is converted to a single asset, as spdx_to_dbom.py does: the
+    first package is the package of the asset and the other ones are listed in its packages
+
+    :param source: The document, as str, UTF-8 bytes or a file object open in text or binary mode.
+        SPDX JSON is recognized by its opening brace and converted by dbom_wrapper.spdxjson
+    :param metrics: Metrics recording the parse and convert stages
+    :param shared_licenses: List the licenses once in the licenses table of the asset and refer to them by ID
+    :param fast_reader: Read tag-value packages with dbom_wrapper.tagreader, the spdx-tools parser then only
+        parses those it gives up on
+    :param records: Keep the records of dbom_wrapper.types in the payload, see create_dbom_asset_payload
+    :return: The asset payload. Raises ConversionError if the document has errors
+    """
+    # Imported here, dbom_wrapper.spdxjson and dbom_wrapper.tagreader build on this module
+    from .spdxjson import convert_spdx_json, load_spdx_json, looks_like_json
+    from .tagreader import read_tag_value
+
+    text = source.read() if hasattr(source, 'read') else source
+    try:
+        if isinstance(text, bytes):
+            metrics.count('input_bytes', len(text))
+            text = text.decode('utf-8')
+        else:
+            metrics.count('input_bytes', len(text.encode('utf-8')))
+        if looks_like_json(text[:256]):
+            with metrics.stage('parse'):
+                document = load_spdx_json(text.encode('utf-8'))
+            return convert_spdx_json(document, shared_licenses, metrics, records)
+        lines = text.splitlines(True)
+        if count_packages(lines) <= 1:
+            sections, relationships = [text], []
+            header = ''
+        else:
+            header, sections, relationships = split_packages(lines)
+        payloads = []
+        parsed = {}
+        for section in sections:
+            read = read_tag_value(header + section, LicenseTable(shared_licenses), parsed, metrics,
+                                  records=True) if fast_reader else None
+            if read is not None:
+                payloads.append(read[1])
+                continue
+            with metrics.stage('parse'):
+                document = parse_spdx(header + section)
+            with metrics.stage('convert'):
+                payloads.append(create_dbom_asset_payload(document, LicenseTable(shared_licenses), records=True))
+        payload = payloads[0] if len(payloads) == 1 else combine_packages(payloads[0], payloads[1:], relationships)
+    except ConversionError:
+        raise
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        # A document the parser accepts with something the conversion does not expect
+        raise ConversionError('Unsupported SPDX document', [f"{type(e).__name__}: {e}"]) from e
+    return payload if records else types.plain(payload)
+
+
+def convert_asset_to_spdx(asset: dict, out: IO[str], metrics: Metrics = NO_METRICS):
+    """
+    Convert a DBoM asset to an SPDX tag-value document
+    :param asset: The asset, as retrieved from the gateway
+    :param out: Text file object the document is written to. Nothing is written if the document is invalid
+    :param metrics: Metrics recording the convert and write stages
+    :return: None. Raises ConversionError if the asset does not make a valid SPDX document
+    """
+    import spdx.writers.tagvalue as tvwriter
+
+    with metrics.stage('convert'):
+        document = create_sbom(asset)
+    try:
+        with metrics.stage('write'):
+            tvwriter.write_document(document, out)
+    except tvwriter.InvalidDocumentError as e:
+        raise ConversionError('Invalid SPDX document', e.args[0]) from e
+
+
+def make_creator_string(creators: []):
+    """
+    Creates a string from the creator information in the SPDX document
+    :param creators: Array of creationinfo objects
+    :return: string equivalent
+    """
+    from spdx.creationinfo import Tool
+
+    creator_list = []
+    for creator in creators:
+        if type(creator) != Tool:
+            creator_list.append(f"{creator.name} <{creator.email}>" if creator.email else creator.name)
+        else:
+            creator_list.append(f"[Using: {creator.name}]")
+    return ', '.join(creator_list)
+
+
+def make_review_list(reviews: ['Review']):
+    """
+    Make the reviews of the asset metadata from the reviews of an SPDX document
+
+    :param reviews: SPDX Review objects
+    :return: List of Review records
+    """
+    return [types.Review(review.reviewer.name, review.review_date_iso_format, review.comment)
+            for review in reviews]
+
+
+def make_pkgref_list(refs: ['ExternalPackageRef']):
+    """
+    Make the external references of the asset metadata from those of an SPDX package
+
+    :param refs: SPDX ExternalPackageRef objects
+    :return: List of dicts with the category, locator, type and, if any, comment of each reference
+    """
+    proc_refs = []
+    for ref in refs:
+        t_dict = {
+            "category": ref.category,
+            "locator": ref.locator,
+            "type": ref.pkg_ext_ref_type
+        }
+        if ref.comment:
+            t_dict["comment"] = ref.comment
+        proc_refs.append(t_dict)
+    return proc_refs
+
+def rec_make_license(license, table: LicenseTable = None):
+    """
+      Make the license dict of a license, or a list for conjunctions and disjunctions of licenses
+
+      :param license: SPDX License Object
+      :param table: LicenseTable of the document, a new one if None
+      :return: Dict (or ID) of the license, or list of the two operands
+      """
+    if table is None:
+      table = LicenseTable()
+    return table.make(license)
+
+def make_license_list(licenses : ['License'], table: LicenseTable = None):
+    """
+      Make the license dicts of a list of licenses
+
+      :param licenses: SPDX License Objects
+      :param table: LicenseTable of the document, a new one if None
+      :return: List of License records (or IDs) of the licenses
+      """
+    if table is None:
+      table = LicenseTable()
+    return [table.leaf(license) for license in licenses]
+
+def make_file(file, table: LicenseTable = None):
+    """
+      Make the metadata of a file
+
+      :param file: SPDX File Object
+      :param table: LicenseTable of the document, a new one if None
+      :return: File record with metadata of the file
+      """
+    if table is None:
+      table = LicenseTable()
+    return types.File(file.name, file.type, file.spdx_id, file.license_comment, table.make(file.conc_lics),
+                      make_license_list(file.licenses_in_file, table), spdx_value(file.copyright), file.comment,
+                      file.chk_sum.value, file.chk_sum.identifier)
+
+def make_files(package, table: LicenseTable = None):
+    """
+      Make the metadata dicts of the files of a package
+
+      :param package: SPDX Package Object
+      :param table: LicenseTable of the document, a new one if None
+      :return: List of File records with metadata of the files
+      """
+    if table is None:
+      table = LicenseTable()
+    files = []
+    for file in package.files:
+      files.append(make_file(file, table))
+    return files
+
+def make_annotation_list(annotations : ['Annotation']):
+    """
+    Make the annotations of the asset metadata from those of an SPDX document
+
+    :param annotations: SPDX Annotation objects
+    :return: List of Annotation records
+    """
+    annotation_list = []
+    for annotation in annotations:
+      annotation_list.append(types.Annotation(
+        annotation.spdx_id, annotation.comment, annotation.annotation_type, annotation.annotation_date_iso_format,
+        annotation.annotator.name, annotation.annotator.email))
+    return annotation_list
+
+def make_snippet(snippet : 'Snippet', table: LicenseTable = None):
+    """
+    Make the metadata of a snippet
+
+    :param snippet: SPDX Snippet object
+    :param table: LicenseTable of the document, a new one if None
+    :return: Snippet record with metadata of the snippet
+    """
+    if table is None:
+      table = LicenseTable()
+    return types.Snippet(snippet.spdx_id, snippet.name, snippet.comment, spdx_value(snippet.copyright),
+                         snippet.license_comment, table.make(snippet.conc_lics),
+                         make_license_list(snippet.licenses_in_snippet, table), snippet.snip_from_file_spdxid)
+
+def make_snippet_list(snippets : ['Snippet'], table: LicenseTable = None):
+    """
+    Make the metadata of the snippets of a document
+
+    :param snippets: SPDX Snippet objects
+    :param table: LicenseTable of the document, a new one if None
+    :return: List of Snippet records
+    """
+    if table is None:
+      table = LicenseTable()
+    snippet_list = []
+    for snippet in snippets:
+      snippet_list.append(make_snippet(snippet, table))
+    return snippet_list
+
+def make_entity(entity):
+    """
+    Split the supplier or originator of a package into its name and email
+
+    :param entity: SPDX Person or Organization, NOASSERTION, or None if the package has none
+    :return: A tuple of the name and the email, None for what is not given as in dbom_wrapper.spdxjson
+    """
+    if entity is None or spdx_value(entity) is not entity:
+        return None, None
+    return entity.name, entity.email
+
+def make_package(package, table: LicenseTable = None):
+    """
+      Make the metadata of a package and its files
+
+      :param package: SPDX Package Object
+      :param table: LicenseTable of the document, a new one if None
+      :return: Package record with metadata of the package
+      """
+    if table is None:
+      table = LicenseTable()
+
+    # The licenses of the package are converted before the ones of its files, which sets their order in a shared table
+    declared = table.make(package.license_declared)
+    concluded = table.make(package.conc_lics)
+    from_files = make_license_list(package.licenses_from_files, table)
+    supplier_name, supplier_email = make_entity(package.supplier)
+    originator_name, originator_email = make_entity(package.originator)
+    return types.Package(
+      package.name, package.spdx_id, package.version, spdx_value(package.download_location), package.summary,
+      package.source_info, package.file_name, supplier_name, supplier_email, originator_name, originator_email,
+      package.check_sum.value, package.check_sum.identifier, package.verif_code, package.description,
+      package.comment, spdx_value(package.cr_text), package.license_comment, declared, concluded, from_files,
+      make_files(package, table))
+
+
+def create_dbom_asset_payload(spdx_document: 'Document', table: LicenseTable = None, records: bool = False):
+    """
+    Creates a payload that the gateway would accept using ONLY package information from spdx_document
+
+    :param spdx_document: An SPDX document object generated by the SPDX Python SDK
+    :param table: LicenseTable of the document, a new one if None. If it is shared, the payload gets its licenses table
+    :param records: Keep the package, files, snippets, annotations, reviews and licenses as the records of
+        dbom_wrapper.types, which take less memory. json.dumps then needs default=types.json_default
+    :return: A valid asset payload for the gateway, plain dicts and lists unless records is set
+    """
+    from dbom_wrapper.types import GatewayAsset
+
+    if table is None:
+        table = LicenseTable()
+    declared = spdx_value(spdx_document.package.license_declared)
+    # The package (with its files) and the snippets come last, so that readers streaming the asset
+    # have the rest of the document, including the licenses table, before the large arrays
+    metadata_dict = {
+        "reviews": make_review_list(spdx_document.reviews),
+        "license": getattr(declared, 'identifier', declared),
+        "extrefs": make_pkgref_list(spdx_document.package.pkg_ext_refs),
+        "id": spdx_document.spdx_id,
+        "namespace": spdx_document.namespace,
+        "comment": spdx_document.comment,
+        "dataLicense": LicenseTable().make(spdx_document.data_license),
+        "annotations": make_annotation_list(spdx_document.annotations),
+    }
+    if table.shared:
+        # Filled while the package and snippets are converted
+        metadata_dict["licenses"] = table.entries
+    metadata_dict["package"] = make_package(spdx_document.package, table)
+    metadata_dict["snippets"] = make_snippet_list(spdx_document.snippet, table)
+
+    package = metadata_dict["package"]
+    payload = GatewayAsset(
+        document_name=spdx_document.name,
+        document_creator=make_creator_string(spdx_document.creation_info.creators),
+        document_created_date=spdx_document.creation_info.created,
+        asset_type="SoftwareComponent",
+        asset_sub_type="BuildArtifact",
+        asset_manufacturer=f"{package.originator_name} [{package.supplier_name}]",
+        asset_description=spdx_document.package.description,
+        asset_model_number=spdx_document.package.version,
+        asset_metadata=metadata_dict,
+        manufacture_signature="NOT SIGNED (DEMO)"
+    )
+    return payload.to_dict() if records else types.plain(payload.to_dict())
+
+
+def combine_packages(payload: dict, others: [dict], relationships):
+    """
+    Merge the payloads of the packages of one document into a single asset payload
+    The first package remains the package of the asset, the other ones are listed in packages
+    :param payload: The asset payload of the first package, made with records=True
+    :param others: The asset payloads of the other packages, made with records=True
+    :param relationships: List of dbom_wrapper.tagvalue.Relationship of the document
+    :return: The combined payload
+    """
+    metadata = payload['assetMetadata']
+    if 'licenses' in metadata:
+        merge_license_tables(metadata['licenses'], [other['assetMetadata'] for other in others])
+    package = metadata.pop('package')
+    snippets = metadata.pop('snippets')
+    metadata["relationships"] = [
+        {"spdxId": r.spdx_id, "relationship": r.relationship, "relatedSpdxId": r.related_id}
+        for r in relationships
+    ]
+    metadata["packages"] = [other['assetMetadata']['package'] for other in others]
+    # Kept last, like in create_dbom_asset_payload
+    metadata["package"] = package
+    metadata["snippets"] = snippets + [snippet for other in others for snippet in other['assetMetadata']['snippets']]
+    return payload
+
+
+def merge_license_tables(table: [dict], others: [dict]):
+    """
+    Merge the licenses tables of the packages of one document into the table of the first package
+    Licenses of the other packages whose ID is in the table with another name are put back inline
+    :param table: The licenses table of the first package, extended in place
+    :param others: The asset metadata of the other packages
+    :return: None
+    """
+    known = {entry["id"]: entry for entry in table}
+    for metadata in others:
+        conflicts = {}
+        for entry in metadata.get('licenses', ()):
+            first = known.setdefault(entry["id"], entry)
+            if first is entry:
+                table.append(entry)
+            elif first != entry:
+                conflicts[entry["id"]] = entry
+        if not conflicts:
+            continue
+
+        def inline(license):
+            if type(license) == str:
+                return conflicts.get(license, license)
+            if type(license) == list:
+                return [inline(operand) for operand in license]
+            return license
+
+        for item in [metadata['package']] + metadata['package']['files'] + metadata['snippets']:
+            item.map_licenses(inline)
+
+
+def parse_creator_string(creator):
+    """
+    Split the documentCreator of an asset, as made by make_creator_string, into its creators
+
+    :param creator: The documentCreator string
+    :return: List of the creator names, in their order, the tool without its [Using: ] wrapper
+    """
+    creators = []
+    creator_list = creator.replace(" ", "").split(',')
+    for c in creator_list:
+        if c[0] != '[':
+            creators.append(c)
+        else:
+            c = c[7:]
+            c = c[:-1]
+            creators.append(c)
+    return creators
+
+def parse_review_list(reviews: []):
+    """
+    Make the SPDX reviews of a document from the reviews of an asset
+
+    :param reviews: The review dicts of the asset metadata
+    :return: List of SPDX Review objects
+    """
+    from spdx.creationinfo import Person
+    from spdx.review import Review
+
+    proc_reviews = []
+    for review in reviews:
+        proc_review = Review()
+        proc_review.reviewer = Person(review['reviewer'],'')
+        proc_review.review_date = parse_datetime(review['reviewDate'])
+        if review.get('comment'):
+          # proc_review.has_comment = True
+          proc_review.comment = review['comment']
+        proc_reviews.append(proc_review)
+    return proc_reviews
+
+def parse_pkgref_list(refs: []):
+    """
+    Make the SPDX external package references from those of an asset
+
+    :param refs: The extrefs dicts of the asset metadata
+    :return: List of SPDX ExternalPackageRef objects
+    """
+    from spdx.package import ExternalPackageRef
+
+    proc_refs = []
+    for ref in refs:
+        proc_ref = ExternalPackageRef()
+        proc_ref.category = ref["category"]
+        proc_ref.locator = ref["locator"]
+        proc_ref.pkg_ext_ref_type = ref["type"]
+        if ref.get("comment"):
+            proc_ref.comment = ref["comment"]
+        proc_refs.append(proc_ref)
+    return proc_refs
+
+def rec_parse_license(license, table: LicenseResolver = None):
+    """
+    Make the SPDX license of a license of an asset
+
+    :param license: A license dict, license ID or list of two operands, see LicenseTable
+    :param table: LicenseResolver of the asset, a new one if None
+    :return: The SPDX License, LicenseConjunction or LicenseDisjunction
+    """
+    if table is None:
+      table = LicenseResolver()
+    return table.parse(license)
+
+def parse_license_list(licenses : [], table: LicenseResolver = None):
+    """
+    Make the SPDX licenses of a list of licenses of an asset
+
+    :param licenses: License dicts or license IDs
+    :param table: LicenseResolver of the asset, a new one if None
+    :return: List of SPDX License objects
+    """
+    if table is None:
+      table = LicenseResolver()
+    return [table.leaf(lic) for lic in licenses]
+
+def parse_license(package, package_dict, table: LicenseResolver = None):
+    """
+    Set the licenses of an SPDX package from the license dict of the package of an asset
+
+    :param package: The SPDX Package object to complete
+    :param package_dict: The license dict of the package: comment, declared, concluded and fromFile
+    :param table: LicenseResolver of the asset, a new one if None
+    :return: The package
+    """
+    if table is None:
+      table = LicenseResolver()
+    package.license_comment = package_dict["comment"]
+    package.license_declared = table.parse(package_dict["declared"])
+    package.conc_lics = table.parse(package_dict["concluded"])
+    package.licenses_from_files = parse_license_list(package_dict["fromFile"], table)
+
+    return package
+
+def parse_license_file(file, package_dict, table: LicenseResolver = None):
+    """
+    Set the licenses of an SPDX file from the license dict of a file of an asset
+
+    :param file: The SPDX File object to complete
+    :param package_dict: The license dict of the file: comment, concluded and fromFile
+    :param table: LicenseResolver of the asset, a new one if None
+    :return: The file
+    """
+    if table is None:
+      table = LicenseResolver()
+    file.license_comment = package_dict["comment"]
+    file.conc_lics = table.parse(package_dict["concluded"])
+    file.licenses_in_file = parse_license_list(package_dict["fromFile"], table)
+
+    return file
+
+def parse_license_snippet(snippet, snippet_dict, table: LicenseResolver = None):
+    """
+    Set the licenses of an SPDX snippet from the license dict of a snippet of an asset
+
+    :param snippet: The SPDX Snippet object to complete
+    :param snippet_dict: The license dict of the snippet: comment, concluded and inSnippet
+    :param table: LicenseResolver of the asset, a new one if None
+    :return: The snippet
+    """
+    if table is None:
+      table = LicenseResolver()
+    snippet.license_comment = snippet_dict["comment"]
+    snippet.conc_lics = table.parse(snippet_dict["concluded"])
+    snippet.licenses_in_snippet = parse_license_list(snippet_dict["inSnippet"], table)
+
+    return snippet
+
+def parse_file(f, table: LicenseResolver = None):
+    """
+    Make an SPDX file from a file of an asset
+
+    :param f: The file dict
+    :param table: LicenseResolver of the asset, a new one if None
+    :return: SPDX File object
+    """
+    from spdx.checksum import Algorithm
+    from spdx.file import File
+
+    file = File(f['name'])
+    file.type = f['type']
+    file.spdx_id = f['id']
+    file = parse_license_file(file, f['license'], table)
+    file.copyright = f['copyright']
+    file.comment = f['comment']
+    file.chk_sum = Algorithm(f["checksumAlgorithm"], f["checksum"])
+    return file
+
+def parse_files(package_dict, table: LicenseResolver = None):
+    """
+    Make the SPDX files of the package of an asset
+
+    :param package_dict: The package dict of the asset metadata
+    :param table: LicenseResolver of the asset, a new one if None
+    :return: Generator of SPDX File objects
+    """
+    if table is None:
+      table = LicenseResolver()
+    for f in package_dict["files"]:
+      yield parse_file(f, table)
+
+def parse_annotation_list(annotations : []):
+    """
+    Make the SPDX annotations of a document from the annotations of an asset
+
+    :param annotations: The annotation dicts of the asset metadata
+    :return: List of SPDX Annotation objects
+    """
+    from spdx.annotation import Annotation
+    from spdx.creationinfo import Person
+
+    annotation_list = []
+    for a in annotations:
+      annotation = Annotation()
+      annotation.spdx_id = a['id']
+      annotation.comment = a['comment']
+      annotation.annotation_type = a['type']
+      annotation.annotation_date = parse_datetime(a['date'])
+      annotation.annotator = Person(a['annotator']['name'], a['annotator']['email'])
+      annotation_list.append(annotation)
+    return annotation_list
+
+def parse_snippet(s, table: LicenseResolver = None):
+    """
+    Make an SPDX snippet from a snippet of an asset
+
+    :param s: The snippet dict
+    :param table: LicenseResolver of the asset, a new one if None
+    :return: SPDX Snippet object
+    """
+    from spdx.snippet import Snippet
+
+    snippet = Snippet()
+    snippet.spdx_id = s['id']
+    snippet.name = s['name']
+    snippet.comment = s['comment']
+    snippet.copyright = s['copyright']
+    snippet.snip_from_file_spdxid = s['fromFileID']
+    snippet = parse_license_snippet(snippet, s['license'], table)
+    return snippet
+
+def parse_snippet_list(snippets : [], table: LicenseResolver = None):
+    """
+    Make the SPDX snippets of a document from the snippets of an asset
+
+    :param snippets: The snippet dicts of the asset metadata
+    :param table: LicenseResolver of the asset, a new one if None
+    :return: Generator of SPDX Snippet objects
+    """
+    if table is None:
+      table = LicenseResolver()
+    for s in snippets:
+      yield parse_snippet(s, table)
+
+def parse_package(package_dict, table: LicenseResolver = None):
+    """
+    Make the SPDX package, with its files and licenses, from the package of an asset
+
+    :param package_dict: The package dict of the asset metadata
+    :param table: LicenseResolver of the asset, a new one if None
+    :return: SPDX Package object
+    """
+    from spdx.checksum import Algorithm
+    from spdx.creationinfo import Organization
+    from spdx.package import Package
+
+    package = Package()
+    package.name = package_dict["name"] 
+    package.spdx_id = package_dict["id"]
+    package.version = package_dict["version"]
+    package.download_location = package_dict["downloadLocation"]
+    package.summary = package_dict["summary"]
+    package.source_info = package_dict["sourceInfo"]
+    package.file_name = package_dict["fileName"]
+    package.supplier =  Organization( package_dict["supplierName"], package_dict["supplierEmail"])
+    package.originator =  Organization( package_dict["originatorName"], package_dict["originatorEmail"])
+    package.check_sum = Algorithm( package_dict["checksumAlgorithm"],package_dict["checksum"])
+    package.files = list(parse_files(package_dict, table))
+    package.verif_code = package_dict["verificationCode"]
+    package.description = package_dict["description"]
+    package.comment = package_dict["comment"]
+    package.cr_text = package_dict["copyright"]
+    package = parse_license(package, package_dict["license"], table)
+    return package
+
+def create_sbom(asset, check: bool = True):
+    """
+    Make the SPDX document an asset was converted from, the inverse of create_dbom_asset_payload
+
+    :param asset: The asset, as retrieved from the gateway
+    :param check: Validate the whole asset first, see dbom_wrapper.schema
+    :return: The SPDX Document object. Raises ConversionError listing every problem of an invalid asset
+    """
+    from spdx.creationinfo import CreationInfo, Organization, Person, Tool
+    from spdx.document import Document
+    from dbom_wrapper.types import GatewayAsset
+
+    if check:
+        GatewayAsset.from_dict(asset)
+    document = Document()
+    table = LicenseResolver(asset['assetMetadata'].get('licenses', ()))
+    creator = parse_creator_string(asset['documentCreator'])
+    document.creation_info = CreationInfo()
+    document.creation_info.created = parse_datetime(asset['documentCreatedDate'])
+    document.creation_info.creators.append(Person( name= creator[0], email= ''))
+    document.creation_info.creators.append(Organization( name= creator[1], email= ''))
+    document.creation_info.creators.append(Tool (name= creator[2]))
+    document.reviews = parse_review_list(asset['assetMetadata']['reviews'])
+    document.package = parse_package(asset['assetMetadata']['package'], table)
+    document.annotations = parse_annotation_list(asset['assetMetadata']['annotations'])
+    document.snippet = list(parse_snippet_list(asset['assetMetadata']['snippets'], table))
+    document.package.pkg_ext_refs = parse_pkgref_list(asset['assetMetadata']['extrefs'])
+
+    document.version = 'SPDX-2.1'
+    document.data_license = table.parse(asset['assetMetadata']['dataLicense'])
+    document.name = asset['documentName']
+    document.spdx_id = asset['assetMetadata']['id']
+    document.namespace = asset['assetMetadata']['namespace']
+    document.comment = asset['assetMetadata']['comment']
+    return document
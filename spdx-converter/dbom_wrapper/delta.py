@@ -0,0 +1,127 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Structural diff of asset payloads, to tell what changed between a stored asset and a new conversion
+"""
+
+import json
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Iterator, List
+
+from .types import Record, json_default
+
+# Arrays whose items are matched by their SPDX ID, other arrays are compared as unordered collections
+KEYED_ARRAYS = {
+    ('assetMetadata', 'package', 'files'): 'id',
+    ('assetMetadata', 'snippets'): 'id',
+}
+
+
+@dataclass(frozen=True)
+class Change:
+    """
+    A difference between two assets
+
+    :param kind: 'added', 'removed' or 'changed'
+    :param path: Location of the value, e.g. assetMetadata.package.files[SPDXRef-File1].checksum
+    :param old: The value in the stored asset, None if added
+    :param new: The value in the new asset, None if removed
+    """
+    kind: str
+    path: str
+    old: Any = None
+    new: Any = None
+
+    def __str__(self):
+        if self.kind == 'changed':
+            return f"changed {self.path}: {_short(self.old)} -> {_short(self.new)}"
+        value = self.new if self.kind == 'added' else self.old
+        # Files and snippets are named by their path
+        return f"{self.kind} {self.path}" + ('' if self.path.endswith(']') else f": {_short(value)}")
+
+
+def diff_assets(old: dict, new: dict) -> List[Change]:
+    """
+    Compute the changes turning the old asset into the new one
+    Files and snippets are matched by SPDX ID and compared field by field. Other arrays (reviews,
+    annotations, references, licenses...) are compared regardless of the order of their items
+
+    :param old: The stored asset
+    :param new: The new asset payload. Arrays may be any iterable, such as the SpooledArray of streamed payloads,
+        and objects records of dbom_wrapper.types
+    :return: List of Change, empty if the assets are equivalent
+    """
+    return list(_diff(old, new, ()))
+
+
+def _diff(old, new, path) -> Iterator[Change]:
+    if isinstance(old, (dict, Record)) and isinstance(new, (dict, Record)):
+        for key, value in new.items():
+            if key not in old:
+                yield Change('added', _path(path + (key,)), new=value)
+            else:
+                yield from _diff(old[key], value, path + (key,))
+        for key in old.keys() - new.keys():
+            yield Change('removed', _path(path + (key,)), old=old[key])
+    elif isinstance(old, list) and _is_array(new):
+        key = KEYED_ARRAYS.get(tuple(k for k in path if not k.startswith('[')))
+        if key is not None:
+            yield from _diff_keyed(old, new, path, key)
+        else:
+            yield from _diff_unordered(old, list(new), path)
+    elif old != new:
+        yield Change('changed', _path(path), old, new)
+
+
+def _diff_keyed(old, new, path, key):
+    remaining = {item.get(key): item for item in old}
+    for item in new:
+        previous = remaining.pop(item.get(key), None)
+        item_path = path + (f"[{item.get(key)}]",)
+        if previous is None:
+            yield Change('added', _path(item_path), new=item)
+        else:
+            yield from _diff(previous, item, item_path)
+    for item_id, item in remaining.items():
+        yield Change('removed', _path(path + (f"[{item_id}]",)), old=item)
+
+
+def _diff_unordered(old, new, path):
+    old_items = Counter(_canonical(item) for item in old)
+    new_items = Counter(_canonical(item) for item in new)
+    for item in (old_items - new_items).elements():
+        yield Change('removed', _path(path), old=json.loads(item))
+    for item in (new_items - old_items).elements():
+        yield Change('added', _path(path), new=json.loads(item))
+
+
+def _is_array(value):
+    return isinstance(value, list) or (hasattr(value, '__iter__') and not isinstance(value, (str, bytes, dict, Record)))
+
+
+def _canonical(value):
+    return json.dumps(value, sort_keys=True, default=json_default)
+
+
+def _path(path):
+    return '.'.join(path).replace('.[', '[')
+
+
+def _short(value, limit=60):
+    text = json.dumps(value, default=json_default)
+    return text if len(text) <= limit else text[:limit - 3] + '...'
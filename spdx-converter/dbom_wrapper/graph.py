@@ -0,0 +1,182 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Dependency graph of the assets converted from a multi-package document, and a scheduler pushing it to
+the gateway children first
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+from .api import AssetResult, DbomException
+
+# SPDX relationships where the element is the parent of the related element
+CHILD_RELATIONSHIPS = frozenset({
+    'CONTAINS', 'DEPENDS_ON', 'HAS_PREREQUISITE', 'DYNAMIC_LINK', 'STATIC_LINK',
+})
+# SPDX relationships where the element is the child of the related element
+PARENT_RELATIONSHIPS = frozenset({
+    'CONTAINED_BY', 'DEPENDENCY_OF', 'PREREQUISITE_FOR', 'BUILD_DEPENDENCY_OF', 'DEV_DEPENDENCY_OF',
+    'OPTIONAL_DEPENDENCY_OF', 'PROVIDED_DEPENDENCY_OF', 'RUNTIME_DEPENDENCY_OF', 'TEST_DEPENDENCY_OF',
+})
+
+
+class DependencyError(DbomException):
+    """
+    An asset was not pushed because one of its sub-assets could not be
+    """
+
+    def __init__(self, asset_id, child_id):
+        self.asset_id = asset_id
+        self.child_id = child_id
+        self.message = f"Sub-asset {child_id} of {asset_id} was not pushed"
+        super().__init__(self.message)
+
+
+@dataclass
+class AssetNode:
+    """
+    An asset of the graph
+
+    :param asset_id: The asset ID
+    :param payload: The asset payload
+    :param children: IDs of the sub-assets, with the relationship linking each of them
+    """
+    asset_id: str
+    payload: dict
+    children: Dict[str, str] = field(default_factory=dict)
+
+
+class AssetGraph:
+    """
+    Directed acyclic graph of assets, an edge goes from an asset to each of its sub-assets
+    """
+
+    def __init__(self):
+        self.nodes: Dict[str, AssetNode] = {}
+
+    def add(self, asset_id: str, payload: dict) -> AssetNode:
+        node = self.nodes[asset_id] = AssetNode(asset_id, payload)
+        return node
+
+    def link(self, parent_id: str, child_id: str, relationship: str):
+        """
+        Make child_id a sub-asset of parent_id
+        """
+        if parent_id == child_id:
+            raise ValueError(f"Asset {parent_id} cannot be its own sub-asset")
+        self.nodes[parent_id].children[child_id] = relationship
+
+    def link_relationships(self, relationships: Iterable, asset_ids: Dict[str, str]):
+        """
+        Add the edges described by SPDX relationships
+        Relationships that do not express a parent/child link, or that involve elements other than the
+        packages of the graph, are ignored
+
+        :param relationships: Iterable of dbom_wrapper.tagvalue.Relationship
+        :param asset_ids: Mapping of the SPDX IDs of the packages to their asset IDs
+        """
+        for relationship in relationships:
+            element = asset_ids.get(relationship.spdx_id)
+            related = asset_ids.get(relationship.related_id)
+            if element is None or related is None:
+                continue
+            if relationship.relationship in CHILD_RELATIONSHIPS:
+                self.link(element, related, relationship.relationship)
+            elif relationship.relationship in PARENT_RELATIONSHIPS:
+                self.link(related, element, relationship.relationship)
+
+    def parents(self) -> Dict[str, List[str]]:
+        """
+        :return: Mapping of each asset ID to the IDs of the assets it is a sub-asset of
+        """
+        parents = {asset_id: [] for asset_id in self.nodes}
+        for node in self.nodes.values():
+            for child_id in node.children:
+                parents[child_id].append(node.asset_id)
+        return parents
+
+    def order(self) -> List[str]:
+        """
+        Order the assets children first
+        :return: List of asset IDs where every asset comes after its sub-assets
+        """
+        remaining = {asset_id: len(node.children) for asset_id, node in self.nodes.items()}
+        parents = self.parents()
+        ready = [asset_id for asset_id, count in remaining.items() if not count]
+        order = []
+        while ready:
+            asset_id = ready.pop()
+            order.append(asset_id)
+            for parent_id in parents[asset_id]:
+                remaining[parent_id] -= 1
+                if not remaining[parent_id]:
+                    ready.append(parent_id)
+        if len(order) != len(self.nodes):
+            cycle = sorted(asset_id for asset_id, count in remaining.items() if count)
+            raise ValueError(f"Dependency cycle between assets {', '.join(cycle)}")
+        return order
+
+
+def push_graph(graph: AssetGraph, push: Callable[[AssetNode], Optional[int]], parallelism: int = 10
+               ) -> Dict[str, AssetResult]:
+    """
+    Push the assets of a graph, sub-assets before the assets they belong to
+    An asset is pushed as soon as all its sub-assets are, up to parallelism assets at a time. When an asset
+    fails, the assets depending on it are not pushed and fail with a DependencyError
+
+    :param graph: The AssetGraph to push
+    :param push: Function sending one node to the gateway, returning the HTTP status
+    :param parallelism: Maximum number of assets pushed at the same time
+    :return: Mapping of every asset ID to its AssetResult
+    """
+    graph.order()
+    remaining = {asset_id: len(node.children) for asset_id, node in graph.nodes.items()}
+    parents = graph.parents()
+    results = {}
+
+    def run(node):
+        try:
+            return AssetResult(node.asset_id, push(node))
+        except DbomException as e:
+            return AssetResult(node.asset_id, getattr(e, 'status_code', None), e)
+        except Exception as e:
+            return AssetResult(node.asset_id, error=e)
+
+    def fail_parents(asset_id):
+        for parent_id in parents[asset_id]:
+            if parent_id not in results:
+                results[parent_id] = AssetResult(parent_id, error=DependencyError(parent_id, asset_id))
+                fail_parents(parent_id)
+
+    with ThreadPoolExecutor(max_workers=max(1, parallelism)) as pool:
+        running = {pool.submit(run, graph.nodes[asset_id])
+                   for asset_id, count in remaining.items() if not count}
+        while running:
+            done, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                results[result.asset_id] = result
+                if not result.success:
+                    fail_parents(result.asset_id)
+                    continue
+                for parent_id in parents[result.asset_id]:
+                    remaining[parent_id] -= 1
+                    if not remaining[parent_id] and parent_id not in results:
+                        running.add(pool.submit(run, graph.nodes[parent_id]))
+    return results
@@ -0,0 +1,283 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Incremental JSON encoding and decoding of payloads whose large arrays are produced lazily or spooled to disk
+Payloads may hold the records of dbom_wrapper.types wherever they hold dicts
+"""
+
+import codecs
+import json
+import tempfile
+from typing import Any, Iterable, Iterator, Tuple
+
+from .types import Record, json_default
+
+
+class SpooledArray:
+    """
+    Array of JSON values kept in a temporary file instead of memory
+    Items are stored as one JSON document per line. Iterating yields the decoded items,
+    iter_json yields their encoded form without decoding them
+    """
+
+    def __init__(self):
+        self._file = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+        self._length = 0
+
+    def append(self, item):
+        self._file.write(json.dumps(item, default=json_default))
+        self._file.write('\n')
+        self._length += 1
+
+    def __len__(self):
+        return self._length
+
+    def iter_json(self) -> Iterator[str]:
+        self._file.flush()
+        self._file.seek(0)
+        for line in self._file:
+            yield line[:-1]
+        self._file.seek(0, 2)
+
+    def __iter__(self):
+        return (json.loads(item) for item in self.iter_json())
+
+    def close(self):
+        self._file.close()
+
+
+def iterencode(obj: Any, indent: int = None, _level: int = 0) -> Iterator[str]:
+    """
+    Encode obj to JSON, piece by piece
+    Dicts and records are walked key by key, and iterables that are not lists or tuples (generators,
+    SpooledArray...) are encoded as arrays item by item without being materialized, as are lists of records
+    (the files of a package). Any other value, including other lists, is encoded in one go by json.dumps
+
+    :param obj: The value to encode
+    :param indent: Same as the indent argument of json.dumps
+    :return: Generator of str chunks that concatenate to the JSON document
+    """
+    if isinstance(indent, bool):
+        indent = int(indent)
+    newline, item_separator = _separators(indent, _level + 1)
+    if isinstance(obj, (dict, Record)):
+        if not obj:
+            yield '{}'
+            return
+        yield '{' + newline
+        first = True
+        for key, value in obj.items():
+            if not first:
+                yield item_separator
+            first = False
+            yield json.dumps(str(key)) + ': '
+            yield from iterencode(value, indent, _level + 1)
+        yield _separators(indent, _level)[0] + '}'
+    elif hasattr(obj, 'iter_json'):
+        yield from _encode_items(obj.iter_json(), newline, item_separator, _separators(indent, _level)[0],
+                                 lambda item: item if indent is None else _dumps(json.loads(item), indent, newline))
+    elif (hasattr(obj, '__iter__') and not isinstance(obj, (str, bytes, list, tuple))
+          or type(obj) is list and obj and isinstance(obj[0], Record)):
+        yield from _encode_items(obj, newline, item_separator, _separators(indent, _level)[0],
+                                 lambda item: _dumps(item, indent, newline))
+    else:
+        yield _dumps(obj, indent, _separators(indent, _level)[0])
+
+
+def iter_bytes(obj: Any, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Encode obj to UTF-8 JSON in chunks of about chunk_size bytes, suitable as a streamed request body
+    :param obj: The value to encode, see iterencode
+    :param chunk_size: Size above which the encoded pieces are flushed as a chunk
+    :return: Generator of bytes chunks
+    """
+    buffer = []
+    size = 0
+    for piece in iterencode(obj):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def _encode_items(items, newline, item_separator, closing_newline, encode):
+    first = True
+    for item in items:
+        if first:
+            yield '[' + newline
+            first = False
+        else:
+            yield item_separator
+        yield encode(item)
+    yield '[]' if first else closing_newline + ']'
+
+
+def _dumps(obj, indent, newline):
+    """
+    json.dumps for a value nested at the indentation given by newline
+    """
+    if indent is None:
+        return json.dumps(obj, default=json_default)
+    return json.dumps(obj, indent=indent, default=json_default).replace('\n', newline)
+
+
+def _separators(indent, level):
+    """
+    Newline plus indentation for a nesting level, and the separator between items at that level
+    """
+    if indent is None:
+        return '', ', '
+    newline = '\n' + ' ' * (indent * level)
+    return newline, ',' + newline
+
+
+class JSONReader:
+    """
+    Incremental JSON reader for documents with a few very large arrays
+    The arrays at stream_paths are handed out item by item by events() and are left empty in document.
+    Every other value is decoded whole. Objects on the way to a streamed array are attached to document
+    as soon as they are entered, so document shows how far the reader got
+
+    :param chunks: Iterable of bytes (or str) chunks, e.g. response.iter_content()
+    :param stream_paths: Paths of the arrays to stream, as tuples of keys
+    """
+
+    def __init__(self, chunks: Iterable, stream_paths: Iterable[Tuple[str, ...]]):
+        self.document = None
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._stream_paths = set(stream_paths)
+        self._walk_paths = {path[:i] for path in self._stream_paths for i in range(len(path))}
+
+    def events(self) -> Iterator[Tuple[Tuple[str, ...], Any]]:
+        """
+        Read the whole document
+        :return: Generator of (path, item) tuples for every item of the streamed arrays
+        """
+        holder = {}
+        yield from self._walk((), holder, None)
+        self._skip_whitespace()
+        if self._pos < len(self._buffer):
+            raise self._error('Extra data')
+
+    def _walk(self, path, parent, key):
+        self._skip_whitespace()
+        char = self._peek()
+        if path in self._stream_paths and char == '[':
+            self._set(parent, key, [])
+            self._pos += 1
+            if self._next_token() == ']':
+                self._pos += 1
+                return
+            while True:
+                yield path, self._value()
+                token = self._next_token()
+                self._pos += 1
+                if token == ']':
+                    return
+                if token != ',':
+                    raise self._error("Expecting ',' delimiter")
+        elif path in self._walk_paths and char == '{':
+            obj = {}
+            self._set(parent, key, obj)
+            self._pos += 1
+            if self._next_token() == '}':
+                self._pos += 1
+                return
+            while True:
+                if self._next_token() != '"':
+                    raise self._error('Expecting property name enclosed in double quotes')
+                name = self._value()
+                if self._next_token() != ':':
+                    raise self._error("Expecting ':' delimiter")
+                self._pos += 1
+                yield from self._walk(path + (name,), obj, name)
+                token = self._next_token()
+                self._pos += 1
+                if token == '}':
+                    return
+                if token != ',':
+                    raise self._error("Expecting ',' delimiter")
+        else:
+            self._set(parent, key, self._value())
+
+    def _set(self, parent, key, value):
+        if key is None:
+            self.document = value
+        else:
+            parent[key] = value
+
+    def _value(self):
+        """
+        Decode the value at the current position, reading more input until it is complete
+        """
+        while True:
+            self._skip_whitespace()
+            try:
+                value, end = self._json.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+                self._fill()
+                continue
+            # A number cut by the end of the buffer (e.g. "12." of "12.5") may continue in the next chunk
+            if not self._eof and (end == len(self._buffer) or self._buffer[end] not in ' \t\n\r,]}:'):
+                self._fill()
+                continue
+            self._pos = end
+            return value
+
+    def _next_token(self) -> str:
+        self._skip_whitespace()
+        return self._peek()
+
+    def _peek(self) -> str:
+        while self._pos >= len(self._buffer):
+            if self._eof:
+                raise self._error('Unexpected end of document')
+            self._fill()
+        return self._buffer[self._pos]
+
+    def _skip_whitespace(self):
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in ' \t\n\r':
+                self._pos += 1
+            if self._pos < len(self._buffer) or self._eof:
+                return
+            self._fill()
+
+    def _fill(self):
+        # Drop what was consumed so the buffer only holds the value being decoded
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            self._buffer += self._decoder.decode(b'', final=True)
+        else:
+            self._buffer += self._decoder.decode(chunk) if isinstance(chunk, bytes) else chunk
+
+    def _error(self, message):
+        return json.JSONDecodeError(message, self._buffer, self._pos)
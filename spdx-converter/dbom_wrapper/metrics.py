@@ -0,0 +1,282 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Timing of the stages of a conversion (parse, convert, serialize, upload, retrieve, write) and counters of
+bytes and retries, reported as a JSON summary, in the Prometheus text format or to statsd
+Work done in worker processes is measured there with measured() and merged into the Metrics of the run
+"""
+
+import contextlib
+import json
+import socket
+import sys
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Dict, Iterable, Iterator, Optional
+
+# Stages whose timing is reported even when they did not run, so that dashboards always get the series
+STAGES = ('parse', 'convert', 'serialize', 'upload', 'retrieve', 'write')
+
+
+@dataclass
+class StageTiming:
+    """
+    Time spent in a stage
+
+    :param count: Number of times the stage ran
+    :param seconds: Total duration. Stages running on several threads at once add up to more than the wall time
+    :param max_seconds: Longest single run
+    """
+    count: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+
+
+class Metrics:
+    """
+    Stage timings and counters of a run. Safe to use from several threads
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, StageTiming] = {}
+        self.counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """
+        Time the with block as a run of the stage name
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            timing = self.stages.setdefault(name, StageTiming())
+            timing.count += 1
+            timing.seconds += seconds
+            timing.max_seconds = max(timing.max_seconds, seconds)
+
+    def count(self, name: str, value: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def counted(self, chunks: Iterable[bytes], counter: str, stage: str = None, spent: float = 0.0
+                ) -> Iterator[bytes]:
+        """
+        Count the bytes of chunks as they are consumed
+        :param chunks: Iterable of bytes, typically a request body being encoded or a response body being read
+        :param counter: Counter the sizes are added to
+        :param stage: Stage the time spent producing the chunks is recorded in, if any. The time the consumer
+            spends between chunks is not
+        :param spent: Time already spent in the stage, e.g. waiting for the response headers
+        :return: Generator of the chunks
+        """
+        iterator = iter(chunks)
+        size = 0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    spent += time.perf_counter() - start
+                size += len(chunk)
+                yield chunk
+        finally:
+            self.count(counter, size)
+            if stage is not None:
+                self.record(stage, spent)
+
+    def merge(self, summary: dict):
+        """
+        Add the stages and counters of a summary, typically measured in a worker process
+        :param summary: A dict returned by summary()
+        """
+        with self._lock:
+            for name, values in summary.get('stages', {}).items():
+                timing = self.stages.setdefault(name, StageTiming())
+                timing.count += values['count']
+                timing.seconds += values['seconds']
+                timing.max_seconds = max(timing.max_seconds, values['max_seconds'])
+            for name, value in summary.get('counters', {}).items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self) -> dict:
+        """
+        :return: JSON-serializable dict of the wall time, the stage timings and the counters
+        """
+        with self._lock:
+            stages = {name: asdict(timing) for name, timing in self.stages.items()}
+            counters = dict(self.counters)
+        return {'wall_seconds': time.perf_counter() - self.started, 'stages': stages, 'counters': counters}
+
+    def transfer_report(self) -> Optional[str]:
+        """
+        Describe what compressing the gateway transfers saved, from the bytes_* counters (bytes on the wire)
+        and the uncompressed_bytes_* ones (JSON bodies)
+        :return: One line per direction in which something was compressed, None if nothing was
+        """
+        with self._lock:
+            counters = dict(self.counters)
+        lines = []
+        for direction in ('sent', 'received'):
+            wire = counters.get(f"bytes_{direction}", 0)
+            body = counters.get(f"uncompressed_bytes_{direction}", 0)
+            if body and wire != body:
+                lines.append(f"Gateway bytes {direction}: {wire} for {body} bytes of JSON "
+                             f"({body - wire} bytes, {1 - wire / body:.0%} saved by compression)")
+        return '\n'.join(lines) or None
+
+    def prometheus(self, prefix: str = 'dbom_converter') -> str:
+        """
+        Render the metrics in the Prometheus text exposition format
+        :param prefix: Prefix of the metric names
+        :return: The text, to serve on /metrics or to drop in a node exporter textfile directory
+        """
+        summary = self.summary()
+        stages = dict.fromkeys(STAGES, {'count': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+        stages.update(summary['stages'])
+        lines = [f"# HELP {prefix}_stage_seconds_total Time spent in each conversion stage",
+                 f"# TYPE {prefix}_stage_seconds_total counter"]
+        lines += [f'{prefix}_stage_seconds_total{{stage="{name}"}} {values["seconds"]:.6f}'
+                  for name, values in stages.items()]
+        lines += [f"# HELP {prefix}_stage_runs_total Number of runs of each conversion stage",
+                  f"# TYPE {prefix}_stage_runs_total counter"]
+        lines += [f'{prefix}_stage_runs_total{{stage="{name}"}} {values["count"]}' for name, values in stages.items()]
+        lines += [f"# HELP {prefix}_stage_max_seconds Longest run of each conversion stage",
+                  f"# TYPE {prefix}_stage_max_seconds gauge"]
+        lines += [f'{prefix}_stage_max_seconds{{stage="{name}"}} {values["max_seconds"]:.6f}'
+                  for name, values in stages.items()]
+        for name, value in sorted(summary['counters'].items()):
+            lines += [f"# TYPE {prefix}_{name}_total counter", f"{prefix}_{name}_total {value}"]
+        lines += [f"# TYPE {prefix}_wall_seconds gauge", f"{prefix}_wall_seconds {summary['wall_seconds']:.6f}"]
+        return '\n'.join(lines) + '\n'
+
+    def send_statsd(self, address: str, prefix: str = 'dbom_converter'):
+        """
+        Send the metrics to a statsd daemon over UDP: stage durations as timers in milliseconds, counters as counts
+        :param address: host:port of the daemon
+        :param prefix: Prefix of the metric names
+        """
+        host, _, port = address.rpartition(':')
+        summary = self.summary()
+        lines = [f"{prefix}.wall:{summary['wall_seconds'] * 1000:.3f}|ms"]
+        for name, values in summary['stages'].items():
+            lines.append(f"{prefix}.stage.{name}:{values['seconds'] * 1000:.3f}|ms")
+            lines.append(f"{prefix}.stage.{name}.runs:{values['count']}|c")
+        lines += [f"{prefix}.{name}:{value}|c" for name, value in summary['counters'].items()]
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+            # One metric per datagram keeps every packet under the MTU
+            for line in lines:
+                s.sendto(line.encode('utf-8'), (host or '127.0.0.1', int(port)))
+
+    def report(self, args):
+        """
+        Output the metrics as asked by the options added by add_arguments, and what compression saved if anything
+        was compressed. Failing to reach statsd is reported but does not fail the run
+        """
+        savings = self.transfer_report()
+        if savings:
+            print(savings)
+        if args.metrics:
+            text = self.prometheus() if args.metrics_format == 'prometheus' \
+                else json.dumps(self.summary(), indent=2) + '\n'
+            if args.metrics == '-':
+                sys.stderr.write(text)
+            else:
+                with open(args.metrics, 'w') as f:
+                    f.write(text)
+        if args.statsd:
+            try:
+                self.send_statsd(args.statsd)
+            except (OSError, ValueError) as e:
+                print(f"Could not send the metrics to statsd at {args.statsd}: {e}", file=sys.stderr)
+
+    @staticmethod
+    def add_arguments(parser):
+        """
+        Add the command line options reporting Metrics and profiling the run to an argparse parser
+        """
+        parser.add_argument('--metrics', type=str,
+                            help='Write the time spent in each stage and the byte and retry counts to this file, '
+                                 '"-" for stderr')
+        parser.add_argument('--metrics-format', choices=['json', 'prometheus'], default='json',
+                            help='Format of --metrics: a JSON summary or the Prometheus text format')
+        parser.add_argument('--statsd', type=str, help='Also send the metrics to the statsd daemon at host:port')
+        parser.add_argument('--profile', type=str,
+                            help='Profile the run with cProfile and dump the statistics to this file, to inspect '
+                                 'with pstats or snakeviz')
+
+
+class NullMetrics(Metrics):
+    """
+    Metrics recording nothing, for callers that do not collect any
+    """
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        yield
+
+    def record(self, name: str, seconds: float):
+        pass
+
+    def count(self, name: str, value: int = 1):
+        pass
+
+    def counted(self, chunks: Iterable[bytes], counter: str, stage: str = None, spent: float = 0.0
+                ) -> Iterator[bytes]:
+        return iter(chunks)
+
+
+NO_METRICS = NullMetrics()
+
+
+def measured(fn, *args):
+    """
+    Call fn(*args, metrics=...) with new Metrics. Submitted to worker processes so that the work they do is
+    measured where it runs
+    :return: A tuple of the result of fn and the summary of the metrics, to merge into the Metrics of the run
+    """
+    metrics = Metrics()
+    return fn(*args, metrics=metrics), metrics.summary()
+
+
+@contextlib.contextmanager
+def profiled(path: str = None):
+    """
+    Profile the with block with cProfile and dump the statistics to path. Does nothing when path is None
+    """
+    if not path:
+        yield
+        return
+    import cProfile
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
@@ -0,0 +1,174 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Retry policy for gateway calls: exponential backoff with jitter, Retry-After and deadlines
+"""
+
+import http
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import FrozenSet, Optional
+
+RETRY_STATUSES = frozenset({
+    http.HTTPStatus.TOO_MANY_REQUESTS,
+    http.HTTPStatus.INTERNAL_SERVER_ERROR,
+    http.HTTPStatus.BAD_GATEWAY,
+    http.HTTPStatus.SERVICE_UNAVAILABLE,
+    http.HTTPStatus.GATEWAY_TIMEOUT,
+})
+
+# Statuses for which the gateway tells us it did not process the request, so a POST can be resent blindly
+NOT_PROCESSED_STATUSES = frozenset({http.HTTPStatus.TOO_MANY_REQUESTS})
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header
+    :param value: The header value, either a number of seconds or an HTTP date
+    :return: The number of seconds to wait, or None if the header is missing or malformed
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    # Only HTTP dates need it, and it is slow to import for the command line scripts
+    import email.utils
+
+    try:
+        date = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return max(0.0, (date - datetime.now(timezone.utc)).total_seconds())
+
+
+@dataclass
+class RetryPolicy:
+    """
+    How gateway calls are retried
+
+    :param max_attempts: Number of attempts per call, including the first one
+    :param backoff: Base delay in seconds, doubled on every attempt
+    :param max_backoff: Upper bound of a single delay in seconds
+    :param jitter: Randomize delays ("full jitter") so that clients do not retry in lockstep
+    :param timeout: Timeout in seconds of a single request
+    :param deadline: Time budget in seconds of a call including all its retries, None for no limit
+    :param retry_statuses: HTTP statuses that are retried
+    """
+    max_attempts: int = 5
+    backoff: float = 0.5
+    max_backoff: float = 30.0
+    jitter: bool = True
+    timeout: float = 30.0
+    deadline: Optional[float] = None
+    retry_statuses: FrozenSet[int] = field(default=RETRY_STATUSES)
+
+    def should_retry(self, status_code: int) -> bool:
+        return status_code in self.retry_statuses
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Delay before the next attempt
+        :param attempt: Number of the attempt that just failed, starting at 1
+        :param retry_after: Delay requested by the gateway through Retry-After, if any
+        :return: Seconds to wait
+        """
+        delay = min(self.max_backoff, self.backoff * (2 ** (attempt - 1)))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    def start(self) -> 'RetryState':
+        return RetryState(self)
+
+    @staticmethod
+    def add_arguments(parser):
+        """
+        Add the command line options configuring a RetryPolicy to an argparse parser
+        """
+        defaults = RetryPolicy()
+        parser.add_argument('--timeout', type=float, default=defaults.timeout,
+                            help='Timeout in seconds of a single gateway request')
+        parser.add_argument('--retries', type=int, default=defaults.max_attempts,
+                            help='Number of attempts per gateway call, including the first one')
+        parser.add_argument('--backoff', type=float, default=defaults.backoff,
+                            help='Base delay in seconds between attempts, doubled on every attempt')
+        parser.add_argument('--deadline', type=float, default=defaults.deadline,
+                            help='Time budget in seconds of a gateway call including all its retries')
+
+    @staticmethod
+    def from_args(args) -> 'RetryPolicy':
+        """
+        Build a RetryPolicy from the options added by add_arguments
+        """
+        return RetryPolicy(max_attempts=max(1, args.retries), backoff=args.backoff, timeout=args.timeout,
+                           deadline=args.deadline)
+
+
+class RetryState:
+    """
+    Book-keeping of the attempts of one call
+    """
+
+    def __init__(self, policy: RetryPolicy):
+        self.policy = policy
+        self.attempt = 0
+        self.started = time.monotonic()
+
+    def remaining(self) -> Optional[float]:
+        if self.policy.deadline is None:
+            return None
+        return self.policy.deadline - (time.monotonic() - self.started)
+
+    def expired(self) -> bool:
+        """
+        Whether the deadline has passed, no request may be sent then
+        """
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def timeout(self, timeout: Optional[float] = None) -> float:
+        """
+        Timeout of the next request, shortened so that it does not overrun the deadline
+        Only valid while the deadline has not passed, see expired
+        :param timeout: Overrides the timeout of the policy for this call
+        """
+        timeout = self.policy.timeout if timeout is None else timeout
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        # requests rejects a timeout of zero, which the deadline can reach between expired and this call
+        return max(0.001, min(timeout, remaining))
+
+    def next_delay(self, retry_after: Optional[float] = None) -> Optional[float]:
+        """
+        Delay before the next attempt
+        :return: Seconds to wait, or None if the call should not be attempted again
+        """
+        if self.attempt >= self.policy.max_attempts:
+            return None
+        delay = self.policy.delay(self.attempt, retry_after)
+        remaining = self.remaining()
+        if remaining is not None and delay >= remaining:
+            return None
+        return delay
@@ -0,0 +1,357 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Schema of DBoM assets and its compiled validators
+A schema is described with the nodes below. compile_schema generates the source of a Python function checking a whole
+document against it in one pass, with the checks of every field inlined, and compiles it once per schema. Every
+problem is reported with its JSON path. Dates are read by parse_datetime, whose results are memoized since the
+same timestamps come back in the reviews and annotations of an asset. The records of dbom_wrapper.types, which
+payloads made in-process hold, are checked as the dicts they stand for
+"""
+
+import functools
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, FrozenSet, List, Optional, Tuple
+
+ISO_DATETIME = re.compile(r'(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d)(?::(\d\d)(?:\.(\d{1,6})\d*)?)?'
+                          r'(Z|[+-]\d\d:?\d\d)?$')
+MISSING = object()
+SCALAR_TYPES = {'string': ('str', 'a string'), 'integer': ('int', 'an integer')}
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_datetime(text: str) -> Optional[datetime]:
+    """
+    Read an ISO 8601 date and time, as SPDX documents and assets write them: 2020-02-03T00:00:00Z.
+    Fractions of seconds and UTC offsets are accepted too. A date without offset, as in documentCreatedDate, is in UTC
+    :param text: The date
+    :return: The aware datetime in UTC, None if text is not such a date
+    """
+    match = ISO_DATETIME.match(text)
+    if match is None:
+        return None
+    year, month, day, hour, minute, second, fraction, zone = match.groups()
+    try:
+        value = datetime(int(year), int(month), int(day), int(hour), int(minute), int(second or 0),
+                         int(fraction.ljust(6, '0')) if fraction else 0, timezone.utc)
+    except ValueError:
+        return None
+    if zone and zone != 'Z':
+        offset = timedelta(hours=int(zone[1:3]), minutes=int(zone[-2:]))
+        value = value - offset if zone[0] == '+' else value + offset
+    return value
+
+
+def describe(value: Any) -> str:
+    """
+    :return: The JSON type of value, for error messages
+    """
+    if value is MISSING:
+        return 'nothing'
+    if value is None:
+        return 'null'
+    kind = type(value)
+    if kind is bool:
+        return 'a boolean'
+    if kind in (int, float):
+        return 'a number'
+    if kind is str:
+        return 'a string'
+    if kind is list:
+        return 'an array'
+    if kind is dict:
+        return 'an object'
+    return kind.__name__
+
+
+@dataclass(frozen=True, eq=False)
+class Scalar:
+    """
+    A string, an integer or a date (an ISO 8601 string, see parse_datetime)
+    """
+    kind: str
+
+
+@dataclass(frozen=True, eq=False)
+class Nullable:
+    """
+    A value of schema, or null
+    """
+    schema: Any
+
+
+@dataclass(frozen=True, eq=False)
+class Array:
+    """
+    An array whose items all match the items schema
+    """
+    items: Any
+
+
+@dataclass(frozen=True, eq=False)
+class Field:
+    """
+    A member of an object. Members an object has besides its fields are ignored
+    """
+    name: str
+    schema: Any
+    required: bool = True
+
+
+@dataclass(frozen=True, eq=False)
+class Object:
+    """
+    An object with the given fields
+    """
+    fields: Tuple[Field, ...]
+
+
+@dataclass(frozen=True, eq=False)
+class Licenses:
+    """
+    The licenses table of an asset: an array of license objects, which licenses found after it can refer to by ID
+    """
+    entry: Object
+
+
+@dataclass(frozen=True, eq=False)
+class License:
+    """
+    A license as dbom_wrapper.convert.LicenseTable makes them: a license object, the ID of a license of the table or,
+    for expressions, an array of two such operands
+    """
+    entry: Object
+    expression: bool = True
+
+
+STRING = Scalar('string')
+INTEGER = Scalar('integer')
+DATE = Scalar('date')
+TEXT = Nullable(STRING)
+
+
+class _Compiler:
+    """
+    Generates the source of the function validating a schema
+    The function takes the value, its JSON path, the IDs of the licenses table and the list errors are added to.
+    The paths are f-strings, only formatted when there is an error
+    """
+
+    def __init__(self):
+        self.lines = ['def validate(value, path, license_ids, errors):']
+        self.count = 0
+
+    def name(self, prefix: str) -> str:
+        self.count += 1
+        return f"{prefix}{self.count}"
+
+    def emit(self, indent: int, line: str):
+        self.lines.append('    ' * indent + line)
+
+    def error(self, indent: int, path: str, message: str):
+        self.emit(indent, f"errors.append(f'{path}: {message}')")
+
+    def node(self, schema, var: str, path: str, indent: int):
+        """
+        Emit the checks of the value held by var
+        :param path: Body of the f-string of the JSON path of the value
+        """
+        if isinstance(schema, Nullable):
+            self.emit(indent, f"if {var} is not None:")
+            self.node(schema.schema, var, path, indent + 1)
+        elif isinstance(schema, Scalar) and schema.kind == 'date':
+            self.emit(indent, f"if type({var}) is not str:")
+            self.error(indent + 1, path, f"expected an ISO 8601 date, got {{describe({var})}}")
+            self.emit(indent, f"elif parse_datetime({var}) is None:")
+            self.error(indent + 1, path, f"{{{var}!r}} is not an ISO 8601 date")
+        elif isinstance(schema, Scalar):
+            python_type, expected = SCALAR_TYPES[schema.kind]
+            self.emit(indent, f"if type({var}) is not {python_type}:")
+            self.error(indent + 1, path, f"expected {expected}, got {{describe({var})}}")
+        elif isinstance(schema, (Array, Licenses)):
+            self.emit(indent, f"if type({var}) is not list:")
+            self.error(indent + 1, path, f"expected an array, got {{describe({var})}}")
+            self.emit(indent, 'else:')
+            index, item = self.name('i'), self.name('v')
+            self.emit(indent + 1, f"for {index}, {item} in enumerate({var}):")
+            items = schema.entry if isinstance(schema, Licenses) else schema.items
+            self.node(items, item, f"{path}[{{{index}}}]", indent + 2)
+            if isinstance(schema, Licenses):
+                self.emit(indent + 1, f"license_ids = table_ids({var})")
+        elif isinstance(schema, Object):
+            self.emit(indent, f"if type({var}) is not dict and hasattr({var}, 'fields'):")
+            self.emit(indent + 1, f"{var} = {var}.fields()")
+            self.emit(indent, f"if type({var}) is not dict:")
+            self.error(indent + 1, path, f"expected an object, got {{describe({var})}}")
+            self.emit(indent, 'else:')
+            for field in schema.fields:
+                member = self.name('v')
+                self.emit(indent + 1, f"{member} = {var}.get({field.name!r}, MISSING)")
+                if field.required:
+                    self.emit(indent + 1, f"if {member} is MISSING:")
+                    self.error(indent + 2, f"{path}.{field.name}", 'is missing')
+                    self.emit(indent + 1, 'else:')
+                else:
+                    self.emit(indent + 1, f"if {member} is not MISSING:")
+                self.node(field.schema, member, f"{path}.{field.name}", indent + 2)
+        elif isinstance(schema, License):
+            entry = self.name('entry')
+            self.emit(indent, f"check_license({var}, f'{path}', license_ids, errors, {entry}, {schema.expression})")
+            self.constants[entry] = compile_schema(schema.entry)
+        else:
+            raise TypeError(f"Unknown schema node {schema!r}")
+
+    def compile(self, schema) -> Callable:
+        self.constants = {}
+        self.node(schema, 'value', '{path}', 1)
+        namespace = dict(self.constants, MISSING=MISSING, parse_datetime=parse_datetime, describe=describe,
+                         check_license=check_license, table_ids=table_ids)
+        exec(compile('\n'.join(self.lines) + '\n', '<schema>', 'exec'), namespace)
+        validate = namespace['validate']
+        validate.source = '\n'.join(self.lines)
+        return validate
+
+
+@functools.lru_cache(maxsize=None)
+def compile_schema(schema) -> Callable:
+    """
+    Compile the validator of a schema, once. Schema nodes compare by identity
+    :param schema: The root node of the schema
+    :return: Function (value, path, license_ids, errors) adding the problems of value to errors. Its source
+        is in its source attribute
+    """
+    return _Compiler().compile(schema)
+
+
+def table_ids(entries) -> FrozenSet[str]:
+    """
+    :param entries: The licenses table of an asset
+    :return: The IDs of its licenses
+    """
+    if type(entries) is not list:
+        return frozenset()
+    return frozenset(entry['id'] for entry in entries if type(entry) is dict and type(entry.get('id')) is str)
+
+
+def check_license(value, path: str, license_ids: FrozenSet[str], errors: List[str], entry: Callable,
+                  expression: bool = True):
+    """
+    Check a license, see License. Expressions are checked recursively
+    :param entry: Validator of the license objects
+    """
+    kind = type(value)
+    if kind is str:
+        if value not in license_ids:
+            errors.append(f"{path}: license {value} is not in the licenses table of the asset")
+    elif kind is dict:
+        entry(value, path, license_ids, errors)
+    elif hasattr(value, 'fields'):
+        entry(value.fields(), path, license_ids, errors)
+    elif kind is list and expression:
+        if len(value) != 2:
+            errors.append(f"{path}: expected a license expression of two operands, got {len(value)}")
+        else:
+            check_license(value[0], f"{path}[0]", license_ids, errors, entry)
+            check_license(value[1], f"{path}[1]", license_ids, errors, entry)
+    else:
+        errors.append(f"{path}: expected a license, got {describe(value)}")
+
+
+def validate(schema, value, path: str = '$', license_ids: FrozenSet[str] = frozenset()) -> List[str]:
+    """
+    Check a value against a schema
+    :param schema: The root node of the schema
+    :param value: The value, e.g. an asset or one of its files
+    :param path: JSON path of value, prefixing the paths in the errors
+    :param license_ids: IDs of the licenses table of the asset, for values found after it
+    :return: The problems found, as "path: problem" strings, empty if there is none
+    """
+    errors = []
+    compile_schema(schema)(value, path, license_ids, errors)
+    return errors
+
+
+# Version 1 of the asset schema, as the payloads are made by dbom_wrapper.convert and dbom_wrapper.spdxjson
+# and read back by dbom_wrapper.convert.create_sbom
+LICENSE = Object((Field('id', STRING), Field('url', TEXT, required=False), Field('name', TEXT)))
+EXPRESSION = License(LICENSE)
+FILE = Object((
+    Field('name', STRING), Field('type', Nullable(INTEGER)), Field('id', STRING),
+    Field('license', Object((Field('comment', TEXT), Field('concluded', EXPRESSION),
+                             Field('fromFile', Array(License(LICENSE, expression=False)))))),
+    Field('copyright', TEXT), Field('comment', TEXT), Field('checksum', STRING), Field('checksumAlgorithm', STRING),
+))
+PACKAGE = Object(tuple(Field(name, TEXT) for name in (
+    'version', 'downloadLocation', 'summary', 'sourceInfo', 'fileName', 'supplierName', 'supplierEmail',
+    'originatorName', 'originatorEmail', 'verificationCode', 'description', 'comment', 'copyright')) + (
+    Field('name', STRING), Field('id', STRING), Field('checksum', STRING), Field('checksumAlgorithm', STRING),
+    Field('license', Object((Field('comment', TEXT), Field('declared', EXPRESSION), Field('concluded', EXPRESSION),
+                             Field('fromFile', Array(License(LICENSE, expression=False)))))),
+    Field('files', Array(FILE)),
+))
+SNIPPET = Object((
+    Field('id', STRING), Field('name', TEXT), Field('comment', TEXT), Field('copyright', TEXT),
+    Field('license', Object((Field('comment', TEXT), Field('concluded', EXPRESSION),
+                             Field('inSnippet', Array(License(LICENSE, expression=False)))))),
+    Field('fromFileID', TEXT),
+))
+REVIEW = Object((Field('reviewer', STRING), Field('reviewDate', DATE), Field('comment', TEXT, required=False)))
+ANNOTATION = Object((
+    Field('id', TEXT), Field('comment', TEXT), Field('type', STRING), Field('date', DATE),
+    Field('annotator', Object((Field('name', STRING), Field('email', TEXT)))),
+))
+EXTERNAL_REF = Object((Field('category', STRING), Field('locator', STRING), Field('type', STRING),
+                       Field('comment', TEXT, required=False)))
+RELATIONSHIP = Object((Field('relationship', STRING), Field('spdxId', STRING, required=False),
+                       Field('relatedSpdxId', STRING, required=False), Field('assetId', STRING, required=False)))
+METADATA = Object((
+    # Before the package and snippets, which refer to it
+    Field('licenses', Licenses(LICENSE), required=False),
+    Field('reviews', Array(REVIEW)), Field('license', TEXT, required=False), Field('extrefs', Array(EXTERNAL_REF)),
+    Field('id', STRING), Field('namespace', TEXT), Field('comment', TEXT), Field('dataLicense', EXPRESSION),
+    Field('annotations', Array(ANNOTATION)), Field('relationships', Array(RELATIONSHIP), required=False),
+    Field('packages', Array(PACKAGE), required=False), Field('package', PACKAGE), Field('snippets', Array(SNIPPET)),
+))
+ASSET_V1 = Object((
+    Field('standardVersion', INTEGER), Field('documentName', STRING), Field('documentCreator', STRING),
+    Field('documentCreatedDate', DATE), Field('assetMetadata', METADATA),
+) + tuple(Field(name, STRING) for name in ('assetType', 'assetSubType', 'assetManufacturer', 'assetModelNumber',
+                                           'assetDescription', 'manufactureSignature')))
+
+# The asset up to its metadata: the keys streaming readers wait for (dbom_to_spdx.ASSET_KEYS) before the files
+ASSET_HEADER_V1 = Object(ASSET_V1.fields[1:5])
+
+# Asset schemas by standardVersion
+SCHEMAS = {1: ASSET_V1}
+
+
+def asset_errors(asset) -> List[str]:
+    """
+    Check a whole asset against the schema of its standardVersion
+    :param asset: The asset, as retrieved from the gateway
+    :return: The problems found, as "path: problem" strings, empty if there is none
+    """
+    if type(asset) is not dict:
+        return [f"$: expected an object, got {describe(asset)}"]
+    version = asset.get('standardVersion', MISSING)
+    schema = SCHEMAS.get(version) if type(version) is int else None
+    if schema is None:
+        found = version if type(version) is int else describe(version)
+        return [f"$.standardVersion: expected one of {', '.join(map(str, SCHEMAS))}, got {found}"]
+    return validate(schema, asset)
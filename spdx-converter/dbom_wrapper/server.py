@@ -0,0 +1,419 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Long-running conversion service, so that converting an SBoM does not pay for starting Python, building the
+parser and connecting to the gateway every time
+Conversions run in a pool of worker processes, each keeping its parser between jobs, and the gateway is reached
+through one pooled GatewayAPI. Jobs beyond what the workers and the queue can hold are refused with a 503 and
+a Retry-After header, which the retry policy of the gateway clients honours
+
+Routes:
+ - POST /convert: convert the SPDX KV Tag (or SPDX JSON document) in the body, answer the asset payload
+ - POST /repo/{repo}/chan/{channel}/asset[/{assetId}]: convert the SPDX document in the body and create the asset
+   on the gateway, under the SPDX ID of its package unless assetId is given
+ - GET /repo/{repo}/chan/{channel}/asset/{assetId}: retrieve the asset from the gateway, answer it as an SPDX KV Tag
+ - GET /status: number of jobs in progress, completed, failed and refused
+ - GET /metrics: time spent in each conversion stage, bytes and retries, in the Prometheus text format
+
+Run it with: python -m dbom_wrapper.server --gateway http://localhost:3000 --port 8080
+"""
+
+import argparse
+import contextlib
+import http
+import io
+import json
+import os
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from .api import APIException, DbomException, GatewayAPI
+from .convert import ConversionError, convert_asset_to_spdx, convert_spdx_to_payload, get_parser
+from .metrics import NO_METRICS, Metrics, measured
+from .retry import RetryPolicy
+from .types import json_default
+
+ASSET_ROUTE = re.compile(r'^/repo/([^/]+)/chan/([^/]+)/asset(?:/([^/]+))?$')
+# Seconds a client is asked to wait when the queue is full
+RETRY_AFTER = 1
+
+
+class QueueFullError(DbomException):
+    """
+    A job was refused because the queue is full
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.message = f"The conversion queue is full ({capacity} jobs)"
+        super().__init__(self.message)
+
+
+class JobQueue:
+    """
+    Bounded queue of jobs, whose conversions run in a pool of worker processes
+    Up to workers jobs run at a time and up to size more wait for a worker. Admitting a job into a full
+    queue fails right away with QueueFullError, so bursts are pushed back to the clients instead of piling up
+
+    :param workers: Number of worker processes
+    :param size: Number of jobs that may wait for a worker
+    """
+
+    def __init__(self, workers: int, size: int):
+        self.workers = workers
+        self.capacity = workers + size
+        self.in_progress = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        # Each worker builds its parser when it starts and keeps it for all its jobs
+        self._pool = ProcessPoolExecutor(max_workers=workers, initializer=get_parser)
+
+    def warm_up(self):
+        """
+        Start every worker process now rather than on the first jobs
+        """
+        for future in [self._pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+
+    @contextlib.contextmanager
+    def job(self):
+        """
+        Admit a job for the duration of the with block
+        Raises QueueFullError if the queue is full
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise QueueFullError(self.capacity)
+        with self._lock:
+            self.in_progress += 1
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            with self._lock:
+                self.in_progress -= 1
+                if failed:
+                    self.failed += 1
+                else:
+                    self.completed += 1
+            self._slots.release()
+
+    def run(self, fn, *args):
+        """
+        Run fn(*args) in a worker process and wait for its result
+        """
+        return self._pool.submit(fn, *args).result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'workers': self.workers, 'capacity': self.capacity, 'inProgress': self.in_progress,
+                    'completed': self.completed, 'failed': self.failed, 'rejected': self.rejected}
+
+    def close(self):
+        self._pool.shutdown()
+
+
+def _size(text, base: int = 10) -> int:
+    """
+    Read the length of a request body or the size of a chunk
+    :param text: The header value, or the size line of the chunk as bytes
+    :param base: 10 for Content-Length, 16 for chunk sizes
+    :return: The size. Raises ValueError if text is not a non-negative number
+    """
+    if isinstance(text, bytes):
+        text = text.decode('latin-1')
+    try:
+        size = int(text, base)
+    except ValueError:
+        size = -1
+    if size < 0:
+        raise ValueError(f"invalid size {text.strip()!r}")
+    return size
+
+
+def spdx_to_payload(text: bytes, metrics: Metrics = NO_METRICS) -> dict:
+    """
+    Convert an SPDX document to an asset payload. Runs inside the worker processes
+    The payload keeps the records of dbom_wrapper.types, which are sent back to the server process in a smaller pickle
+    :param text: The document
+    :param metrics: Metrics recording the parse and convert stages
+    :return: The asset payload
+    """
+    return convert_spdx_to_payload(text, metrics, records=True)
+
+
+def asset_to_spdx_text(asset: dict, metrics: Metrics = NO_METRICS) -> str:
+    """
+    Convert an asset to an SPDX tag-value document. Runs inside the worker processes
+    :param asset: The asset, as retrieved from the gateway
+    :param metrics: Metrics recording the convert and write stages
+    :return: The document
+    """
+    out = io.StringIO()
+    convert_asset_to_spdx(asset, out, metrics)
+    return out.getvalue()
+
+
+class ConversionServer:
+    """
+    HTTP conversion service running on a background thread, see the routes above
+
+    :param gateway: The full address (with schema) of the gateway, None to only serve /convert
+    :param host: Interface to bind to
+    :param port: Port to bind to, 0 picks a free port
+    :param workers: Number of worker processes converting documents
+    :param queue_size: Number of jobs that may wait for a worker before jobs are refused
+    :param pool_size: Number of pooled connections to the gateway, which bounds the concurrent gateway requests
+    :param retry_policy: How gateway requests are retried
+    :param max_body: Largest accepted request body, in bytes
+    """
+
+    def __init__(self, gateway: str = None, host: str = '127.0.0.1', port: int = 0, workers: int = None,
+                 queue_size: int = 100, pool_size: int = 10, retry_policy: RetryPolicy = None,
+                 max_body: int = 256 * 1024 * 1024):
+        self.queue = JobQueue(workers or os.cpu_count() or 1, queue_size)
+        self.metrics = Metrics()
+        self.api = None if gateway is None else GatewayAPI(gateway, pool_size=pool_size, retry_policy=retry_policy,
+                                                           metrics=self.metrics)
+        self.max_body = max_body
+        self._gateway_slots = threading.BoundedSemaphore(pool_size)
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.queue.warm_up()
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self.queue.close()
+        if self.api is not None:
+            self.api.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def convert(self, text: bytes) -> dict:
+        payload, summary = self.queue.run(measured, spdx_to_payload, text)
+        self.metrics.merge(summary)
+        return payload
+
+    def forward(self, repo: str, channel: str, text: bytes, asset_id: str = None) -> str:
+        """
+        Convert a document and create the asset on the gateway
+        :return: The asset ID
+        """
+        payload = self.convert(text)
+        asset_id = asset_id or payload['assetMetadata']['package']['id']
+        with self._gateway_slots:
+            self.api.create_asset(repo, channel, asset_id, payload, verbose=False)
+        return asset_id
+
+    def export(self, repo: str, channel: str, asset_id: str) -> str:
+        """
+        Retrieve an asset from the gateway and convert it to an SPDX tag-value document
+        """
+        with self._gateway_slots:
+            asset = json.loads(b''.join(self.api.retreive_asset_stream(repo, channel, asset_id, verbose=False)))
+        text, summary = self.queue.run(measured, asset_to_spdx_text, asset)
+        self.metrics.merge(summary)
+        return text
+
+    def prometheus(self, prefix: str = 'dbom_conversion_service') -> str:
+        """
+        :return: The stage timings, the counters and the state of the job queue in the Prometheus text format
+        """
+        stats = self.queue.stats()
+        lines = [f"# TYPE {prefix}_jobs_in_progress gauge", f"{prefix}_jobs_in_progress {stats['inProgress']}",
+                 f"# TYPE {prefix}_jobs_capacity gauge", f"{prefix}_jobs_capacity {stats['capacity']}",
+                 f"# TYPE {prefix}_jobs_total counter"]
+        lines += [f'{prefix}_jobs_total{{outcome="{outcome}"}} {stats[outcome]}'
+                  for outcome in ('completed', 'failed', 'rejected')]
+        return self.metrics.prometheus(prefix) + '\n'.join(lines) + '\n'
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately, Nagle's algorithm would hold the body back
+            disable_nagle_algorithm = True
+
+            def _reply(self, status, body=b'', content_type='application/json', headers=None):
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True
+
+            def _reply_json(self, status, obj, headers=None):
+                self._reply(status, json.dumps(obj, default=json_default).encode('utf-8'), headers=headers)
+
+            def _read_body(self):
+                """
+                :return: The request body, None if it is larger than max_body. Raises ValueError if its length or
+                    the size of one of its chunks is not a number
+                """
+                if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                    chunks = []
+                    size = 0
+                    while True:
+                        chunk_size = _size(self.rfile.readline().split(b';')[0], 16)
+                        size += chunk_size
+                        if size > server.max_body:
+                            return None
+                        chunk = self.rfile.read(chunk_size)
+                        self.rfile.readline()
+                        if not chunk_size:
+                            return b''.join(chunks)
+                        chunks.append(chunk)
+                length = _size(self.headers.get('Content-Length', '0'))
+                if length > server.max_body:
+                    return None
+                return self.rfile.read(length)
+
+            def _handle(self, action):
+                """
+                Run action as a job and reply with its outcome
+                """
+                try:
+                    with server.queue.job():
+                        action()
+                except QueueFullError as e:
+                    self._reply_json(http.HTTPStatus.SERVICE_UNAVAILABLE, {'error': e.message},
+                                     {'Retry-After': str(RETRY_AFTER)})
+                except ConversionError as e:
+                    self._reply_json(http.HTTPStatus.UNPROCESSABLE_ENTITY, {'error': e.message,
+                                                                           'messages': e.messages})
+                except APIException as e:
+                    status = http.HTTPStatus.NOT_FOUND if e.status_code == http.HTTPStatus.NOT_FOUND \
+                        else http.HTTPStatus.BAD_GATEWAY
+                    message = e.message.decode('utf-8', 'replace') if isinstance(e.message, bytes) else e.message
+                    self._reply_json(status, {'error': 'Gateway request failed', 'gatewayStatus': e.status_code,
+                                              'gatewayResponse': message})
+                except Exception as e:
+                    self._reply_json(http.HTTPStatus.INTERNAL_SERVER_ERROR, {'error': str(e)})
+
+            def do_POST(self):
+                try:
+                    body = self._read_body()
+                except ValueError as e:
+                    # Where the body ends is unknown, the connection cannot be reused
+                    self.close_connection = True
+                    self._reply_json(http.HTTPStatus.BAD_REQUEST, {'error': f"Malformed request body: {e}"})
+                    return
+                if body is None:
+                    self.close_connection = True
+                    self._reply_json(http.HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                                     {'error': f"The body is larger than {server.max_body} bytes"})
+                    return
+                if self.path == '/convert':
+                    def convert():
+                        self._reply_json(http.HTTPStatus.OK, server.convert(body))
+
+                    self._handle(convert)
+                    return
+                route = ASSET_ROUTE.match(self.path)
+                if route is None or server.api is None:
+                    self._reply_json(http.HTTPStatus.NOT_FOUND, {'error': 'not found'})
+                    return
+                repo, channel, asset_id = (unquote(part) if part else part for part in route.groups())
+
+                def forward():
+                    created = server.forward(repo, channel, body, asset_id)
+                    self._reply_json(http.HTTPStatus.CREATED, {
+                        'assetId': created, 'url': server.api.asset_url(repo, channel, created)})
+
+                self._handle(forward)
+
+            def do_GET(self):
+                if self.path == '/status':
+                    self._reply_json(http.HTTPStatus.OK, server.queue.stats())
+                    return
+                if self.path == '/metrics':
+                    self._reply(http.HTTPStatus.OK, server.prometheus().encode('utf-8'), 'text/plain; version=0.0.4')
+                    return
+                route = ASSET_ROUTE.match(self.path)
+                if route is None or route.group(3) is None or server.api is None:
+                    self._reply_json(http.HTTPStatus.NOT_FOUND, {'error': 'not found'})
+                    return
+                repo, channel, asset_id = (unquote(part) for part in route.groups())
+
+                def export():
+                    self._reply(http.HTTPStatus.OK, server.export(repo, channel, asset_id).encode('utf-8'),
+                                'text/plain; charset=utf-8')
+
+                self._handle(export)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Long-running SPDX/DBoM conversion service')
+    parser.add_argument('-g', '--gateway', type=str,
+                        help='The full address (with schema) at which the gateway can be reached. Without it, '
+                             'only /convert is served')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Interface to bind to')
+    parser.add_argument('--port', type=int, default=8080, help='Port to bind to')
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(),
+                        help='Number of worker processes converting documents (default: CPU count)')
+    parser.add_argument('--queue-size', type=int, default=100,
+                        help='Number of jobs that may wait for a worker, further jobs are refused with a 503')
+    parser.add_argument('-p', '--pool-size', type=int, default=10,
+                        help='Number of pooled keep-alive connections (and concurrent requests) to the gateway')
+    parser.add_argument('--max-body', type=int, default=256,
+                        help='Largest accepted SPDX document, in MB')
+    RetryPolicy.add_arguments(parser)
+    args = parser.parse_args()
+    service = ConversionServer(args.gateway, args.host, args.port, args.workers, args.queue_size, args.pool_size,
+                               RetryPolicy.from_args(args), args.max_body * 1024 * 1024)
+    service.queue.warm_up()
+    print(f"Conversion service listening on {service.address} with {service.queue.workers} workers")
+    try:
+        service._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.queue.close()
@@ -0,0 +1,555 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Conversion of SPDX JSON documents (SPDX 2.2 and 2.3 layout) to DBoM asset payloads
+The JSON is mapped straight to the payload that create_dbom_asset_payload makes from the same document in
+tag-value, without going through the spdx-tools parser and object model. spdx-tools is not even imported:
+the names of the licenses are read from the license list it bundles
+
+Files and snippets belong to the package listing them in hasFiles, or related to them by CONTAINS/CONTAINED_BY,
+and otherwise to the first package. Annotations take the SPDX ID of the element they are attached to, unless they
+give it in an id, as spdx-tools reads and writes the annotations it lists on the document.
+Reviews, which SPDX JSON no longer has, are read from reviewers as spdx-tools writes them
+NOASSERTION, NONE and license exceptions (WITH) are kept as license IDs, like the tag-value converter keeps them
+"""
+
+import importlib.util
+import json
+import os
+import re
+from datetime import datetime
+from typing import IO, List, Tuple, Union
+
+from . import types
+from .compression import open_input, strip_extension
+from .convert import ConversionError, LicenseTable, combine_packages
+from .metrics import NO_METRICS, Metrics
+from .tagvalue import Relationship
+
+# Values of spdx.file.FileType, file types the tag-value format of SPDX 2.1 does not have count as OTHER
+FILE_TYPES = {'SOURCE': 1, 'BINARY': 2, 'ARCHIVE': 3, 'OTHER': 4}
+ENTITY = re.compile(r'(?:Person|Organization):\s*([^(]+)(?:\((.*)\))?', re.DOTALL)
+TOOL = re.compile(r'Tool:\s*(.+)', re.DOTALL)
+DATE = re.compile(r'(\d\d\d\d)-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)Z')
+LICENSE_TOKEN = re.compile(r'[()]|[^\s()]+')
+LICENSE_ID = re.compile(r'[A-Za-z0-9.\-+:]+')
+OPERATORS = {'AND': 'AND', 'and': 'AND', 'OR': 'OR', 'or': 'OR', 'WITH': 'WITH', 'with': 'WITH'}
+NOASSERTION = 'NOASSERTION'
+
+REQUIRED = {
+    'document': ('spdxVersion', 'dataLicense', 'SPDXID', 'name', 'documentNamespace', 'creationInfo'),
+    'creationInfo': ('created', 'creators'),
+    # The version and description of a package are the model number and description of its asset
+    'package': ('name', 'SPDXID', 'downloadLocation', 'versionInfo', 'description'),
+    'file': ('fileName', 'SPDXID', 'checksums'),
+    'snippet': ('SPDXID', 'snippetFromFile'),
+}
+
+_license_map = None
+
+
+def license_map() -> dict:
+    """
+    Map the names of the SPDX licenses to their IDs and their IDs to their names, like spdx.config.LICENSE_MAP
+    The license list is read from the spdx-tools package without importing it, its __init__ is slow to import
+    :return: The mapping
+    """
+    global _license_map
+    if _license_map is None:
+        spec = importlib.util.find_spec('spdx')
+        with open(os.path.join(spec.submodule_search_locations[0], 'licenses.json'), encoding='utf-8') as f:
+            licenses = json.load(f)['licenses']
+        mapping = {}
+        for lic in licenses:
+            if not lic.get('isDeprecatedLicenseId'):
+                mapping[lic['name']] = lic['licenseId']
+                mapping[lic['licenseId']] = lic['name']
+        _license_map = mapping
+    return _license_map
+
+
+def is_spdx_json(file: str) -> bool:
+    """
+    Tell whether a file holds an SPDX JSON document rather than a tag-value one, from its extension (ignoring a
+    compression one) or else from its first character
+    :param file: Path of the file
+    :return: True for SPDX JSON
+    """
+    extension = os.path.splitext(strip_extension(file))[1].lower()
+    if extension in ('.tag', '.spdx'):
+        return False
+    if extension == '.json':
+        return True
+    with open_input(file, binary=True) as f:
+        return looks_like_json(f.read(256))
+
+
+def looks_like_json(text: Union[str, bytes]) -> bool:
+    """
+    :param text: The start of a document
+    :return: True if the document is a JSON object, tag-value documents never start with a {
+    """
+    text = text.lstrip()
+    if isinstance(text, bytes):
+        return text.startswith(b'{') or text.startswith(b'\xef\xbb\xbf{')
+    return text.startswith('{') or text.startswith('\ufeff{')
+
+
+def load_spdx_json(source: Union[str, bytes, IO]) -> dict:
+    """
+    Parse an SPDX JSON document and check that it has what the payload needs
+    :param source: Path of the document (possibly compressed), or the document as bytes or as a file object
+    :return: The document as a dict. Raises ConversionError if it is not valid JSON or misses required fields
+    """
+    try:
+        if isinstance(source, str):
+            with open_input(source, binary=True) as f:
+                document = json.load(f)
+        elif isinstance(source, bytes):
+            document = json.loads(source)
+        else:
+            document = json.load(source)
+    except ValueError as e:
+        raise ConversionError('Errors encountered while parsing', [str(e)]) from e
+    messages = validate_document(document)
+    if messages:
+        raise ConversionError('Invalid SPDX document', messages)
+    return document
+
+
+def validate_document(document) -> List[str]:
+    """
+    Check that an SPDX JSON document has the fields the payload is made of
+    :param document: The parsed document
+    :return: List of the problems found, empty if there is none
+    """
+    if not isinstance(document, dict):
+        return ['The document is not a JSON object']
+    messages = [f"The document has no {key}" for key in REQUIRED['document'] if key not in document]
+    creation_info = document.get('creationInfo') or {}
+    messages += [f"The creation information has no {key}" for key in REQUIRED['creationInfo']
+                 if key not in creation_info]
+    if not document.get('packages'):
+        messages.append('The document has no package')
+    for kind, items in (('package', 'packages'), ('file', 'files'), ('snippet', 'snippets')):
+        for item in document.get(items) or ():
+            messages += [f"A {kind} ({item.get('SPDXID')}) has no {key}" for key in REQUIRED[kind]
+                         if key not in item]
+    return messages
+
+
+class LicenseExpressions:
+    """
+    License expressions of one package of an SPDX JSON document, each distinct one converted once with the
+    LicenseTable of the package, as LicenseTable.make converts the License objects parsed from tag-value
+    Expressions are read like the spdx-tools tag-value parser does: AND binds tighter than OR and both
+    associate to the left. A license and the exception following WITH are kept together as one license ID
+
+    :param table: LicenseTable of the package, a new one if None
+    :param parsed: Expressions already parsed, shared by the packages of a document
+    """
+
+    def __init__(self, table: LicenseTable = None, parsed: dict = None):
+        self.table = LicenseTable() if table is None else table
+        self.names = license_map()
+        self._parsed = {} if parsed is None else parsed
+        self._made = {}
+        self._leaves = {}
+
+    def parse(self, text: str):
+        """
+        :param text: A license ID or expression, e.g. (MIT AND (Apache-2.0 OR ISC))
+        :return: A license ID, or an (operator, left, right) tuple
+        """
+        parsed = self._parsed.get(text)
+        if parsed is None:
+            parsed = self._parsed[text] = self._parse(text)
+        return parsed
+
+    def _parse(self, text: str):
+        text = text.strip()
+        if text in self.names or text.startswith('LicenseRef-'):
+            return text
+        tokens = LICENSE_TOKEN.findall(text)
+        position = 0
+
+        def error(problem):
+            return ConversionError('Invalid SPDX document', [f"License expression {text}: {problem}"])
+
+        def take():
+            nonlocal position
+            if position == len(tokens):
+                raise error('unexpected end')
+            position += 1
+            return tokens[position - 1]
+
+        def peek():
+            return OPERATORS.get(tokens[position]) if position < len(tokens) else None
+
+        def disjunction():
+            left = conjunction()
+            while peek() == 'OR':
+                take()
+                left = ('OR', left, conjunction())
+            return left
+
+        def conjunction():
+            left = atom()
+            while peek() == 'AND':
+                take()
+                left = ('AND', left, atom())
+            return left
+
+        def atom():
+            token = take()
+            if token == '(':
+                expression = disjunction()
+                if take() != ')':
+                    raise error('unbalanced parentheses')
+                return expression
+            if token == ')' or token in OPERATORS or not LICENSE_ID.fullmatch(token):
+                raise error(f"unexpected {token}")
+            if peek() == 'WITH':
+                take()
+                token = f"{token} WITH {take()}"
+            return token
+
+        parsed = disjunction()
+        if position != len(tokens):
+            raise error(f"unexpected {tokens[position]}")
+        return parsed
+
+    def make(self, text: str):
+        """
+        Convert a license expression
+        :param text: A license ID or expression
+        :return: The dict (or ID) of the license, or a list of the two converted operands
+        """
+        made = self._made.get(text)
+        if made is None:
+            made = self._made[text] = self._make(self.parse(text))
+        return made
+
+    def _make(self, parsed):
+        if type(parsed) == str:
+            return self.leaf(parsed)
+        return [self._make(parsed[1]), self._make(parsed[2])]
+
+    def leaf(self, identifier: str):
+        """
+        Convert a single license ID, as listed in licenseInfoInFiles
+        :param identifier: A license ID
+        :return: The dict (or ID) of the license
+        """
+        made = self._leaves.get(identifier)
+        if made is None:
+            made = self._leaves[identifier] = self.table.entry(identifier, self.names.get(identifier, identifier))
+        return made
+
+    def identifier(self, text: str) -> str:
+        """
+        :param text: A license ID or expression
+        :return: The expression written as spdx-tools writes it, e.g. MIT AND (Apache-2.0 OR ISC)
+        """
+        return self._identifier(self.parse(text))
+
+    def _identifier(self, parsed) -> str:
+        if type(parsed) == str:
+            return parsed
+        operator, left, right = parsed
+        other = 'OR' if operator == 'AND' else 'AND'
+        operands = [f"({self._identifier(operand)})" if type(operand) == tuple and operand[0] == other
+                    else self._identifier(operand) for operand in (left, right)]
+        return f" {operator} ".join(operands)
+
+
+def parse_entity(value: str) -> Tuple[str, str]:
+    """
+    Read a Person or Organization, e.g. the supplier of a package
+    :param value: E.g. Person: Jane Doe (jane@example.com)
+    :return: A tuple of the name and the email, None for what is not given
+    """
+    match = ENTITY.match(value or '')
+    if match is None:
+        return None, None
+    email = (match.group(2) or '').strip()
+    return match.group(1).strip(), email or None
+
+
+def parse_date(value: str) -> datetime:
+    """
+    :param value: An SPDX date, e.g. 2020-02-03T00:00:00Z
+    :return: The naive datetime, as spdx-tools reads it
+    """
+    match = DATE.match(value or '')
+    if match is None:
+        raise ConversionError('Invalid SPDX document', [f"Malformed date {value}"])
+    return datetime(*(int(group) for group in match.groups()))
+
+
+def iso_date(value: str) -> str:
+    return parse_date(value).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def make_creator_string(creators: [str]):
+    """
+    Creates a string from the creators of the document, like dbom_wrapper.convert.make_creator_string
+    :param creators: List of creator strings, e.g. Tool: Jenkins
+    :return: string equivalent
+    """
+    creator_list = []
+    for creator in creators:
+        if TOOL.match(creator):
+            creator_list.append(f"[Using: {creator_name(creator)}]")
+            continue
+        name, email = parse_entity(creator)
+        creator_list.append(f"{name} <{email}>" if email else name)
+    return ', '.join(creator_list)
+
+
+def creator_name(creator: str) -> str:
+    """
+    :param creator: A creator of the document, e.g. Tool: Jenkins
+    :return: Its name, e.g. Jenkins
+    """
+    tool = TOOL.match(creator)
+    return tool.group(1).strip() if tool else parse_entity(creator)[0]
+
+
+def make_review_list(reviews: [dict]):
+    return [types.Review(creator_name(review.get('reviewer') or ''), iso_date(review.get('reviewDate')),
+                         review.get('comment'))
+            for review in reviews]
+
+
+def make_pkgref_list(refs: [dict]):
+    proc_refs = []
+    for ref in refs:
+        t_dict = {
+            "category": ref.get('referenceCategory'),
+            "locator": ref.get('referenceLocator'),
+            "type": ref.get('referenceType')
+        }
+        if ref.get('comment'):
+            t_dict["comment"] = ref['comment']
+        proc_refs.append(t_dict)
+    return proc_refs
+
+
+def make_annotation_list(elements: [dict]):
+    """
+    Make the annotations of elements
+    :param elements: SPDX elements (document, packages, files, snippets), with their annotations
+    :return: List of Annotation records, about the element holding them unless they have an id
+    """
+    annotation_list = []
+    for element in elements:
+        for annotation in element.get('annotations') or ():
+            name, email = parse_entity(annotation.get('annotator'))
+            annotation_list.append(types.Annotation(
+                annotation.get('id') or element['SPDXID'], annotation.get('comment'), annotation.get('annotationType'),
+                iso_date(annotation.get('annotationDate')), name, email))
+    return annotation_list
+
+
+def checksum(element: dict) -> Tuple[str, str]:
+    """
+    :param element: A package or file
+    :return: A tuple of its SHA1 checksum (else its first one) and the algorithm, or of two None
+    """
+    checksums = element.get('checksums') or ()
+    for value in checksums:
+        if value.get('algorithm') == 'SHA1':
+            return value.get('checksumValue'), 'SHA1'
+    if checksums:
+        return checksums[0].get('checksumValue'), checksums[0].get('algorithm')
+    return None, None
+
+
+def make_file(file: dict, expressions: LicenseExpressions):
+    """
+    Make the File record of a file, like dbom_wrapper.convert.make_file
+    """
+    file_types = file.get('fileTypes')
+    value, algorithm = checksum(file)
+    return types.File(
+        file['fileName'], FILE_TYPES.get(file_types[0], FILE_TYPES['OTHER']) if file_types else None, file['SPDXID'],
+        file.get('licenseComments'), expressions.make(file.get('licenseConcluded', NOASSERTION)),
+        [expressions.leaf(identifier) for identifier in file.get('licenseInfoInFiles', (NOASSERTION,))],
+        file.get('copyrightText', NOASSERTION), file.get('comment'), value, algorithm)
+
+
+def make_snippet(snippet: dict, expressions: LicenseExpressions):
+    """
+    Make the Snippet record of a snippet, like dbom_wrapper.convert.make_snippet
+    """
+    return types.Snippet(
+        snippet['SPDXID'], snippet.get('name'), snippet.get('comment'), snippet.get('copyrightText', NOASSERTION),
+        snippet.get('licenseComments'), expressions.make(snippet.get('licenseConcluded', NOASSERTION)),
+        [expressions.leaf(identifier) for identifier in snippet.get('licenseInfoInSnippets', (NOASSERTION,))],
+        snippet['snippetFromFile'])
+
+
+def make_package(package: dict, files: [dict], expressions: LicenseExpressions):
+    """
+    Make the Package record of a package and its files, like dbom_wrapper.convert.make_package
+    """
+    supplier_name, supplier_email = parse_entity(package.get('supplier'))
+    originator_name, originator_email = parse_entity(package.get('originator'))
+    value, algorithm = checksum(package)
+    declared = expressions.make(package.get('licenseDeclared', NOASSERTION))
+    concluded = expressions.make(package.get('licenseConcluded', NOASSERTION))
+    from_files = [expressions.leaf(identifier) for identifier in package.get('licenseInfoFromFiles', (NOASSERTION,))]
+    return types.Package(
+        package['name'], package['SPDXID'], package.get('versionInfo'), package['downloadLocation'],
+        package.get('summary'), package.get('sourceInfo'), package.get('packageFileName'), supplier_name,
+        supplier_email, originator_name, originator_email, value, algorithm,
+        (package.get('packageVerificationCode') or {}).get('packageVerificationCodeValue'), package.get('description'),
+        package.get('comment'), package.get('copyrightText', NOASSERTION), package.get('licenseComments'), declared,
+        concluded, from_files, [make_file(file, expressions) for file in files])
+
+
+def get_relationships(document: dict) -> [Relationship]:
+    """
+    :param document: The SPDX JSON document
+    :return: Its relationships, as dbom_wrapper.tagvalue.Relationship like split_packages reads them
+    """
+    return [Relationship(r.get('spdxElementId'), r.get('relationshipType'), r.get('relatedSpdxElement'),
+                         r.get('comment'))
+            for r in document.get('relationships') or ()]
+
+
+def package_sections(document: dict, relationships: [Relationship]) -> List[Tuple[dict, list, list]]:
+    """
+    Group the files and snippets of a document by package, as the package sections of a tag-value document do
+    :param document: The SPDX JSON document
+    :param relationships: Its relationships
+    :return: List of (package, files, snippets) tuples, in the order of the packages
+    """
+    packages = document['packages']
+    index = {package['SPDXID']: position for position, package in enumerate(packages)}
+    owners = {}
+    for position, package in enumerate(packages):
+        for file_id in package.get('hasFiles') or ():
+            owners.setdefault(file_id, position)
+    for r in relationships:
+        if r.relationship == 'CONTAINS' and r.spdx_id in index:
+            owners.setdefault(r.related_id, index[r.spdx_id])
+        elif r.relationship == 'CONTAINED_BY' and r.related_id in index:
+            owners.setdefault(r.spdx_id, index[r.related_id])
+
+    sections = [(package, [], []) for package in packages]
+    for file in document.get('files') or ():
+        sections[owners.get(file['SPDXID'], 0)][1].append(file)
+    for snippet in document.get('snippets') or ():
+        sections[owners.get(snippet['snippetFromFile'], 0)][2].append(snippet)
+    return sections
+
+
+def create_dbom_asset_payload(document: dict, section: Tuple[dict, list, list], table: LicenseTable = None,
+                              parsed: dict = None, annotations: List[dict] = None, records: bool = False):
+    """
+    Creates a payload that the gateway would accept from one package of an SPDX JSON document, the same as
+    dbom_wrapper.convert.create_dbom_asset_payload makes from that package in tag-value
+
+    :param document: The SPDX JSON document
+    :param section: The package, its files and its snippets, see package_sections
+    :param table: LicenseTable of the package, a new one if None. If it is shared, the payload gets its licenses table
+    :param parsed: License expressions already parsed, see LicenseExpressions
+    :param annotations: The Annotation records of the payload, if not made from those of the elements
+    :param records: Keep the records of dbom_wrapper.types in the payload, as the function of dbom_wrapper.convert
+    :return: A valid asset payload for the gateway, plain dicts and lists unless records is set
+    """
+    from dbom_wrapper.types import GatewayAsset
+
+    expressions = LicenseExpressions(table, parsed)
+    table = expressions.table
+    package, files, snippets = section
+    creation_info = document['creationInfo']
+    data_license = document['dataLicense']
+    metadata_dict = {
+        "reviews": make_review_list(document.get('reviewers') or ()),
+        "license": expressions.identifier(package.get('licenseDeclared', NOASSERTION)),
+        "extrefs": make_pkgref_list(package.get('externalRefs') or ()),
+        "id": document['SPDXID'],
+        "namespace": document['documentNamespace'],
+        "comment": document.get('comment'),
+        "dataLicense": LicenseTable().entry(data_license, expressions.names.get(data_license, data_license)),
+        "annotations": make_annotation_list([document, package] + files + snippets) if annotations is None
+        else annotations,
+    }
+    if table.shared:
+        metadata_dict["licenses"] = table.entries
+    metadata_dict["package"] = make_package(package, files, expressions)
+    metadata_dict["snippets"] = [make_snippet(snippet, expressions) for snippet in snippets]
+
+    supplier = metadata_dict["package"]["supplierName"]
+    originator = metadata_dict["package"]["originatorName"]
+    payload = GatewayAsset(
+        document_name=document['name'],
+        document_creator=make_creator_string(creation_info['creators']),
+        document_created_date=parse_date(creation_info['created']),
+        asset_type="SoftwareComponent",
+        asset_sub_type="BuildArtifact",
+        asset_manufacturer=f"{originator} [{supplier}]",
+        asset_description=package['description'],
+        asset_model_number=package['versionInfo'],
+        asset_metadata=metadata_dict,
+        manufacture_signature="NOT SIGNED (DEMO)"
+    )
+    return payload.to_dict() if records else types.plain(payload.to_dict())
+
+
+def convert_spdx_json_packages(document: dict, shared_licenses: bool = False, metrics: Metrics = NO_METRICS,
+                               records: bool = False) -> Tuple[List[Tuple[str, dict]], List[Relationship]]:
+    """
+    Convert each package of an SPDX JSON document, with the document information, to its own asset payload
+    :param document: The document, as returned by load_spdx_json
+    :param shared_licenses: Give the payloads a licenses table
+    :param metrics: Metrics recording the convert stage
+    :param records: Keep the records of dbom_wrapper.types in the payloads, see create_dbom_asset_payload
+    :return: A tuple of the list of (package SPDX ID, asset payload) tuples, in the order of the packages,
+        and the relationships of the document
+    """
+    with metrics.stage('convert'):
+        parsed = {}
+        relationships = get_relationships(document)
+        payloads = [(section[0]['SPDXID'],
+                     create_dbom_asset_payload(document, section, LicenseTable(shared_licenses), parsed,
+                                               records=records))
+                    for section in package_sections(document, relationships)]
+    return payloads, relationships
+
+
+def convert_spdx_json(document: dict, shared_licenses: bool = False, metrics: Metrics = NO_METRICS,
+                      records: bool = False) -> dict:
+    """
+    Convert an SPDX JSON document to a DBoM asset payload
+    A document describing several packages is converted to a single asset, as convert_spdx_to_payload does
+
+    :param document: The document, as returned by load_spdx_json
+    :param shared_licenses: List the licenses once in the licenses table of the asset and refer to them by ID
+    :param metrics: Metrics recording the convert stage
+    :param records: Keep the records of dbom_wrapper.types in the payload, see create_dbom_asset_payload
+    :return: The asset payload. Raises ConversionError if the document has errors
+    """
+    payloads, relationships = convert_spdx_json_packages(document, shared_licenses, metrics, records=True)
+    if len(payloads) == 1:
+        payload = payloads[0][1]
+    else:
+        payload = combine_packages(payloads[0][1], [payload for _, payload in payloads[1:]], relationships)
+    return payload if records else types.plain(payload)
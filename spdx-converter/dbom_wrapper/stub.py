@@ -0,0 +1,183 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+A local stand-in for the DBoM gateway, for development and benchmarking
+It stores assets and sub-asset links in memory and can simulate latency and failing responses
+Request bodies may be gzip compressed, and responses are when the client accepts it and compress is set
+
+Run it with: python -m dbom_wrapper.stub --port 3000
+"""
+
+import argparse
+import gzip
+import http
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .compression import decode_body
+
+
+class StubGateway:
+    """
+    In-memory DBoM gateway serving the asset routes on a background thread
+
+    :param host: Interface to bind to
+    :param port: Port to bind to, 0 picks a free port
+    :param latency: Seconds to wait before answering each request
+    :param compress: Compress the assets it serves to clients accepting gzip
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, compress: bool = False):
+        self.assets = {}
+        self.links = []
+        self.latency = latency
+        self.compress = compress
+        self.failures = []
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_next(self, *responses):
+        """
+        Answer the next requests with the given responses instead of handling them
+        :param responses: HTTP status codes, or (status code, headers dict) tuples
+        """
+        with self._lock:
+            self.failures.extend(r if isinstance(r, tuple) else (r, {}) for r in responses)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _make_handler(self):
+        gateway = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            # Headers and body are written separately, Nagle's algorithm would hold the body back
+            disable_nagle_algorithm = True
+
+            def _reply(self, status, body=b'', headers=None):
+                self.send_response(status)
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on the request (timeout or cancellation)
+                    self.close_connection = True
+
+            def _read_body(self):
+                if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+                    chunks = []
+                    while True:
+                        size = int(self.rfile.readline().split(b';')[0], 16)
+                        chunk = self.rfile.read(size)
+                        self.rfile.readline()
+                        if not size:
+                            return decode_body(b''.join(chunks), self.headers.get('Content-Encoding'))
+                        chunks.append(chunk)
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                return decode_body(body, self.headers.get('Content-Encoding'))
+
+            def _intercept(self):
+                with gateway._lock:
+                    gateway.requests.append((self.command, self.path))
+                    failure = gateway.failures.pop(0) if gateway.failures else None
+                if gateway.latency:
+                    time.sleep(gateway.latency)
+                if failure:
+                    self._reply(failure[0], b'{"error": "stub failure"}', failure[1])
+                return failure
+
+            def do_POST(self):
+                body = self._read_body()
+                if self._intercept():
+                    return
+                if self.path.endswith('/attach'):
+                    self._attach(self.path[:-len('/attach')], json.loads(body))
+                    return
+                with gateway._lock:
+                    gateway.assets[self.path] = body
+                self._reply(http.HTTPStatus.OK, b'{"success": true}')
+
+            def _attach(self, parent, link):
+                child = parent.rsplit('/repo/', 1)[0] + f"/repo/{link['repoID']}/chan/{link['channelID']}" \
+                                                       f"/asset/{link['assetID']}"
+                with gateway._lock:
+                    found = parent in gateway.assets and child in gateway.assets
+                    if found:
+                        gateway.links.append((parent, child, link.get('role')))
+                if found:
+                    self._reply(http.HTTPStatus.OK, b'{"success": true}')
+                else:
+                    self._reply(http.HTTPStatus.NOT_FOUND, b'{"error": "not found"}')
+
+            def do_GET(self):
+                if self._intercept():
+                    return
+                with gateway._lock:
+                    body = gateway.assets.get(self.path)
+                if body is None:
+                    self._reply(http.HTTPStatus.NOT_FOUND, b'{"error": "not found"}')
+                elif gateway.compress and 'gzip' in self.headers.get('Accept-Encoding', ''):
+                    self._reply(http.HTTPStatus.OK, gzip.compress(body), {'Content-Encoding': 'gzip'})
+                else:
+                    self._reply(http.HTTPStatus.OK, body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the DBoM gateway')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Interface to bind to')
+    parser.add_argument('--port', type=int, default=3000, help='Port to bind to')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before answering each request')
+    parser.add_argument('--compress', action='store_true', help='Serve the assets gzip compressed when accepted')
+    args = parser.parse_args()
+    stub = StubGateway(args.host, args.port, args.latency, args.compress)
+    print(f"Stub gateway listening on {stub.address}")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
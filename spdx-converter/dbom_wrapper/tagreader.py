@@ -0,0 +1,710 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Fast reader of single-package SPDX tag-value documents
+Each line is matched by one regular expression and handed, through a table keyed by tag, to the handler of the
+tag, which fills a document laid out like SPDX JSON. The payload is then made by dbom_wrapper.spdxjson, without
+the spdx-tools lexer, LALR parser and builder
+
+The reader only takes documents it can read exactly as spdx-tools does. Anything else (a tag it does not
+handle, a value spdx-tools would read differently or reject, a missing mandatory field) makes it give up, and
+the caller parses the document with spdx-tools, which also reports the errors
+"""
+
+import re
+from typing import Iterable, Optional, Tuple
+
+from .convert import LicenseTable
+from .metrics import NO_METRICS, Metrics
+from .spdxjson import (DATE, ENTITY, OPERATORS, TOOL, create_dbom_asset_payload, iso_date, license_map,
+                       parse_entity)
+from .types import Annotation
+
+# A line: blank, a comment, or a tag and its value
+LINE = re.compile(r'[ \t\r\f\v]*(?:([A-Za-z]+)[ \t]*:[ \t]*([^\n]*)|#[^\n]*)?(?:\n|\Z)')
+TRAILING_SPACE = re.compile(r'[ \t\r\f\v]*(?:\n|\Z)')
+# Values the spdx-tools lexer reads as something else than a line of text
+SPECIAL_VALUE = re.compile(r'<text>|SHA1:\s*[a-f0-9]{40}|DocumentRef-[A-Za-z0-9+.\-]+|(?:Tool|Organization|Person):.'
+                           r'|\d\d\d\d-\d\d-\d\dT\d\d:\d\d:\d\dZ')
+KEYWORDS = frozenset(('NOASSERTION', 'UNKNOWN', 'NONE', 'SOURCE', 'BINARY', 'ARCHIVE', 'OTHER'))
+# Tags of the spdx-tools lexer the reader leaves to spdx-tools
+UNHANDLED_TAGS = frozenset(('ExternalDocumentRef', 'FilesAnalyzed'))
+CHECKSUM = re.compile(r'SHA1:\s*([a-f0-9]{40})')
+VERSION = re.compile(r'SPDX-(\d+)\.(\d+)')
+LICENSE_LIST_VERSION = re.compile(r'\d+\.\d+')
+VERIFICATION_CODE = re.compile(r'([0-9a-f]+)\s*(\(\s*(.+)\))?')
+ELEMENT_ID = re.compile(r'SPDXRef-[A-Za-z0-9.\-]+')
+SNIPPET_ID = re.compile(r'SPDXRef[A-Za-z0-9.\-]+')
+SNIPPET_FILE_ID = re.compile(r'(?:DocumentRef[A-Za-z0-9.\-]+:)?SPDXRef[A-Za-z0-9.\-]+')
+EXTERNAL_REF_TYPE = re.compile(r'[A-Za-z0-9.\-]+')
+# Characters of the license expressions spdx-tools reads the way LicenseExpressions does
+PLAIN_EXPRESSION = re.compile(r'[A-Za-z0-9.+\-()\s]+')
+EXPRESSION_WORD = re.compile(r'[^\s()]+')
+
+# Kinds of values: free form text between <text> tags, a single line of text, and a single line the handler checks
+TEXT, LINE_VALUE, RAW_VALUE = range(3)
+
+
+class Unsupported(Exception):
+    """
+    Raised by the reader on what it leaves to spdx-tools
+    """
+
+
+class TagValueReader:
+    """
+    Reads one single-package tag-value document into a document laid out like SPDX JSON
+    Tag-value annotations name the element they are about with SPDXREF, which is kept in the annotation
+    """
+
+    def __init__(self):
+        self.document = {'creationInfo': {'creators': []}, 'reviewers': [], 'annotations': [], 'packages': [],
+                         'files': [], 'snippets': []}
+        self.package = None
+        self.file = None
+        self.snippet = None
+        self.review = None
+        self.annotation = None
+        self.license = None
+        self.licenses = []
+        # ArtifactOfProjectName, HomePage and URI counts of each file, and the ones just read
+        self.artifacts = []
+        self.artifact_tail = ()
+        self.names = license_map()
+        self.expressions = set()
+
+    def read(self, text: str) -> dict:
+        """
+        :param text: The document
+        :return: The document laid out like SPDX JSON. Raises Unsupported if it has to be parsed by spdx-tools
+        """
+        self.feed(text)
+        self.validate()
+        return self.document
+
+    def feed(self, text: str):
+        """
+        Read part of the document, made of whole lines
+        :param text: The lines
+        :return: None. Raises Unsupported if the document has to be parsed by spdx-tools
+        """
+        handlers = HANDLERS
+        position = 0
+        end = len(text)
+        while position < end:
+            match = LINE.match(text, position)
+            if match is None:
+                raise Unsupported('Not a tag-value line')
+            position = match.end()
+            tag = match.group(1)
+            if tag is None:
+                continue
+            handler = handlers.get(tag)
+            if handler is None:
+                raise Unsupported(tag)
+            kind, method = handler
+            value = match.group(2)
+            if value.startswith('<text>'):
+                if kind != TEXT:
+                    raise Unsupported(tag)
+                start = match.start(2) + len('<text>')
+                close = text.find('</text>', start)
+                if close == -1:
+                    raise Unsupported(tag)
+                tail = TRAILING_SPACE.match(text, close + len('</text>'))
+                if tail is None:
+                    raise Unsupported(tag)
+                position = tail.end()
+                value = text[start:close]
+                if not value:
+                    raise Unsupported(tag)
+            else:
+                value = value.strip()
+                if kind == TEXT or not value:
+                    raise Unsupported(tag)
+                if kind == LINE_VALUE:
+                    self.line(value)
+            if self.artifact_tail and tag not in ARTIFACT_TAGS:
+                self.artifact_tail = ()
+            method(self, value)
+
+    def read_blocks(self, text: str) -> dict:
+        """
+        Read a shard of the file and snippet blocks of a document, as if the header of the document came before it
+        What the blocks may not change in a shard read on its own (the document, its creation information or its
+        package, and the elements started before the shard) makes the reader give up
+
+        :param text: The blocks, see dbom_wrapper.tagvalue.index_blocks
+        :return: Dict of the lists the blocks add to, see merge. Raises Unsupported if the document has to be read
+            as a whole
+        """
+        document = self.document
+        document['SPDXID'] = 'SPDXRef-DOCUMENT'
+        self.package = {'SPDXID': None}
+        self.feed(text)
+        if set(document) != set(BLOCK_DOCUMENT) or list(document['creationInfo']) != ['creators'] or len(
+                self.package) != 1:
+            raise Unsupported('Blocks change the document')
+        return {'creators': document['creationInfo']['creators'], 'reviewers': document['reviewers'],
+                'annotations': document['annotations'], 'files': document['files'],
+                'snippets': document['snippets'], 'licenses': self.licenses, 'artifacts': self.artifacts}
+
+    def merge(self, blocks: dict):
+        """
+        Add blocks read by read_blocks after what this reader read
+        :param blocks: Dict returned by read_blocks
+        """
+        if self.package is None or 'SPDXID' not in self.package or self.file is not None or self.snippet is not None:
+            raise Unsupported('Blocks before the package')
+        document = self.document
+        document['creationInfo']['creators'].extend(blocks['creators'])
+        for key in ('reviewers', 'annotations', 'files', 'snippets'):
+            document[key].extend(blocks[key])
+        self.licenses.extend(blocks['licenses'])
+        self.artifacts.extend(blocks['artifacts'])
+        # The elements the blocks started may not be continued by the next blocks
+        self.review = self.annotation = self.license = None
+
+    def validate(self):
+        """
+        Check what spdx-tools validates after parsing, and what the payload cannot do without: the supplier,
+        originator, version and description of the package
+        """
+        document = self.document
+        package = self.package
+        creation_info = document['creationInfo']
+        if (package is None or not creation_info['creators'] or 'created' not in creation_info
+                or any(key not in document for key in ('spdxVersion', 'dataLicense', 'name', 'SPDXID',
+                                                        'documentNamespace'))):
+            raise Unsupported('Incomplete document')
+        if (not document['files'] or not package.get('licenseInfoFromFiles')
+                or any(key not in package for key in ('SPDXID', 'downloadLocation', 'packageVerificationCode',
+                                                      'copyrightText', 'checksums', 'licenseConcluded',
+                                                      'licenseDeclared', 'supplier', 'originator', 'versionInfo',
+                                                      'description'))):
+            raise Unsupported('Incomplete package')
+        for file in document['files']:
+            if not file.get('licenseInfoInFiles') or any(key not in file for key in (
+                    'SPDXID', 'checksums', 'licenseConcluded', 'copyrightText')):
+                raise Unsupported('Incomplete file')
+        for names, homes, uris in self.artifacts:
+            if homes < max(names, uris):
+                raise Unsupported('Incomplete artifact')
+        for snippet in document['snippets']:
+            if not snippet.get('licenseInfoInSnippets') or any(key not in snippet for key in (
+                    'snippetFromFile', 'licenseConcluded', 'copyrightText')):
+                raise Unsupported('Incomplete snippet')
+        if any('reviewDate' not in review for review in document['reviewers']):
+            raise Unsupported('Incomplete review')
+        if any('annotationDate' not in annotation for annotation in document['annotations']):
+            raise Unsupported('Incomplete annotation')
+        if any('extractedText' not in extracted for extracted in self.licenses):
+            raise Unsupported('Incomplete extracted license')
+        document['packages'] = [package]
+
+    @staticmethod
+    def line(value: str, *keywords: str) -> str:
+        """
+        :param value: The value of a tag
+        :param keywords: The keywords the tag takes
+        :return: The value, if the spdx-tools lexer reads it as a line of text or as one of the keywords
+        """
+        if value in keywords:
+            return value
+        if value in HANDLERS or value in KEYWORDS or value in UNHANDLED_TAGS or SPECIAL_VALUE.match(value):
+            raise Unsupported(value)
+        return value
+
+    @staticmethod
+    def set(element: Optional[dict], key: str, value):
+        if element is None or key in element:
+            raise Unsupported(key)
+        element[key] = value
+
+    def expression(self, value: str) -> str:
+        """
+        :param value: A license expression
+        :return: The expression, if spdx-tools reads it the way LicenseExpressions does
+        """
+        if value in self.expressions or value in self.names or value.startswith('LicenseRef-'):
+            return value
+        if not PLAIN_EXPRESSION.fullmatch(value):
+            raise Unsupported(value)
+        for word in EXPRESSION_WORD.finditer(value):
+            operator = OPERATORS.get(word.group())
+            if operator is None:
+                continue
+            # spdx-tools only reads AND and OR after a single white space and before one, and has no WITH
+            start, end = word.span()
+            if (operator == 'WITH' or start < 2 or not value[start - 1].isspace() or value[start - 2].isspace()
+                    or end == len(value) or not value[end].isspace()):
+                raise Unsupported(value)
+        self.expressions.add(value)
+        return value
+
+    @staticmethod
+    def entity(value: str, tool: bool = True) -> str:
+        """
+        :param value: A Person, an Organization or, if tool, a Tool
+        :return: The value, if spdx-tools accepts it
+        """
+        if tool and value.startswith('Tool:'):
+            match = TOOL.match(value)
+            if match is None or not match.group(1).strip():
+                raise Unsupported(value)
+            return value
+        if not (value.startswith('Person:') or value.startswith('Organization:')) or len(value.split(':', 1)[1]) == 0:
+            raise Unsupported(value)
+        match = ENTITY.match(value)
+        if match is None or not match.group(1).strip():
+            raise Unsupported(value)
+        return value
+
+    @staticmethod
+    def date(value: str) -> str:
+        if not DATE.fullmatch(value):
+            raise Unsupported(value)
+        return value
+
+    @staticmethod
+    def checksums(value: str) -> list:
+        match = CHECKSUM.fullmatch(value)
+        if match is None:
+            raise Unsupported(value)
+        return [{'algorithm': 'SHA1', 'checksumValue': match.group(1)}]
+
+    # Document and creation information
+
+    def spdx_version(self, value):
+        match = VERSION.match(value)
+        if match is None:
+            raise Unsupported(value)
+        self.set(self.document, 'spdxVersion', f"SPDX-{int(match.group(1))}.{int(match.group(2))}")
+
+    def data_license(self, value):
+        if value != 'CC0-1.0':
+            raise Unsupported(value)
+        self.set(self.document, 'dataLicense', value)
+
+    def document_name(self, value):
+        self.set(self.document, 'name', value)
+
+    def spdx_id(self, value):
+        # spdx-tools gives the first SPDXID to the document, the second one to the package and the next ones to
+        # the files
+        if 'SPDXID' not in self.document:
+            if value != 'SPDXRef-DOCUMENT':
+                raise Unsupported(value)
+            self.document['SPDXID'] = value
+            return
+        if not ELEMENT_ID.fullmatch(value):
+            raise Unsupported(value)
+        if self.package is not None and 'SPDXID' not in self.package:
+            self.package['SPDXID'] = value
+        else:
+            self.set(self.file, 'SPDXID', value)
+
+    def document_comment(self, value):
+        self.set(self.document, 'comment', value)
+
+    def document_namespace(self, value):
+        if not value.startswith(('http://', 'https://', 'ftp://')) or '#' in value:
+            raise Unsupported(value)
+        self.set(self.document, 'documentNamespace', value)
+
+    def creator(self, value):
+        self.document['creationInfo']['creators'].append(self.entity(value))
+
+    def created(self, value):
+        self.set(self.document['creationInfo'], 'created', self.date(value))
+
+    def creator_comment(self, value):
+        self.set(self.document['creationInfo'], 'comment', value)
+
+    def license_list_version(self, value):
+        if not LICENSE_LIST_VERSION.fullmatch(value):
+            raise Unsupported(value)
+        self.set(self.document['creationInfo'], 'licenseListVersion', value)
+
+    # Reviews and annotations
+
+    def reviewer(self, value):
+        self.review = {'reviewer': self.entity(value)}
+        self.document['reviewers'].append(self.review)
+
+    def review_date(self, value):
+        self.set(self.review, 'reviewDate', self.date(value))
+
+    def review_comment(self, value):
+        self.set(self.review, 'comment', value)
+
+    def annotator(self, value):
+        # The payload gives the email of the annotator, which tools do not have
+        self.annotation = {'annotator': self.entity(value, tool=False)}
+        self.document['annotations'].append(self.annotation)
+
+    def annotation_date(self, value):
+        self.set(self.annotation, 'annotationDate', self.date(value))
+
+    def annotation_comment(self, value):
+        self.set(self.annotation, 'comment', value)
+
+    def annotation_type(self, value):
+        if value != 'REVIEW':
+            # OTHER is a keyword of the lexer, spdx-tools rejects it here
+            raise Unsupported(value)
+        self.set(self.annotation, 'annotationType', value)
+
+    def annotation_spdx_id(self, value):
+        self.set(self.annotation, 'SPDXREF', value)
+
+    # Package
+
+    def package_name(self, value):
+        if self.package is not None:
+            raise Unsupported('Several packages')
+        self.package = {'name': value}
+
+    def package_version(self, value):
+        self.set(self.package, 'versionInfo', value)
+
+    def package_file_name(self, value):
+        self.set(self.package, 'packageFileName', value)
+
+    def package_supplier(self, value):
+        self.set(self.package, 'supplier', self.entity(value, tool=False))
+
+    def package_originator(self, value):
+        self.set(self.package, 'originator', self.entity(value, tool=False))
+
+    def package_download_location(self, value):
+        self.set(self.package, 'downloadLocation', value)
+
+    def package_home_page(self, value):
+        self.set(self.package, 'homepage', self.line(value, 'NONE', 'NOASSERTION'))
+
+    def package_verification_code(self, value):
+        match = VERIFICATION_CODE.match(value)
+        if match is None:
+            raise Unsupported(value)
+        self.set(self.package, 'packageVerificationCode', {'packageVerificationCodeValue': match.group(1)})
+
+    def package_checksum(self, value):
+        self.set(self.package, 'checksums', self.checksums(value))
+
+    def package_source_info(self, value):
+        self.set(self.package, 'sourceInfo', value)
+
+    def package_license_concluded(self, value):
+        self.set(self.package, 'licenseConcluded', self.expression(value))
+
+    def package_license_info_from_files(self, value):
+        if self.package is None:
+            raise Unsupported(value)
+        self.package.setdefault('licenseInfoFromFiles', []).append(value)
+
+    def package_license_declared(self, value):
+        self.set(self.package, 'licenseDeclared', self.expression(value))
+
+    def package_license_comments(self, value):
+        self.set(self.package, 'licenseComments', value)
+
+    def package_copyright_text(self, value):
+        self.set(self.package, 'copyrightText', value)
+
+    def package_summary(self, value):
+        self.set(self.package, 'summary', value)
+
+    def package_description(self, value):
+        self.set(self.package, 'description', value)
+
+    def package_comment(self, value):
+        self.set(self.package, 'comment', value)
+
+    def external_ref(self, value):
+        parts = value.split()
+        if (self.package is None or len(parts) != 3 or parts[0].upper() not in ('SECURITY', 'OTHER', 'PACKAGE-MANAGER')
+                or not EXTERNAL_REF_TYPE.fullmatch(parts[1])):
+            raise Unsupported(value)
+        self.package.setdefault('externalRefs', []).append(
+            {'referenceCategory': parts[0], 'referenceType': parts[1], 'referenceLocator': parts[2]})
+
+    def external_ref_comment(self, value):
+        if self.package is None or not self.package.get('externalRefs'):
+            raise Unsupported(value)
+        # Not checked for cardinality by spdx-tools, the last comment wins
+        self.package['externalRefs'][-1]['comment'] = value
+
+    # Files
+
+    def file_name(self, value):
+        if self.package is None:
+            raise Unsupported(value)
+        self.file = {'fileName': value}
+        self.document['files'].append(self.file)
+        self.artifacts.append([0, 0, 0])
+
+    def file_type(self, value):
+        if value not in ('SOURCE', 'BINARY', 'ARCHIVE', 'OTHER'):
+            raise Unsupported(value)
+        self.set(self.file, 'fileTypes', [value])
+
+    def file_checksum(self, value):
+        self.set(self.file, 'checksums', self.checksums(value))
+
+    def license_concluded(self, value):
+        self.set(self.file, 'licenseConcluded', self.expression(value))
+
+    def license_info_in_file(self, value):
+        if self.file is None:
+            raise Unsupported(value)
+        self.file.setdefault('licenseInfoInFiles', []).append(value)
+
+    def license_comments(self, value):
+        self.set(self.file, 'licenseComments', value)
+
+    def file_copyright_text(self, value):
+        self.set(self.file, 'copyrightText', value)
+
+    def file_comment(self, value):
+        self.set(self.file, 'comment', value)
+
+    def file_notice(self, value):
+        self.set(self.file, 'noticeText', value)
+
+    def file_contributor(self, value):
+        if self.file is None:
+            raise Unsupported(value)
+
+    def file_dependency(self, value):
+        if self.file is None:
+            raise Unsupported(value)
+
+    def artifact_name(self, value):
+        if self.file is None:
+            raise Unsupported(value)
+        self.artifacts[-1][0] += 1
+        self.artifact_tail = ('ArtifactOfProjectName',)
+
+    def artifact_home_page(self, value):
+        self.artifact_rest(1, 'ArtifactOfProjectHomePage', value)
+
+    def artifact_uri(self, value):
+        self.artifact_rest(2, 'ArtifactOfProjectURI', value)
+
+    def artifact_rest(self, index: int, tag: str, value: str):
+        # The home page and the URI may only follow the project name, in any order
+        if self.artifact_tail[:1] != ('ArtifactOfProjectName',) or tag in self.artifact_tail:
+            raise Unsupported(tag)
+        self.line(value, 'UNKNOWN')
+        self.artifacts[-1][index] += 1
+        self.artifact_tail += (tag,)
+
+    # Snippets
+
+    def snippet_spdx_id(self, value):
+        if not SNIPPET_ID.fullmatch(value):
+            raise Unsupported(value)
+        self.snippet = {'SPDXID': value}
+        self.document['snippets'].append(self.snippet)
+
+    def snippet_name(self, value):
+        self.set(self.snippet, 'name', value)
+
+    def snippet_comment(self, value):
+        self.set(self.snippet, 'comment', value)
+
+    def snippet_copyright_text(self, value):
+        self.set(self.snippet, 'copyrightText', value)
+
+    def snippet_license_comments(self, value):
+        self.set(self.snippet, 'licenseComments', value)
+
+    def snippet_from_file(self, value):
+        if not SNIPPET_FILE_ID.fullmatch(value):
+            raise Unsupported(value)
+        self.set(self.snippet, 'snippetFromFile', value)
+
+    def snippet_license_concluded(self, value):
+        self.set(self.snippet, 'licenseConcluded', self.expression(value))
+
+    def license_info_in_snippet(self, value):
+        if self.snippet is None:
+            raise Unsupported(value)
+        self.snippet.setdefault('licenseInfoInSnippets', []).append(value)
+
+    # Licenses not on the SPDX license list, not part of the payload
+
+    def license_id(self, value):
+        if not value.startswith('LicenseRef-'):
+            raise Unsupported(value)
+        self.license = {'licenseId': value}
+        self.licenses.append(self.license)
+
+    def extracted_text(self, value):
+        self.set(self.license, 'extractedText', value)
+
+    def license_name(self, value):
+        self.set(self.license, 'name', self.line(value, 'NOASSERTION'))
+
+    def license_cross_reference(self, value):
+        if self.license is None:
+            raise Unsupported(value)
+
+    def license_comment(self, value):
+        self.set(self.license, 'comment', value)
+
+
+# Keys of a document read by TagValueReader.read_blocks
+BLOCK_DOCUMENT = ('creationInfo', 'reviewers', 'annotations', 'packages', 'files', 'snippets', 'SPDXID')
+ARTIFACT_TAGS = frozenset(('ArtifactOfProjectHomePage', 'ArtifactOfProjectURI'))
+
+# Kind of value and handler of each tag
+HANDLERS = {
+    'SPDXVersion': (LINE_VALUE, TagValueReader.spdx_version),
+    'DataLicense': (LINE_VALUE, TagValueReader.data_license),
+    'DocumentName': (LINE_VALUE, TagValueReader.document_name),
+    'SPDXID': (LINE_VALUE, TagValueReader.spdx_id),
+    'DocumentComment': (TEXT, TagValueReader.document_comment),
+    'DocumentNamespace': (LINE_VALUE, TagValueReader.document_namespace),
+    'Creator': (RAW_VALUE, TagValueReader.creator),
+    'Created': (RAW_VALUE, TagValueReader.created),
+    'CreatorComment': (TEXT, TagValueReader.creator_comment),
+    'LicenseListVersion': (LINE_VALUE, TagValueReader.license_list_version),
+    'Reviewer': (RAW_VALUE, TagValueReader.reviewer),
+    'ReviewDate': (RAW_VALUE, TagValueReader.review_date),
+    'ReviewComment': (TEXT, TagValueReader.review_comment),
+    'Annotator': (RAW_VALUE, TagValueReader.annotator),
+    'AnnotationDate': (RAW_VALUE, TagValueReader.annotation_date),
+    'AnnotationComment': (TEXT, TagValueReader.annotation_comment),
+    'AnnotationType': (LINE_VALUE, TagValueReader.annotation_type),
+    'SPDXREF': (LINE_VALUE, TagValueReader.annotation_spdx_id),
+    'PackageName': (LINE_VALUE, TagValueReader.package_name),
+    'PackageVersion': (LINE_VALUE, TagValueReader.package_version),
+    'PackageFileName': (LINE_VALUE, TagValueReader.package_file_name),
+    'PackageSupplier': (RAW_VALUE, TagValueReader.package_supplier),
+    'PackageOriginator': (RAW_VALUE, TagValueReader.package_originator),
+    'PackageDownloadLocation': (LINE_VALUE, TagValueReader.package_download_location),
+    'PackageHomePage': (RAW_VALUE, TagValueReader.package_home_page),
+    'PackageVerificationCode': (LINE_VALUE, TagValueReader.package_verification_code),
+    'PackageChecksum': (RAW_VALUE, TagValueReader.package_checksum),
+    'PackageSourceInfo': (TEXT, TagValueReader.package_source_info),
+    'PackageLicenseConcluded': (LINE_VALUE, TagValueReader.package_license_concluded),
+    'PackageLicenseInfoFromFiles': (LINE_VALUE, TagValueReader.package_license_info_from_files),
+    'PackageLicenseDeclared': (LINE_VALUE, TagValueReader.package_license_declared),
+    'PackageLicenseComments': (TEXT, TagValueReader.package_license_comments),
+    'PackageCopyrightText': (TEXT, TagValueReader.package_copyright_text),
+    'PackageSummary': (TEXT, TagValueReader.package_summary),
+    'PackageDescription': (TEXT, TagValueReader.package_description),
+    'PackageComment': (TEXT, TagValueReader.package_comment),
+    'ExternalRef': (LINE_VALUE, TagValueReader.external_ref),
+    'ExternalRefComment': (TEXT, TagValueReader.external_ref_comment),
+    'FileName': (LINE_VALUE, TagValueReader.file_name),
+    'FileType': (RAW_VALUE, TagValueReader.file_type),
+    'FileChecksum': (RAW_VALUE, TagValueReader.file_checksum),
+    'LicenseConcluded': (LINE_VALUE, TagValueReader.license_concluded),
+    'LicenseInfoInFile': (LINE_VALUE, TagValueReader.license_info_in_file),
+    'LicenseComments': (TEXT, TagValueReader.license_comments),
+    'FileCopyrightText': (TEXT, TagValueReader.file_copyright_text),
+    'FileComment': (TEXT, TagValueReader.file_comment),
+    'FileNotice': (TEXT, TagValueReader.file_notice),
+    'FileContributor': (LINE_VALUE, TagValueReader.file_contributor),
+    'FileDependency': (LINE_VALUE, TagValueReader.file_dependency),
+    'ArtifactOfProjectName': (LINE_VALUE, TagValueReader.artifact_name),
+    'ArtifactOfProjectHomePage': (RAW_VALUE, TagValueReader.artifact_home_page),
+    'ArtifactOfProjectURI': (RAW_VALUE, TagValueReader.artifact_uri),
+    'SnippetSPDXID': (LINE_VALUE, TagValueReader.snippet_spdx_id),
+    'SnippetName': (LINE_VALUE, TagValueReader.snippet_name),
+    'SnippetComment': (TEXT, TagValueReader.snippet_comment),
+    'SnippetCopyrightText': (TEXT, TagValueReader.snippet_copyright_text),
+    'SnippetLicenseComments': (TEXT, TagValueReader.snippet_license_comments),
+    'SnippetFromFileSPDXID': (LINE_VALUE, TagValueReader.snippet_from_file),
+    'SnippetLicenseConcluded': (LINE_VALUE, TagValueReader.snippet_license_concluded),
+    'LicenseInfoInSnippet': (LINE_VALUE, TagValueReader.license_info_in_snippet),
+    'LicenseID': (LINE_VALUE, TagValueReader.license_id),
+    'ExtractedText': (TEXT, TagValueReader.extracted_text),
+    'LicenseName': (RAW_VALUE, TagValueReader.license_name),
+    'LicenseCrossReference': (LINE_VALUE, TagValueReader.license_cross_reference),
+    'LicenseComment': (TEXT, TagValueReader.license_comment),
+}
+
+
+def make_annotation_list(annotations: [dict]):
+    """
+    Make the annotations of a tag-value document, like dbom_wrapper.convert.make_annotation_list
+    :param annotations: The annotations read by TagValueReader
+    :return: List of Annotation records
+    """
+    annotation_list = []
+    for annotation in annotations:
+        name, email = parse_entity(annotation['annotator'])
+        annotation_list.append(Annotation(annotation.get('SPDXREF'), annotation.get('comment'),
+                                          annotation.get('annotationType'), iso_date(annotation['annotationDate']),
+                                          name, email))
+    return annotation_list
+
+
+def read_blocks(text: str, metrics: Metrics = NO_METRICS) -> Optional[dict]:
+    """
+    Read a shard of the file and snippet blocks of a single-package SPDX tag-value document. Runs inside
+    the worker processes reading the shards of a document in parallel
+    :param text: The blocks, see dbom_wrapper.tagvalue.index_blocks
+    :param metrics: Metrics recording the parse stage
+    :return: What the blocks add to the document, to pass to read_tag_value. None if the document has to be
+        read as a whole
+    """
+    try:
+        with metrics.stage('parse'):
+            return TagValueReader().read_blocks(text)
+    except Unsupported:
+        return None
+
+
+def read_tag_value(text: str, table: LicenseTable = None, parsed: dict = None, metrics: Metrics = NO_METRICS,
+                   blocks: Iterable[Optional[dict]] = (), records: bool = False) -> Optional[Tuple[dict, dict]]:
+    """
+    Read a single-package SPDX tag-value document and convert it to a DBoM asset payload, the same one
+    dbom_wrapper.convert.create_dbom_asset_payload makes from the document parsed by spdx-tools
+
+    :param text: The document, or its header when blocks are given
+    :param table: LicenseTable of the document, a new one if None
+    :param parsed: License expressions already parsed, see LicenseExpressions
+    :param metrics: Metrics recording the parse and convert stages
+    :param blocks: The file and snippet blocks following the header, read by read_blocks, in their order
+    :param records: Keep the records of dbom_wrapper.types in the payload, see create_dbom_asset_payload
+    :return: A tuple of the document, laid out like SPDX JSON, and the asset payload. None if the document
+        has to be parsed by spdx-tools
+    """
+    try:
+        with metrics.stage('parse'):
+            reader = TagValueReader()
+            reader.feed(text)
+            for shard in blocks:
+                if shard is None:
+                    raise Unsupported('Blocks')
+                reader.merge(shard)
+            reader.validate()
+            document = reader.document
+        with metrics.stage('convert'):
+            package = document['packages'][0]
+            annotations = make_annotation_list(document['annotations'])
+            payload = create_dbom_asset_payload(document, (package, document['files'], document['snippets']),
+                                                table, parsed, annotations, records)
+    except (Unsupported, ValueError):
+        # ValueError covers the expressions LicenseExpressions rejects and dates that do not exist
+        return None
+    return document, payload
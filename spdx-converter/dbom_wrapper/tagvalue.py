@@ -0,0 +1,303 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Building and incremental use of the spdx-tools tag-value parser for SPDX KV (.tag) documents
+The document is read in blocks, one per file and per snippet, and fed block by block to the
+spdx-tools tag-value parser so that only one file or snippet is held in memory at a time
+The blocks can also be found in the bytes of the document and grouped into shards read in parallel
+"""
+
+import bisect
+import os
+import re
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+PARSER_CACHE_ENV = 'DBOM_PARSER_CACHE'
+PARSER_TABLES = 'spdx_tagvalue_parsetab.pickle'
+
+SECTION_TAGS = ('FileName', 'SnippetSPDXID')
+TAG_LINE = re.compile(r'^\s*([A-Za-z]+)\s*:')
+BLOCK_HAS_TAG = re.compile(r'^\s*[A-Za-z]+\s*:', re.MULTILINE)
+# Relationships are not supported by the spdx-tools tag-value parser, they are read by split_packages
+RELATIONSHIP_LINE = re.compile(r'^\s*Relationship\s*:\s*(\S+)\s+(\S+)\s+(\S+)\s*$')
+RELATIONSHIP_COMMENT = re.compile(r'^\s*RelationshipComment\s*:\s*(?:<text>)?(.*?)(?:</text>)?\s*$', re.DOTALL)
+# The lines starting a block, in the bytes of a document
+BLOCK_START = re.compile(rb'\n[ \t]*(?:FileName|SnippetSPDXID)[ \t]*:')
+
+
+@dataclass
+class Relationship:
+    """
+    A Relationship line of a tag-value document: spdx_id relationship related_id
+    """
+    spdx_id: str
+    relationship: str
+    related_id: str
+    comment: Optional[str] = None
+
+
+def parser_cache_dir() -> str:
+    """
+    Directory in which the parser tables are cached
+    :return: $DBOM_PARSER_CACHE if set, else dbom-spdx-converter in the user cache directory
+    """
+    if os.environ.get(PARSER_CACHE_ENV):
+        return os.environ[PARSER_CACHE_ENV]
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'dbom-spdx-converter')
+
+
+def build_parser(cache_dir: str = None):
+    """
+    Build an spdx-tools tag-value Parser, reusing the LALR tables cached in cache_dir
+    Generating the tables is most of the cost of building the parser. PLY checks the cached tables against
+    the grammar and regenerates them when they are stale. If cache_dir cannot be written the tables are
+    generated in memory, and no parser.out debug file is written either way
+    spdx-tools (and rdflib, which it imports) are only loaded here, the rest of this module does not need them
+
+    :param cache_dir: Directory holding the tables, defaults to parser_cache_dir()
+    :return: A built spdx.parsers.tagvalue.Parser
+    """
+    from ply import yacc
+    from spdx.parsers.loggers import StandardLogger
+    from spdx.parsers.tagvalue import Parser
+    from spdx.parsers.tagvaluebuilders import Builder
+
+    cache_dir = cache_dir or parser_cache_dir()
+    parser = Parser(Builder(), StandardLogger())
+    picklefile = os.path.join(cache_dir, PARSER_TABLES)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        parser.build(picklefile=picklefile, debug=False, errorlog=yacc.NullLogger())
+        return parser
+    except Exception:
+        # Unwritable directory, or tables torn by a concurrent writer: they are rewritten by the next build
+        try:
+            os.remove(picklefile)
+        except OSError:
+            pass
+    parser.build(write_tables=False, debug=False, errorlog=yacc.NullLogger())
+    return parser
+
+
+def reset_parser(parser):
+    """
+    Prepare a parser built by build_parser for a new document
+    The lexer keeps counting lines across inputs, and spdx-tools only resets the builder once a document is
+    parsed, which a document raising an exception skips
+    :param parser: An spdx.parsers.tagvalue.Parser
+    """
+    parser.lex.lexer.lineno = 1
+    parser.lex.lexer.begin('INITIAL')
+    parser.builder.reset()
+
+
+def iter_lines(lines: Iterable[str]) -> Iterator[Tuple[int, Optional[str], str]]:
+    """
+    Tag the lines of a tag-value document
+    :param lines: The lines of the document, e.g. an open file
+    :return: Generator of (line number, tag, line) tuples. The tag is None for lines without one, including
+        the continuation lines of multi-line <text> values
+    """
+    in_text = False
+    for number, line in enumerate(lines, 1):
+        match = None if in_text else TAG_LINE.match(line)
+        yield number, match.group(1) if match else None, line
+        # A text value stays open until a line closing it, the lexer does not allow nesting
+        opened = line.rfind('<text>')
+        if opened != -1 and line.find('</text>', opened) == -1:
+            in_text = True
+        elif in_text and '</text>' in line:
+            in_text = False
+
+
+def iter_blocks(lines: Iterable[str], section_tags=SECTION_TAGS) -> Iterator[Tuple[int, str, str]]:
+    """
+    Split a tag-value document into blocks. A new block starts at each line holding one of section_tags,
+    <text>...</text> values spanning several lines are never split
+
+    :param lines: The lines of the document, e.g. an open file
+    :param section_tags: Tags that start a new block
+    :return: Generator of (first line number, tag of the first line or None, block text) tuples.
+        The first block holds everything before the first section tag
+    """
+    block = []
+    start = 1
+    tag = None
+    for number, line_tag, line in iter_lines(lines):
+        if line_tag in section_tags:
+            if block:
+                yield start, tag, ''.join(block)
+            block, start, tag = [], number, line_tag
+        block.append(line)
+    if block:
+        yield start, tag, ''.join(block)
+
+
+def index_blocks(data) -> List[int]:
+    """
+    Find where the blocks of a tag-value document start, without decoding or splitting it into lines
+    A line is taken as starting a block as iter_blocks does, when the last <text> or </text> before it is not a
+    <text>. A stray <text> in a line value or a comment only hides the blocks up to the next </text>
+
+    :param data: The bytes of the document, e.g. an mmap of the file
+    :return: The offsets of the lines starting a block, in increasing order. The first line never starts one
+    """
+    starts = []
+    in_text = False
+    previous = 0
+    for match in BLOCK_START.finditer(data):
+        start = match.start() + 1
+        opened = data.rfind(b'<text>', previous, start)
+        closed = data.rfind(b'</text>', previous, start)
+        if opened != closed:
+            in_text = opened > closed
+        if not in_text:
+            starts.append(start)
+        previous = start
+    return starts
+
+
+def shard_blocks(starts: List[int], end: int, shards: int) -> List[Tuple[int, int]]:
+    """
+    Group consecutive blocks into shards of about the same size
+    :param starts: The offsets of the blocks, see index_blocks
+    :param end: The size of the document
+    :param shards: The number of shards wanted
+    :return: List of (start, end) offsets of the shards, at most shards of them, which cover the document from
+        the first block on
+    """
+    if not starts:
+        return []
+    size = (end - starts[0]) / max(1, shards)
+    bounds = [starts[0]]
+    for shard in range(1, shards):
+        index = bisect.bisect_left(starts, starts[0] + shard * size)
+        if index < len(starts) and starts[index] > bounds[-1]:
+            bounds.append(starts[index])
+    bounds.append(end)
+    return list(zip(bounds, bounds[1:]))
+
+
+def count_packages(lines: Iterable[str]) -> int:
+    """
+    Count the packages of a tag-value document without parsing it
+    :param lines: The lines of the document, e.g. an open file
+    :return: The number of PackageName tags
+    """
+    return sum(1 for _, tag, _ in iter_lines(lines) if tag == 'PackageName')
+
+
+def split_packages(lines: Iterable[str]) -> Tuple[str, List[str], List[Relationship]]:
+    """
+    Split a tag-value document describing several packages
+    Each package section runs from its PackageName line to the next one, so it holds the files and
+    snippets that follow the package. Relationship lines are taken out of the document
+
+    :param lines: The lines of the document, e.g. an open file
+    :return: A tuple of the document header (everything before the first package), the list of package
+        sections and the list of relationships. Header and section concatenated form a single-package document
+    """
+    header = []
+    packages = []
+    relationships = []
+    current = header
+    comment = None
+    for _, tag, line in iter_lines(lines):
+        if comment is not None and tag is None:
+            comment.append(line)
+            continue
+        if comment is not None:
+            relationships[-1].comment = RELATIONSHIP_COMMENT.match(''.join(comment)).group(1)
+            comment = None
+        if tag == 'Relationship':
+            match = RELATIONSHIP_LINE.match(line)
+            if match is None:
+                raise ValueError(f"Malformed relationship: {line.strip()}")
+            relationships.append(Relationship(*match.groups()))
+            continue
+        if tag == 'RelationshipComment' and relationships:
+            comment = [line]
+            continue
+        if tag == 'PackageName':
+            current = []
+            packages.append(current)
+        current.append(line)
+    if comment is not None:
+        relationships[-1].comment = RELATIONSHIP_COMMENT.match(''.join(comment)).group(1)
+    return ''.join(header), [''.join(package) for package in packages], relationships
+
+
+class StreamingParser:
+    """
+    Drives a built spdx-tools tag-value Parser one block at a time
+    Every file and snippet is handed out as soon as its block is parsed and then dropped from the document,
+    after parsing, document holds only the document level information
+
+    :param parser: A built spdx.parsers.tagvalue.Parser
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self.document = None
+        self.error = False
+
+    def parse(self, lines: Iterable[str]):
+        """
+        Parse a tag-value document incrementally
+
+        :param lines: The lines of the document, e.g. an open file
+        :return: Generator of ('file', spdx.file.File) and ('snippet', spdx.snippet.Snippet) tuples
+        """
+        from spdx.document import Document
+
+        p = self.parser
+        reset_parser(p)
+        p.document = self.document = Document()
+        p.error = False
+        messages = []
+        first_file = None
+        for start, tag, text in iter_blocks(lines):
+            if tag is None and not BLOCK_HAS_TAG.search(text):
+                continue
+            p.lex.lexer.lineno = start
+            p.yacc.parse(text, lexer=p.lex)
+            if tag == 'FileName' and self.document.package is not None and self.document.package.files:
+                spdx_file = self.document.package.files.pop()
+                messages = spdx_file.validate(messages)
+                if first_file is None:
+                    first_file = spdx_file
+                yield 'file', spdx_file
+            elif tag == 'SnippetSPDXID' and self.document.snippet:
+                snippet = self.document.snippet.pop()
+                messages = snippet.validate(messages)
+                yield 'snippet', snippet
+        p.builder.reset()
+
+        # Validate what is left of the document. A package needs at least one file to be valid,
+        # so the first file stands in for all of them
+        if first_file is not None:
+            self.document.package.files.append(first_file)
+        messages = self.document.validate(messages)
+        if first_file is not None:
+            self.document.package.files.remove(first_file)
+        if not p.error and messages:
+            for msg in messages:
+                p.logger.log(msg)
+            p.error = True
+        self.error = p.error
@@ -15,33 +15,42 @@ limitations under the License.
 """
 
 """
-Python dataclasses for Gateway entities
+Python dataclasses for Gateway entities, and the compact records of the asset metadata (see Record)
 """
 
+from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from datetime import datetime
-from typing import Any, TypeVar, Type, cast
-import dateutil.parser
+from typing import Any, Callable, Iterable, List, Optional, TypeVar, Type, cast
+
+from .schema import asset_errors, describe, parse_datetime
 
 T = TypeVar("T")
+R = TypeVar("R", bound="Record")
 
 
 def from_int(x: Any) -> int:
-    assert isinstance(x, int) and not isinstance(x, bool)
+    if type(x) is not int:
+        raise TypeError(f"Expected an integer, got {describe(x)}")
     return x
 
 
 def from_str(x: Any) -> str:
-    assert isinstance(x, str)
+    if type(x) is not str:
+        raise TypeError(f"Expected a string, got {describe(x)}")
     return x
 
 
 def from_datetime(x: Any) -> datetime:
-    return dateutil.parser.parse(x)
+    value = parse_datetime(from_str(x))
+    if value is None:
+        raise ValueError(f"{x!r} is not an ISO 8601 date")
+    return value
 
 
 def to_class(c: Type[T], x: Any) -> dict:
-    assert isinstance(x, c)
+    if not isinstance(x, c):
+        raise TypeError(f"Expected a {c.__name__}, got {type(x).__name__}")
     return cast(Any, x).to_dict()
 
 
@@ -61,7 +70,16 @@ class GatewayAsset:
 
     @staticmethod
     def from_dict(obj: Any) -> 'GatewayAsset':
-        assert isinstance(obj, dict)
+        """
+        Validate a whole asset, its metadata included, against the schema of its version (see dbom_wrapper.schema)
+        :param obj: The asset, as retrieved from the gateway
+        :return: The GatewayAsset. Raises dbom_wrapper.convert.ConversionError listing every problem of the asset
+        """
+        from .convert import ConversionError
+
+        errors = asset_errors(obj)
+        if errors:
+            raise ConversionError('Invalid asset', errors)
         standard_version = from_int(obj.get("standardVersion"))
         document_name = from_str(obj.get("documentName"))
         document_creator = from_str(obj.get("documentCreator"))
@@ -97,3 +115,348 @@ def gateway_asset_from_dict(s: Any) -> GatewayAsset:
 
 def gateway_asset_to_dict(x: GatewayAsset) -> Any:
     return to_class(GatewayAsset, x)
+
+
+def plain(value: Any) -> Any:
+    """
+    :return: value with the records it holds, at any depth, turned into dicts, e.g. a payload made with records=True
+    """
+    if isinstance(value, Record):
+        return value.to_dict()
+    if type(value) is list:
+        return [plain(item) for item in value]
+    if type(value) is dict:
+        return {key: plain(item) for key, item in value.items()}
+    return value
+
+
+class Record(ABC):
+    """
+    Base of the compact classes of the asset metadata
+    A record keeps its fields in __slots__, where a dict would take one object per file plus one per nested license
+    or annotator dict, which adds up for payloads of tens of thousands of files. Records read like the dicts they
+    stand for (record['key'], get, keys, items, in, == with dicts), so the code handling payloads takes either.
+    to_dict makes the plain dicts, from_dict reads them back, and dbom_wrapper.jsonstream encodes records as they
+    are, without making their dicts
+    """
+    __slots__ = ()
+    # JSON keys, in payload order
+    KEYS = ()
+    # JSON keys kept as is in an attribute. fields makes the other ones from several attributes
+    ATTRIBUTES = {}
+    # Keys left out when their attribute is None
+    OPTIONAL = frozenset()
+    # Attributes holding licenses, see map_licenses
+    LICENSE_ATTRIBUTES = ()
+
+    @abstractmethod
+    def fields(self) -> dict:
+        """
+        :return: The dict the record stands for, with the records it holds (files, licenses) left as they are
+        """
+
+    def to_dict(self) -> dict:
+        """
+        :return: The dict the record stands for, with the records it holds turned into dicts as well
+        """
+        return {key: plain(value) for key, value in self.fields().items()}
+
+    def keys(self):
+        if not self.OPTIONAL:
+            return self.KEYS
+        return tuple(key for key in self.KEYS
+                     if key not in self.OPTIONAL or getattr(self, self.ATTRIBUTES[key]) is not None)
+
+    def __getitem__(self, key: str):
+        attribute = self.ATTRIBUTES.get(key)
+        if attribute is None:
+            return self.fields()[key]
+        value = getattr(self, attribute)
+        if value is None and key in self.OPTIONAL:
+            raise KeyError(key)
+        return value
+
+    def get(self, key: str, default: Any = None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        return self.fields().items()
+
+    def values(self):
+        return self.fields().values()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __eq__(self, other):
+        if isinstance(other, Record):
+            other = other.fields()
+        if not isinstance(other, dict):
+            return NotImplemented
+        return self.fields() == other
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # Pickled as the values of the slots, in the order of the constructor arguments
+        return type(self), tuple(getattr(self, name) for name in self.__slots__)
+
+    def map_licenses(self, function: Callable[[Any], Any]):
+        """
+        Replace each license (or list of licenses) of the record by function(license)
+        """
+        for attribute in self.LICENSE_ATTRIBUTES:
+            setattr(self, attribute, function(getattr(self, attribute)))
+
+
+def _license(value: Any, licenses: Optional[dict]) -> Any:
+    """
+    Read a license as dbom_wrapper.convert.LicenseTable makes them: a license dict, an ID or a list of two operands
+    :param licenses: License records already read by their dict values, so that equal licenses share one record
+    """
+    if type(value) is dict:
+        key = (value.get('id'), value.get('url'), value.get('name'))
+        if licenses is None:
+            return License(*key)
+        made = licenses.get(key)
+        if made is None:
+            made = licenses[key] = License(*key)
+        return made
+    if type(value) is list:
+        return [_license(operand, licenses) for operand in value]
+    return value
+
+
+@dataclass(eq=False)
+class License(Record):
+    __slots__ = ('id', 'url', 'name')
+    id: str
+    url: Optional[str]
+    name: Optional[str]
+
+    KEYS = ('id', 'url', 'name')
+    ATTRIBUTES = {key: key for key in KEYS}
+
+    def fields(self) -> dict:
+        return {"id": self.id, "url": self.url, "name": self.name}
+
+    @staticmethod
+    def from_dict(obj: dict, licenses: dict = None) -> 'License':
+        return _license(obj, licenses)
+
+
+@dataclass(eq=False)
+class Review(Record):
+    __slots__ = ('reviewer', 'review_date', 'comment')
+    reviewer: str
+    review_date: str
+    comment: Optional[str]
+
+    KEYS = ('reviewer', 'reviewDate', 'comment')
+    ATTRIBUTES = {'reviewer': 'reviewer', 'reviewDate': 'review_date', 'comment': 'comment'}
+    OPTIONAL = frozenset(('comment',))
+
+    def fields(self) -> dict:
+        result = {"reviewer": self.reviewer, "reviewDate": self.review_date}
+        if self.comment is not None:
+            result["comment"] = self.comment
+        return result
+
+    @staticmethod
+    def from_dict(obj: dict, licenses: dict = None) -> 'Review':
+        return Review(obj['reviewer'], obj['reviewDate'], obj.get('comment'))
+
+
+@dataclass(eq=False)
+class Annotation(Record):
+    __slots__ = ('id', 'comment', 'type', 'date', 'annotator_name', 'annotator_email')
+    id: Optional[str]
+    comment: Optional[str]
+    type: str
+    date: str
+    annotator_name: str
+    annotator_email: Optional[str]
+
+    KEYS = ('id', 'comment', 'type', 'date', 'annotator')
+    ATTRIBUTES = {'id': 'id', 'comment': 'comment', 'type': 'type', 'date': 'date'}
+
+    def fields(self) -> dict:
+        return {"id": self.id, "comment": self.comment, "type": self.type, "date": self.date,
+                "annotator": {"name": self.annotator_name, "email": self.annotator_email}}
+
+    @staticmethod
+    def from_dict(obj: dict, licenses: dict = None) -> 'Annotation':
+        annotator = obj['annotator']
+        return Annotation(obj['id'], obj['comment'], obj['type'], obj['date'], annotator['name'], annotator['email'])
+
+
+@dataclass(eq=False)
+class File(Record):
+    __slots__ = ('name', 'type', 'id', 'license_comment', 'license_concluded', 'licenses_in_file', 'copyright',
+                 'comment', 'checksum', 'checksum_algorithm')
+    name: str
+    type: Optional[int]
+    id: str
+    license_comment: Optional[str]
+    license_concluded: Any
+    licenses_in_file: list
+    copyright: Optional[str]
+    comment: Optional[str]
+    checksum: str
+    checksum_algorithm: str
+
+    KEYS = ('name', 'type', 'id', 'license', 'copyright', 'comment', 'checksum', 'checksumAlgorithm')
+    ATTRIBUTES = {'name': 'name', 'type': 'type', 'id': 'id', 'copyright': 'copyright', 'comment': 'comment',
+                  'checksum': 'checksum', 'checksumAlgorithm': 'checksum_algorithm'}
+    LICENSE_ATTRIBUTES = ('license_concluded', 'licenses_in_file')
+
+    def fields(self) -> dict:
+        return {"name": self.name, "type": self.type, "id": self.id,
+                "license": {"comment": self.license_comment, "concluded": self.license_concluded,
+                            "fromFile": self.licenses_in_file},
+                "copyright": self.copyright, "comment": self.comment, "checksum": self.checksum,
+                "checksumAlgorithm": self.checksum_algorithm}
+
+    @staticmethod
+    def from_dict(obj: dict, licenses: dict = None) -> 'File':
+        license = obj['license']
+        return File(obj['name'], obj['type'], obj['id'], license['comment'], _license(license['concluded'], licenses),
+                    _license(license['fromFile'], licenses), obj['copyright'], obj['comment'], obj['checksum'],
+                    obj['checksumAlgorithm'])
+
+
+@dataclass(eq=False)
+class Snippet(Record):
+    __slots__ = ('id', 'name', 'comment', 'copyright', 'license_comment', 'license_concluded', 'licenses_in_snippet',
+                 'from_file_id')
+    id: str
+    name: Optional[str]
+    comment: Optional[str]
+    copyright: Optional[str]
+    license_comment: Optional[str]
+    license_concluded: Any
+    licenses_in_snippet: list
+    from_file_id: str
+
+    KEYS = ('id', 'name', 'comment', 'copyright', 'license', 'fromFileID')
+    ATTRIBUTES = {'id': 'id', 'name': 'name', 'comment': 'comment', 'copyright': 'copyright',
+                  'fromFileID': 'from_file_id'}
+    LICENSE_ATTRIBUTES = ('license_concluded', 'licenses_in_snippet')
+
+    def fields(self) -> dict:
+        return {"id": self.id, "name": self.name, "comment": self.comment, "copyright": self.copyright,
+                "license": {"comment": self.license_comment, "concluded": self.license_concluded,
+                            "inSnippet": self.licenses_in_snippet},
+                "fromFileID": self.from_file_id}
+
+    @staticmethod
+    def from_dict(obj: dict, licenses: dict = None) -> 'Snippet':
+        license = obj['license']
+        return Snippet(obj['id'], obj['name'], obj['comment'], obj['copyright'], license['comment'],
+                       _license(license['concluded'], licenses), _license(license['inSnippet'], licenses),
+                       obj['fromFileID'])
+
+
+@dataclass(eq=False)
+class Package(Record):
+    __slots__ = ('name', 'id', 'version', 'download_location', 'summary', 'source_info', 'file_name', 'supplier_name',
+                 'supplier_email', 'originator_name', 'originator_email', 'checksum', 'checksum_algorithm',
+                 'verification_code', 'description', 'comment', 'copyright', 'license_comment', 'license_declared',
+                 'license_concluded', 'licenses_from_files', 'files')
+    name: str
+    id: str
+    version: Optional[str]
+    download_location: Optional[str]
+    summary: Optional[str]
+    source_info: Optional[str]
+    file_name: Optional[str]
+    supplier_name: Optional[str]
+    supplier_email: Optional[str]
+    originator_name: Optional[str]
+    originator_email: Optional[str]
+    checksum: str
+    checksum_algorithm: str
+    verification_code: Optional[str]
+    description: Optional[str]
+    comment: Optional[str]
+    copyright: Optional[str]
+    license_comment: Optional[str]
+    license_declared: Any
+    license_concluded: Any
+    licenses_from_files: list
+    files: list
+
+    KEYS = ('name', 'id', 'version', 'downloadLocation', 'summary', 'sourceInfo', 'fileName', 'supplierName',
+            'supplierEmail', 'originatorName', 'originatorEmail', 'checksum', 'checksumAlgorithm', 'verificationCode',
+            'description', 'comment', 'copyright', 'license', 'files')
+    ATTRIBUTES = {'name': 'name', 'id': 'id', 'version': 'version', 'downloadLocation': 'download_location',
+                  'summary': 'summary', 'sourceInfo': 'source_info', 'fileName': 'file_name',
+                  'supplierName': 'supplier_name', 'supplierEmail': 'supplier_email',
+                  'originatorName': 'originator_name', 'originatorEmail': 'originator_email',
+                  'checksum': 'checksum', 'checksumAlgorithm': 'checksum_algorithm',
+                  'verificationCode': 'verification_code', 'description': 'description', 'comment': 'comment',
+                  'copyright': 'copyright', 'files': 'files'}
+    LICENSE_ATTRIBUTES = ('license_declared', 'license_concluded', 'licenses_from_files')
+
+    def fields(self) -> dict:
+        return {"name": self.name, "id": self.id, "version": self.version,
+                "downloadLocation": self.download_location, "summary": self.summary,
+                "sourceInfo": self.source_info, "fileName": self.file_name, "supplierName": self.supplier_name,
+                "supplierEmail": self.supplier_email, "originatorName": self.originator_name,
+                "originatorEmail": self.originator_email, "checksum": self.checksum,
+                "checksumAlgorithm": self.checksum_algorithm, "verificationCode": self.verification_code,
+                "description": self.description, "comment": self.comment, "copyright": self.copyright,
+                "license": {"comment": self.license_comment, "declared": self.license_declared,
+                            "concluded": self.license_concluded, "fromFile": self.licenses_from_files},
+                "files": self.files}
+
+    @staticmethod
+    def from_dict(obj: dict, licenses: dict = None) -> 'Package':
+        if licenses is None:
+            licenses = {}
+        license = obj['license']
+        return Package(obj['name'], obj['id'], obj['version'], obj['downloadLocation'], obj['summary'],
+                       obj['sourceInfo'], obj['fileName'], obj['supplierName'], obj['supplierEmail'],
+                       obj['originatorName'], obj['originatorEmail'], obj['checksum'], obj['checksumAlgorithm'],
+                       obj['verificationCode'], obj['description'], obj['comment'], obj['copyright'],
+                       license['comment'], _license(license['declared'], licenses),
+                       _license(license['concluded'], licenses), _license(license['fromFile'], licenses),
+                       from_dicts(File, obj['files'], licenses))
+
+
+def from_dicts(record_type: Type[R], items: Iterable[dict], licenses: dict = None) -> List[R]:
+    """
+    Read the dicts of a payload array, e.g. the files of a retrieved asset, into records
+    :param record_type: The Record class of the items
+    :param licenses: License records already read, shared by the items. A new cache if None
+    :return: List of the records
+    """
+    if licenses is None:
+        licenses = {}
+    from_dict = record_type.from_dict
+    return [from_dict(item, licenses) for item in items]
+
+
+def to_dicts(records: Iterable[Record]) -> List[dict]:
+    """
+    :return: The plain dicts of records, see Record.to_dict
+    """
+    return [record.to_dict() for record in records]
+
+
+def json_default(obj: Any) -> dict:
+    """
+    The default argument of json.dumps for payloads holding records
+    """
+    if isinstance(obj, Record):
+        return obj.fields()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -17,44 +17,221 @@ limitations under the License.
 """
 
 """
-Python script to take a SPDX KV (.tag) file and send it to an instance of the DBoM Gateway
-This does not push/link any sub-asset dependencies at the moment
+Python script to take a SPDX KV (.tag) or SPDX JSON file and send it to an instance of the DBoM Gateway
+SPDX JSON files, told apart by their .json extension or their opening brace, are converted by dbom_wrapper.spdxjson
+Either may be gzip or zstd compressed (.gz, .zst), it is then decompressed while it is read
+With --split-packages, each package of a multi-package document becomes its own asset and the packages
+it depends on or contains are attached to it as sub-assets
 
 NOTE: This script needs Python 3.7+ since it uses dataclasses (PEP 557)
 To know which arguments to specify, run this script with the --help argument
+
+The script can be imported: main() runs it with a list of arguments. spdx-tools, the HTTP clients and
+multiprocessing are slow to import, so they are imported by the code paths that need them rather than
+here. --help, argument errors and cached conversions never load spdx-tools
 """
 
 import argparse
+import gc
+import glob
+import http
 import json
+import mmap
+import os
+import sys
+from typing import TYPE_CHECKING
+
+from dbom_wrapper.cache import PayloadCache
+from dbom_wrapper.compression import input_compression, open_input, strip_extension
+from dbom_wrapper.convert import ConversionError, LicenseTable, combine_packages, create_dbom_asset_payload, make_file, make_snippet
+from dbom_wrapper.delta import diff_assets
+from dbom_wrapper.jsonstream import SpooledArray, iterencode
+from dbom_wrapper.metrics import NO_METRICS, Metrics, measured, profiled
+from dbom_wrapper.retry import RetryPolicy
+from dbom_wrapper.spdxjson import (convert_spdx_json, convert_spdx_json_packages, creator_name, is_spdx_json,
+                                   load_spdx_json)
+from dbom_wrapper.tagreader import read_blocks, read_tag_value
+from dbom_wrapper.tagvalue import (StreamingParser, build_parser, count_packages, index_blocks, reset_parser,
+                                   shard_blocks, split_packages)
+
+if TYPE_CHECKING:
+    from dbom_wrapper.graph import AssetGraph
+
+
+def build_arg_parser():
+    """
+    Build the command line parser of this script
+    :return: An argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(description='Utility to convert SPDX tag-value and JSON files ')
+    parser.add_argument('-g', '--gateway', type=str,
+                        help='The full address (with schema) at which the gateway can be reached', required=True)
+    parser.add_argument('-r', '--repo', type=str,
+                        help='The repository ID on which the channel you want to use exists', required=True)
+    parser.add_argument('-c', '--channel', type=str,
+                        help='The channel ID on which you want to commit the BoM', required=True)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('-f', '--file', type=str,
+                        help='The SPDX KV Tag (or SPDX JSON file) that has to be sent')
+    source.add_argument('-d', '--directory', type=str,
+                        help='A directory whose .tag and .spdx.json files (searched recursively, optionally .gz or '
+                             '.zst compressed) have to be sent')
+    source.add_argument('-G', '--glob', type=str,
+                        help='A glob pattern (quote it) matching the SPDX KV Tags that have to be sent')
+    source.add_argument('-m', '--manifest', type=str,
+                        help='A file listing one SPDX KV Tag path per line. Relative paths are resolved '
+                             'against the directory of the manifest')
+    parser.add_argument('-s', '--stream', action='store_true',
+                        help='Read the file incrementally and spool the converted files and snippets to disk, '
+                             'keeping memory use bounded for very large documents. SPDX JSON files are read '
+                             'at once')
+    parser.add_argument('-q', '--quiet', '--no-dump', dest='quiet', action='store_true',
+                        help='Do not print the converted payload')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help='Number of worker processes used to parse files in batch mode, or the blocks of a '
+                             'large single file (default: CPU count)')
+    parser.add_argument('-p', '--pool-size', type=int, default=10,
+                        help='Number of pooled keep-alive connections (and concurrent uploads) to the gateway')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='Upload with the asyncio client in batch mode. --pool-size then bounds the number of '
+                             'requests in flight')
+    parser.add_argument('--cache-dir', type=str, default=os.environ.get('DBOM_CACHE_DIR'),
+                        help='Directory caching the converted payloads, files unchanged since their last successful '
+                             'upload to the same target are skipped (default: $DBOM_CACHE_DIR, no cache if unset)')
+    parser.add_argument('--cache-size', type=int, default=512,
+                        help='Size in MB above which the least recently used cached payloads are evicted')
+    parser.add_argument('--delta', choices=['gateway', 'cache'],
+                        help='Compare the converted payload with the asset already stored and only send it if they '
+                             'differ. The stored asset is retrieved from the gateway, or with "cache" taken from the '
+                             'payload last sent from --cache-dir when there is one')
+    parser.add_argument('-P', '--split-packages', action='store_true',
+                        help='Convert each package of a multi-package document to its own asset, with the packages it '
+                             'depends on or contains (per its Relationship lines) attached as sub-assets. Sub-assets '
+                             'are pushed first, --pool-size assets at a time')
+    parser.add_argument('-L', '--license-table', action='store_true',
+                        help='List each license once in a licenses table of the asset and refer to it by ID from the '
+                             'package, files and snippets, instead of repeating it for each of them')
+    parser.add_argument('--full-parser', action='store_true',
+                        help='Parse SPDX KV Tags with the spdx-tools parser only. By default they are read by the '
+                             'fast tag-value reader, and only those it does not handle are parsed by spdx-tools')
+    parser.add_argument('-z', '--gzip', action='store_true',
+                        help='Upload the payloads gzip compressed (Content-Encoding: gzip) and report the bytes saved')
+    parser.add_argument('-i', '--idextra', type=str,
+                        help='String to append to the id. For testing purposes')
+    RetryPolicy.add_arguments(parser)
+    Metrics.add_arguments(parser)
+    return parser
+
+# Below this many characters of package sections, starting worker processes costs more than it saves
+PARALLEL_PACKAGES_MIN_SIZE = 1024 * 1024
+# Below this many bytes, reading the file and snippet blocks of a document in worker processes costs more than it saves
+PARALLEL_BLOCKS_MIN_SIZE = 16 * 1024 * 1024
+# Shards per worker process, so that the workers finish about together
+SHARDS_PER_JOB = 4
+# Files sent from a --directory
+INPUT_PATTERNS = tuple(pattern + extension for pattern in ('*.tag', '*.spdx.json') for extension in ('', '.gz', '.zst'))
+
+# Part of the payload cache keys, bump it whenever the payload produced for a given file changes
+CONVERTER_VERSION = '1'
+
+args = None
+metrics = NO_METRICS
+_tag_parser = None
+_api = None
+_cache = None
+
+
+def get_api():
+    """
+    Return the gateway client shared by all uploads of this run
+    :return: A GatewayAPI instance
+    """
+    global _api
+    if _api is None:
+        from dbom_wrapper.api import GatewayAPI
+
+        _api = GatewayAPI(address=args.gateway, pool_size=args.pool_size, retry_policy=RetryPolicy.from_args(args),
+                          metrics=metrics, compress=args.gzip)
+    return _api
+
+
+def get_cache():
+    """
+    Return the payload cache of this run
+    :return: A PayloadCache instance, or None if caching is disabled
+    """
+    global _cache
+    if _cache is None and args.cache_dir:
+        # A file gives another payload with a licenses table
+        version = f"{CONVERTER_VERSION}-licenses" if args.license_table else CONVERTER_VERSION
+        _cache = PayloadCache(args.cache_dir, args.cache_size * 1024 * 1024, version)
+        # Apply a --cache-size lowered since the last run
+        _cache.evict()
+    return _cache
+
+
+def upload_target(asset_id: str):
+    """
+    Describe where an asset is sent by this run, to match it against the cached uploads
+    :param asset_id: The asset ID used on the gateway
+    :return: A dict identifying the target
+    """
+    return PayloadCache.upload_target(args.gateway, args.repo, args.channel, asset_id)
+
 
-from spdx.creationinfo import *
-from spdx.annotation import Annotation
-from spdx.document import Document
-from spdx.document import License
-from spdx.package import ExternalPackageRef
-from spdx.package import Package
-from spdx.parsers.loggers import StandardLogger
-from spdx.parsers.tagvalue import Parser
-from spdx.parsers.tagvaluebuilders import Builder
-from spdx.review import Review
-from spdx.snippet import Snippet
-
-from dbom_wrapper.api import GatewayAPI
-from dbom_wrapper.types import GatewayAsset
-
-parser = argparse.ArgumentParser(description='Utility to convert SPDX tag-value files ')
-parser.add_argument('-g', '--gateway', type=str,
-                    help='The full address (with schema) at which the gateway can be reached', required=True)
-parser.add_argument('-r', '--repo', type=str,
-                    help='The repository ID on which the channel you want to use exists', required=True)
-parser.add_argument('-c', '--channel', type=str,
-                    help='The channel ID on which you want to commit the BoM', required=True)
-parser.add_argument('-f', '--file', type=str,
-                    help='The SPDX KV Tag that has to be sent', required=True)
-parser.add_argument('-i', '--idextra', type=str,
-                    help='String to append to the id. For testing purposes')
-
-args = parser.parse_args()
+def stored_asset(asset_id: str):
+    """
+    Fetch the asset currently stored under asset_id, for --delta
+    :param asset_id: The asset ID used on the gateway
+    :return: The stored asset as a dict, or None if it does not exist
+    """
+    from dbom_wrapper.api import APIException
+
+    cache = get_cache()
+    if args.delta == 'cache' and cache is not None:
+        entry = cache.find_upload(upload_target(asset_id))
+        if entry is not None:
+            return entry.load_payload()
+    try:
+        chunks = get_api().retreive_asset_stream(args.repo, args.channel, asset_id, verbose=False)
+        return json.loads(b''.join(chunks))
+    except APIException as e:
+        if e.status_code == http.HTTPStatus.NOT_FOUND:
+            return None
+        raise
+
+
+def needs_upload(asset_id: str, payload, verbose: bool = True):
+    """
+    Compare a payload with the stored asset and report the differences, for --delta
+    :param asset_id: The asset ID used on the gateway
+    :param payload: The converted asset payload
+    :param verbose: Print every change rather than their number
+    :return: True if the asset does not exist or differs from payload
+    """
+    previous = stored_asset(asset_id)
+    if previous is None:
+        if verbose:
+            print(f"Asset {asset_id} does not exist yet")
+        return True
+    changes = diff_assets(previous, payload)
+    if not changes:
+        print(f"Asset {asset_id} is up to date")
+        return False
+    print(f"Asset {asset_id} has {len(changes)} changes")
+    if verbose:
+        for change in changes:
+            print(f"  {change}")
+    return True
+
+
+def make_asset_id(asset_id: str):
+    """
+    Append the testing suffix, if any, to an asset ID
+    :param asset_id: A string with assetID
+    :return: The asset ID to use on the gateway
+    """
+    return f"{asset_id}-{args.idextra}" if args.idextra else asset_id
 
 
 def create_asset(asset_id: str, payload: dict):
@@ -64,302 +241,697 @@ def create_asset(asset_id: str, payload: dict):
     :param payload: A dict representing the payload
     :return: None
     """
-    api = GatewayAPI(address=args.gateway)
-    if args.idextra:
-        asset_id = f"{asset_id}-{args.idextra}"
+    api = get_api()
+    asset_id = make_asset_id(asset_id)
     print(f"Using channel {args.channel} on repo {args.repo}")
     api.create_asset(args.repo, args.channel, asset_id, payload)
     printsep()
-    print(f"You can find the asset at {args.gateway}/api/v1/repo/{args.repo}/chan/{args.channel}/asset/{asset_id}")
+    print(f"You can find the asset at {api.asset_url(args.repo, args.channel, asset_id)}")
 
 
-def make_creator_string(creators: []):
+def send_asset(asset_id: str, payload, entry=None):
     """
-    Creates a string from the creator information in the SPDX document
-    :param creators: Array of creationinfo objects
-    :return: string equivalent
+    Send a converted payload to the gateway, unless --delta finds the stored asset is the same
+    :param asset_id: A string with assetID
+    :param payload: A dict representing the payload
+    :param entry: The cache entry of the payload, to record the upload in
+    :return: None
     """
-    creator_list = []
-    for creator in creators:
-        if type(creator) != Tool:
-            creator_list.append(f"{creator.name} <{creator.email}>" if creator.email else creator.name)
-        else:
-            creator_list.append(f"[Using: {creator.name}]")
-    return ', '.join(creator_list)
+    gateway_id = make_asset_id(asset_id)
+    if args.delta and not needs_upload(gateway_id, payload):
+        print("Skipping upload")
+    else:
+        print("Sending BoM to gateway")
+        create_asset(asset_id, payload)
+    if entry is not None:
+        get_cache().record_upload(entry, upload_target(gateway_id))
+
+
+def printsep():
+    """
+    Print Separator
+    :return: None
+    """
+    print("=" * 80)
+
+
+def print_payload(payload):
+    """
+    Print an asset payload unless --quiet was given
+    :param payload: The asset payload
+    :return: None
+    """
+    if args.quiet:
+        return
+    print("Payload:")
+    printsep()
+    for chunk in iterencode(payload, indent=True):
+        sys.stdout.write(chunk)
+    print()
+
+
+def get_tag_parser():
+    """
+    Return the tag-value parser of this process, building it on first use.
+    Building the PLY lexer and parser is expensive, so a process builds it once and reuses it for every file,
+    and the parser tables are cached on disk for the next processes
+    :return: A built spdx tag-value Parser
+    """
+    global _tag_parser
+    if _tag_parser is None:
+        _tag_parser = build_parser()
+    return _tag_parser
 
 
-def make_review_list(reviews: [Review]):
+def parse_file(file: str):
     """
-    Make Review List from SPDX review spec
+    Parse an SPDX KV (.tag) file with the parser of this process
+    :param file: Path of the file to parse
+    :return: A tuple of the SPDX document and a flag that is True when errors were encountered
+    """
+    p = get_tag_parser()
+    reset_parser(p)
+    with open_input(file) as f:
+        return p.parse(f.read())
+
 
-    :param reviews: SPDX review Object
-    :return: List of dicts with metadata of reviews
+def stream_file(file: str, shared_licenses: bool = False):
+    """
+    Parse an SPDX KV (.tag) file incrementally and convert it to an asset payload
+    Files and snippets are converted as soon as they are read and spooled to temporary files, the payload
+    refers to them through SpooledArray objects which the encoders in dbom_wrapper.jsonstream write out lazily
+    :param file: Path of the file to convert
+    :param shared_licenses: Give the payload a licenses table, see --license-table
+    :return: A tuple of the SPDX document (without files and snippets), a flag that is True when errors were
+        encountered and the asset payload
+    """
+    reader = StreamingParser(get_tag_parser())
+    table = LicenseTable(shared_licenses)
+    files = SpooledArray()
+    snippets = SpooledArray()
+    with open_input(file) as f:
+        for kind, item in reader.parse(f):
+            if kind == 'file':
+                files.append(make_file(item, table))
+            else:
+                snippets.append(make_snippet(item, table))
+    if reader.error:
+        return reader.document, True, None
+
+    payload = create_dbom_asset_payload(reader.document, table, records=True)
+    payload['assetMetadata']['package'].files = files
+    payload['assetMetadata']['snippets'] = snippets
+    return reader.document, False, payload
+
+
+def convert_json_file(file: str):
     """
-    proc_reviews = []
-    for review in reviews:
-        t_dict = {
-            "reviewer": review.reviewer.name,
-            "reviewDate": review.review_date_iso_format,
-        }
-        if review.has_comment:
-            t_dict["comment"] = review.comment
-        proc_reviews.append(t_dict)
-    return proc_reviews
+    Parse an SPDX JSON file and convert it to an asset payload
+    :param file: Path of the file to convert
+    :return: A tuple of the SPDX JSON document, a flag that is True when errors were encountered and the
+        asset payload
+    """
+    try:
+        with metrics.stage('parse'):
+            document = load_spdx_json(file)
+        return document, False, convert_spdx_json(document, args.license_table, metrics, records=True)
+    except ConversionError as e:
+        print(e)
+        return None, True, None
 
 
-def make_pkgref_list(refs: [ExternalPackageRef]):
+def convert_file(file: str, shared_licenses: bool = False, fast_reader: bool = True, metrics: Metrics = NO_METRICS):
+    """
+    Parse an SPDX KV (.tag) or SPDX JSON file and convert it to an asset payload. Runs inside the batch worker
+    processes
+    :param file: Path of the file to convert
+    :param shared_licenses: Give the payload a licenses table, see --license-table
+    :param fast_reader: Read tag-value with dbom_wrapper.tagreader first, see --full-parser
+    :param metrics: Metrics recording the parse and convert stages
+    :return: A tuple of the asset ID and the asset payload
     """
-      Make PkgRef List from SPDX review spec
+    metrics.count('input_bytes', os.path.getsize(file))
+    if is_spdx_json(file):
+        with metrics.stage('parse'):
+            document = load_spdx_json(file)
+        payload = convert_spdx_json(document, shared_licenses, metrics, records=True)
+        return payload['assetMetadata']['package']['id'], payload
+    if is_multi_package(file):
+        # Already inside a worker process, the packages are converted one after the other
+        document, error, payload = convert_multi_package(file, 1, shared_licenses, fast_reader, metrics)
+    else:
+        # Already inside a worker process, the file is read at once
+        document, error, payload = convert_single_package(file, 1, shared_licenses, fast_reader, metrics)
+    if error:
+        raise ValueError('Errors encountered while parsing')
+    return payload['assetMetadata']['package']['id'], payload
 
-      :param refs: SPDX ExtPkgRef Object
-      :return: List of dicts with metadata of Refs
-      """
-    proc_refs = []
-    for ref in refs:
-        t_dict = {
-            "category": ref.category,
-            "locator": ref.locator,
-            "type": ref.pkg_ext_ref_type
-        }
-        if ref.comment:
-            t_dict["comment"] = ref.comment
-        proc_refs.append(t_dict)
-    return proc_refs
 
-def rec_make_license(license):
+def read_shard(file: str, start: int, end: int, metrics: Metrics = NO_METRICS):
+    """
+    Read a shard of the file and snippet blocks of an SPDX KV (.tag) file. Runs inside the shard worker processes
+    :param file: Path of the file
+    :param start: Offset of the first block of the shard
+    :param end: Offset following the last block of the shard
+    :param metrics: Metrics recording the parse stage
+    :return: What the blocks add to the document, see dbom_wrapper.tagreader.read_blocks
+    """
+    with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end].decode('utf-8')
+    return read_blocks(text, metrics)
+
+
+def read_sharded(file: str, jobs: int, shared_licenses: bool = False, metrics: Metrics = NO_METRICS):
+    """
+    Read a large single-package SPDX KV (.tag) file with dbom_wrapper.tagreader, its file and snippet blocks
+    in up to jobs worker processes. The document header is read here once the shards are read
+    The file is memory-mapped, the blocks are indexed in place and each worker only decodes its shards
+    :param file: Path of the file to convert
+    :param jobs: Maximum number of worker processes
+    :param shared_licenses: Give the payload a licenses table, see --license-table
+    :param metrics: Metrics recording the parse and convert stages, including those of the worker processes
+    :return: A tuple of the document, laid out like SPDX JSON, and the asset payload. None if the file is too
+        small to be worth it, or has to be read as a whole
+    """
+    if jobs <= 1 or os.path.getsize(file) < PARALLEL_BLOCKS_MIN_SIZE or input_compression(file):
+        return None
+    with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        with metrics.stage('parse'):
+            starts = index_blocks(data)
+        shards = shard_blocks(starts, len(data), jobs * SHARDS_PER_JOB)
+        if len(shards) < 2:
+            return None
+        header = data[:shards[0][0]].decode('utf-8')
+    from concurrent.futures import ProcessPoolExecutor
+
+    blocks = []
+    # Unpickling the shards and building the payload allocate millions of objects that all stay alive,
+    # the collections they trigger would only scan them again and again
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        with ProcessPoolExecutor(max_workers=min(jobs, len(shards))) as pool:
+            for result, summary in pool.map(measured, [read_shard] * len(shards), [file] * len(shards),
+                                            *zip(*shards)):
+                metrics.merge(summary)
+                blocks.append(result)
+        return read_tag_value(header, LicenseTable(shared_licenses), metrics=metrics, blocks=blocks, records=True)
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def convert_single_package(file: str, jobs: int = 1, shared_licenses: bool = False, fast_reader: bool = True,
+                           metrics: Metrics = NO_METRICS):
+    """
+    Parse an SPDX KV (.tag) file describing one package and convert it to an asset payload
+    The file is read by dbom_wrapper.tagreader, in shards read in parallel when it is large, and parsed by
+    spdx-tools if the reader gives up on it
+    :param file: Path of the file to convert
+    :param jobs: Maximum number of worker processes reading the shards of the file
+    :param shared_licenses: Give the payload a licenses table, see --license-table
+    :param fast_reader: Read the file with dbom_wrapper.tagreader first, see --full-parser
+    :param metrics: Metrics recording the parse and convert stages
+    :return: A tuple of the document (laid out like SPDX JSON when read by dbom_wrapper.tagreader), a flag
+        that is True when errors were encountered and the asset payload
+    """
+    if fast_reader:
+        read = read_sharded(file, jobs, shared_licenses, metrics)
+        if read is None:
+            with open_input(file) as f:
+                read = read_tag_value(f.read(), LicenseTable(shared_licenses), metrics=metrics, records=True)
+        if read is not None:
+            return read[0], False, read[1]
+    with metrics.stage('parse'):
+        document, error = parse_file(file)
+    with metrics.stage('convert'):
+        payload = None if error else create_dbom_asset_payload(document, LicenseTable(shared_licenses), records=True)
+    return document, error, payload
+
+
+def is_multi_package(file: str):
     """
-      Make PkgRef List from SPDX review spec
+    Check whether an SPDX KV (.tag) file describes more than one package
+    :param file: Path of the file
+    :return: True if the file has several PackageName tags
+    """
+    with open_input(file) as f:
+        return count_packages(f) > 1
 
-      :param refs: SPDX ExtPkgRef Object
-      :return: List of dicts with metadata of Refs
-      """
 
-    #for attr in dir(license.license_1):
-    #  print("license.license_1.%s = %r" % (attr, getattr(license.license_1, attr)))
+def convert_section(text: str, shared_licenses: bool = False, fast_reader: bool = True,
+                    metrics: Metrics = NO_METRICS):
+    """
+    Parse a single-package tag-value document and convert it to an asset payload. Runs inside the
+    package worker processes
+    :param text: The document header followed by one package section, see split_packages
+    :param shared_licenses: Give the payload a licenses table, see --license-table
+    :param fast_reader: Read the document with dbom_wrapper.tagreader first, see --full-parser
+    :param metrics: Metrics recording the parse and convert stages
+    :return: A tuple of the package SPDX ID and the asset payload
+    """
+    read = read_tag_value(text, LicenseTable(shared_licenses), metrics=metrics, records=True) if fast_reader else None
+    if read is not None:
+        return read[0]['packages'][0]['SPDXID'], read[1]
+    p = get_tag_parser()
+    reset_parser(p)
+    with metrics.stage('parse'):
+        document, error = p.parse(text)
+    if error:
+        name = text.split('PackageName:', 1)[-1].splitlines()[0].strip()
+        raise ValueError(f"Errors encountered while parsing package {name}")
+    with metrics.stage('convert'):
+        payload = create_dbom_asset_payload(document, LicenseTable(shared_licenses), records=True)
+        return document.package.spdx_id, payload
+
+
+def convert_sections(header: str, sections: [str], jobs: int, shared_licenses: bool = False,
+                     fast_reader: bool = True, metrics: Metrics = NO_METRICS):
+    """
+    Convert the package sections of a document, each one with the document header, in a pool of worker processes
+    Small documents are converted in this process
+    :param header: The document header, see split_packages
+    :param sections: List of package sections
+    :param jobs: Maximum number of worker processes
+    :param shared_licenses: Give the payloads a licenses table, see --license-table
+    :param fast_reader: Read the sections with dbom_wrapper.tagreader first, see --full-parser
+    :param metrics: Metrics recording the parse and convert stages, including those of the worker processes
+    :return: List of (package SPDX ID, asset payload) tuples, in the order of sections
+    """
+    texts = [header + section for section in sections]
+    jobs = max(1, min(jobs or 1, len(texts)))
+    if jobs == 1 or sum(len(section) for section in sections) < PARALLEL_PACKAGES_MIN_SIZE:
+        return [convert_section(text, shared_licenses, fast_reader, metrics) for text in texts]
+    from concurrent.futures import ProcessPoolExecutor
+
+    converted = []
+    with ProcessPoolExecutor(max_workers=jobs, initializer=get_tag_parser) as pool:
+        for result, summary in pool.map(measured, [convert_section] * len(texts), texts,
+                                        [shared_licenses] * len(texts), [fast_reader] * len(texts)):
+            metrics.merge(summary)
+            converted.append(result)
+    return converted
+
+
+def convert_multi_package(file: str, jobs: int, shared_licenses: bool = False, fast_reader: bool = True,
+                          metrics: Metrics = NO_METRICS):
+    """
+    Parse an SPDX KV (.tag) file describing several packages and convert it to a single asset payload
+    The first package is converted here, the other ones in up to jobs worker processes
+    :param file: Path of the file to convert
+    :param jobs: Maximum number of worker processes
+    :param shared_licenses: Give the payload a licenses table, see --license-table
+    :param fast_reader: Read the packages with dbom_wrapper.tagreader first, see --full-parser
+    :param metrics: Metrics recording the parse and convert stages
+    :return: A tuple of the SPDX document of the first package (laid out like SPDX JSON when read by
+        dbom_wrapper.tagreader), a flag that is True when errors were encountered and the asset payload
+    """
+    with open_input(file) as f:
+        header, sections, relationships = split_packages(f)
+    read = read_tag_value(header + sections[0], LicenseTable(shared_licenses), metrics=metrics,
+                          records=True) if fast_reader else None
+    if read is not None:
+        document, payload = read
+    else:
+        p = get_tag_parser()
+        reset_parser(p)
+        with metrics.stage('parse'):
+            document, error = p.parse(header + sections[0])
+        if error:
+            return document, True, None
+        with metrics.stage('convert'):
+            payload = create_dbom_asset_payload(document, LicenseTable(shared_licenses), records=True)
+    try:
+        others = convert_sections(header, sections[1:], jobs, shared_licenses, fast_reader, metrics)
+    except ValueError as e:
+        print(e)
+        return document, True, None
+    payload = combine_packages(payload, [other for _, other in others], relationships)
+    return document, False, payload
+
+
+def convert_packages(file: str):
+    """
+    Split a multi-package SPDX KV (.tag) or SPDX JSON file and convert each package, with the document
+    information, to its own asset payload
+    :param file: Path of the file to convert
+    :return: An AssetGraph of the payloads, keyed by asset ID and linked according to the relationships
+    """
+    from dbom_wrapper.graph import AssetGraph
 
-    if type(license) == License:
-      license_dict = {
-        "id": license.identifier,
-        "url": license.url,
-        "name": license.full_name
-      }
+    if is_spdx_json(file):
+        with metrics.stage('parse'):
+            document = load_spdx_json(file)
+        converted, relationships = convert_spdx_json_packages(document, args.license_table, metrics, records=True)
     else:
-      license_dict = [rec_make_license(license.license_1), rec_make_license(license.license_2)]
-    return license_dict
-
-def make_license_list(licenses : [License]):
-    """
-      Make PkgRef List from SPDX review spec
-
-      :param refs: SPDX ExtPkgRef Object
-      :return: List of dicts with metadata of Refs
-      """
-
-    license_list = []
-    for license in licenses:
-      license_list.append({
-        "id": license.identifier,
-        "url": license.url,
-        "name": license.full_name
-      })
-    return license_list
-
-def make_license(package):
-    """
-      Make PkgRef List from SPDX review spec
-
-      :param refs: SPDX ExtPkgRef Object
-      :return: List of dicts with metadata of Refs
-      """
-    license_dict = {
-      "comment" : package.license_comment,
-      "declared": rec_make_license(package.license_declared),
-      "concluded": rec_make_license(package.conc_lics),
-      "fromFile": make_license_list(package.licenses_from_files)
-    }
-    return license_dict
-
-def make_license_file(file):
-    """
-      Make PkgRef List from SPDX review spec
-
-      :param refs: SPDX ExtPkgRef Object
-      :return: List of dicts with metadata of Refs
-      """
-    license_dict = {
-      "comment" : file.license_comment,
-      "concluded": rec_make_license(file.conc_lics),
-      "fromFile": make_license_list(file.licenses_in_file)
-    }
-    return license_dict
-
-def make_license_snippet(snippet):
-    """
-      Make PkgRef List from SPDX review spec
-
-      :param refs: SPDX ExtPkgRef Object
-      :return: List of dicts with metadata of Refs
-      """
-    license_dict = {
-      "comment" : snippet.license_comment,
-      "concluded": rec_make_license(snippet.conc_lics),
-      "inSnippet": make_license_list(snippet.licenses_in_snippet)
-    }
-    return license_dict
-
-def make_files(package):
-    """
-      Make PkgRef List from SPDX review spec
-
-      :param refs: SPDX ExtPkgRef Object
-      :return: List of dicts with metadata of Refs
-      """
+        with open_input(file) as f:
+            header, sections, relationships = split_packages(f)
+        if not sections:
+            raise ValueError('The document has no package')
+        converted = convert_sections(header, sections, args.jobs, args.license_table, not args.full_parser, metrics)
+
+    graph = AssetGraph()
+    asset_ids = {}
+    for spdx_id, payload in converted:
+        asset_id = asset_ids[spdx_id] = make_asset_id(spdx_id)
+        if asset_id in graph.nodes:
+            raise ValueError(f"Package {spdx_id} is described twice")
+        graph.add(asset_id, payload)
+    graph.link_relationships(relationships, asset_ids)
+    for node in graph.nodes.values():
+        if node.children:
+            node.payload['assetMetadata']['relationships'] = [
+                {"relationship": relationship, "assetId": child_id}
+                for child_id, relationship in node.children.items()
+            ]
+    return graph
+
+
+def push_packages(graph: 'AssetGraph'):
+    """
+    Send the assets of a package graph to the gateway, each one after its sub-assets, and attach the
+    sub-assets to it. Print a per-asset summary
+    :param graph: An AssetGraph
+    :return: True if every asset was sent
+    """
+    from dbom_wrapper.api import DbomException
+    from dbom_wrapper.graph import push_graph
+
+    api = get_api()
+
+    def push(node):
+        if args.delta and not needs_upload(node.asset_id, node.payload, verbose=False):
+            return None
+        response = api.create_asset(args.repo, args.channel, node.asset_id, node.payload, verbose=False)
+        for child_id, relationship in node.children.items():
+            api.attach_subasset(args.repo, args.channel, node.asset_id, args.repo, args.channel, child_id,
+                                relationship)
+        return response.status_code
+
+    print(f"Using channel {args.channel} on repo {args.repo}")
+    results = push_graph(graph, push, args.pool_size)
+
+    printsep()
+    print("Summary:")
+    failed = 0
+    for asset_id in graph.order():
+        result = results[asset_id]
+        children = graph.nodes[asset_id].children
+        links = f" (sub-assets: {', '.join(children)})" if children else ''
+        if result.success:
+            print(f"OK     {asset_id}{links}")
+        else:
+            failed += 1
+            message = result.error.message if isinstance(result.error, DbomException) else result.error
+            print(f"FAILED {asset_id} ({message})")
+    print(f"{len(results) - failed} succeeded, {failed} failed")
+    printsep()
+    return not failed
+
+
+def collect_files(cli_args):
+    """
+    Collect the list of files to convert from the batch arguments (directory, glob or manifest)
+    :param cli_args: The parsed command line arguments
+    :return: A list of file paths
+    """
+    if cli_args.directory:
+        return sorted(file for pattern in INPUT_PATTERNS
+                      for file in glob.glob(os.path.join(cli_args.directory, '**', pattern), recursive=True))
+    if cli_args.glob:
+        return sorted(glob.glob(cli_args.glob, recursive=True))
+    base = os.path.dirname(os.path.abspath(cli_args.manifest))
     files = []
-    for file in package.files:
-      files.append({
-        "name": file.name,
-        "type": file.type,
-        "id": file.spdx_id,
-        "license": make_license_file(file),
-        "copyright": file.copyright,
-        "comment": file.comment,
-        "checksum": file.chk_sum.value,
-        "checksumAlgorithm": file.chk_sum.identifier,
-      })
+    with open(cli_args.manifest) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                files.append(os.path.join(base, line))
     return files
 
-def make_annotation_list(annotations : [Annotation]):
-
-    annotation_list = []
-    for annotation in annotations:
-      annotation_list.append({
-        "id": annotation.spdx_id,
-        "comment": annotation.comment,
-        "type": annotation.annotation_type,
-        "date": annotation.annotation_date_iso_format,
-        "annotator" : {
-          "name": annotation.annotator.name,
-          "email": annotation.annotator.email
-        }
-      })
-    return annotation_list
-
-def make_snippet_list(snippets : [Snippet]):
-
-    snippet_list = []
-    for snippet in snippets:
-      snippet_list.append({
-        "id": snippet.spdx_id,
-        "name": snippet.name,
-        "comment": snippet.comment,
-        "copyright": snippet.copyright,
-        "license": make_license_snippet(snippet),
-        "fromFileID" : snippet.snip_from_file_spdxid
-      })
-    return snippet_list
-
-def make_package(package):
-    """
-      Make PkgRef List from SPDX review spec
-
-      :param refs: SPDX ExtPkgRef Object
-      :return: List of dicts with metadata of Refs
-      """
-    
-    package_dict = {
-      "name" : package.name,
-      "id": package.spdx_id,
-      "version": package.version,
-      "downloadLocation": package.download_location,
-      "summary": package.summary,
-      "sourceInfo": package.source_info,
-      "fileName": package.file_name,
-      "supplierName": package.supplier.name,
-      "supplierEmail": package.supplier.email,
-      "originatorName": package.originator.name,
-      "originatorEmail": package.originator.email,
-      "checksum": package.check_sum.value,
-      "checksumAlgorithm": package.check_sum.identifier,
-      "verificationCode": package.verif_code,
-      "description": package.description,
-      "comment": package.comment,
-      "copyright": package.cr_text,
-      "license": make_license(package),
-      "files": make_files(package)
-    }
-    return package_dict
-
-
-def create_dbom_asset_payload(spdx_document: Document):
-    """
-    Creates a payload that the gateway would accept using ONLY package information from spdx_document
-
-    :param spdx_document: An SPDX document object generated by the SPDX Python SDK
-    :return: A valid asset payload for the gateway
-    """
-    metadata_dict = {
-        "reviews": make_review_list(spdx_document.reviews),
-        "license": document.package.license_declared.identifier,
-        "extrefs": make_pkgref_list(spdx_document.package.pkg_ext_refs),
-        "package": make_package(spdx_document.package),
-        "id": spdx_document.spdx_id,
-        "namespace": spdx_document.namespace,
-        "comment": spdx_document.comment,
-        "dataLicense": rec_make_license(spdx_document.data_license),
-        "annotations": make_annotation_list(spdx_document.annotations),
-        "snippets": make_snippet_list(spdx_document.snippet)
-    }
-
-    payload = GatewayAsset(
-        document_name=spdx_document.name,
-        document_creator=make_creator_string(document.creation_info.creators),
-        document_created_date=document.creation_info.created,
-        asset_type="SoftwareComponent",
-        asset_sub_type="BuildArtifact",
-        asset_manufacturer=f"{document.package.originator.name} [{document.package.supplier.name}]",
-        asset_description=document.package.description,
-        asset_model_number=document.package.version,
-        asset_metadata=metadata_dict,
-        manufacture_signature="NOT SIGNED (DEMO)"
-    )
-    return payload.to_dict()
 
+def convert_files(files: [str], jobs: int):
+    """
+    Convert files to asset payloads in a pool of worker processes. Each worker builds its parser once
+    and reuses it for all the files it is handed
+    :param files: List of file paths
+    :param jobs: Maximum number of worker processes
+    :return: Generator of (file, (asset_id, payload), error) tuples, in the order of files
+    """
+    jobs = max(1, min(jobs or 1, len(files)))
+    if jobs == 1:
+        for file in files:
+            try:
+                yield file, convert_file(file, args.license_table, not args.full_parser, metrics), None
+            except Exception as e:
+                yield file, None, e
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Workers converting SPDX JSON files only do not need the tag-value parser
+    initializer = None if all(strip_extension(file).lower().endswith('.json') for file in files) else get_tag_parser
+    with ProcessPoolExecutor(max_workers=jobs, initializer=initializer) as pool:
+        futures = [(file, pool.submit(measured, convert_file, file, args.license_table, not args.full_parser))
+                   for file in files]
+        for file, future in futures:
+            try:
+                converted, summary = future.result()
+            except Exception as e:
+                yield file, None, e
+                continue
+            metrics.merge(summary)
+            yield file, converted, None
+
+
+async def create_assets_async(assets):
+    """
+    Upload (asset_id, payload) tuples with the asyncio client
+    The tuples come from a blocking generator, which is advanced on an executor thread so the event loop keeps running
+    :param assets: Generator of (asset_id, payload) tuples
+    :return: List of AssetResult, in the order of assets
+    """
+    import asyncio
+    from dbom_wrapper.async_api import AsyncGatewayAPI
 
-def printsep():
+    loop = asyncio.get_event_loop()
+
+    async def pull():
+        while True:
+            item = await loop.run_in_executor(None, next, assets, None)
+            if item is None:
+                return
+            yield item
+
+    async with AsyncGatewayAPI(args.gateway, max_in_flight=args.pool_size,
+                               retry_policy=RetryPolicy.from_args(args), metrics=metrics, compress=args.gzip) as api:
+        return await api.create_assets(args.repo, args.channel, pull())
+
+
+def run_batch(files: [str]):
     """
-    Print Separator
-    :return: None
+    Parse and convert files in parallel, send the converted payloads to the gateway over the pooled
+    connections and print a per-file summary
+    :param files: List of file paths
+    :return: True if every file was converted and sent
     """
-    print("=" * 80)
+    from dbom_wrapper.api import DbomException
+
+    errors = {}
+    uploaded = []
+    cache = get_cache()
+    keys = {}
+    cached = {}
+    unchanged = set()
+    if cache is not None:
+        for file in files:
+            try:
+                keys[file] = cache.key(file)
+            except OSError:
+                # Left to the conversion, which reports the error
+                continue
+            entry = cache.get(keys[file])
+            if entry is None:
+                continue
+            if entry.upload == upload_target(make_asset_id(entry.asset_id)):
+                unchanged.add(file)
+            else:
+                cached[file] = entry
+        print(f"{len(unchanged)} files unchanged since their last upload, {len(cached)} already converted")
+    pending = [file for file in files if file not in unchanged and file not in cached]
+    print(f"Converting {len(pending)} files using {args.jobs} workers")
+
+    def to_send(file, asset_id, payload, entry):
+        gateway_id = make_asset_id(asset_id)
+        if args.delta:
+            try:
+                changed = needs_upload(gateway_id, payload, verbose=False)
+            except Exception as e:
+                errors[file] = f"Delta check failed: {e}"
+                return None
+            if not changed:
+                unchanged.add(file)
+                if entry is not None:
+                    cache.record_upload(entry, upload_target(gateway_id))
+                return None
+        uploaded.append((file, entry))
+        return gateway_id, payload
+
+    def converted_assets():
+        for file, entry in cached.items():
+            asset = to_send(file, entry.asset_id, entry.load_payload(), entry)
+            if asset is not None:
+                yield asset
+        for file, converted, error in convert_files(pending, args.jobs):
+            if error is not None:
+                errors[file] = f"Conversion failed: {error}"
+                continue
+            asset_id, payload = converted
+            entry = cache.put(keys[file], asset_id, payload) if file in keys else None
+            asset = to_send(file, asset_id, payload, entry)
+            if asset is not None:
+                yield asset
 
+    print(f"Using channel {args.channel} on repo {args.repo}")
+    if args.use_async:
+        import asyncio
+
+        results = asyncio.run(create_assets_async(converted_assets()))
+    else:
+        results = get_api().create_assets(args.repo, args.channel, converted_assets())
+    for (file, entry), result in zip(uploaded, results):
+        if not result.success:
+            message = result.error.message if isinstance(result.error, DbomException) else result.error
+            errors[file] = f"Upload failed: {message}"
+        elif entry is not None:
+            cache.record_upload(entry, upload_target(result.asset_id))
+
+    printsep()
+    print("Summary:")
+    for file in files:
+        error = errors.get(file)
+        if error is not None:
+            print(f"FAILED {file} ({error})")
+        else:
+            print(f"OK     {file}" + (' (unchanged, not sent)' if file in unchanged else ''))
+    print(f"{len(files) - len(errors)} succeeded ({len(unchanged)} unchanged), {len(errors)} failed")
+    printsep()
+    return not errors
+
+
+def main(argv: [str] = None):
+    """
+    Run the converter
+    :param argv: The command line arguments, defaults to sys.argv[1:]
+    :return: The exit status
+    """
+    global args, metrics
+    parser = build_arg_parser()
+    args = parser.parse_args(argv)
+    if args.split_packages and not args.file:
+        parser.error('--split-packages requires -f/--file')
+    metrics = Metrics()
+    try:
+        with profiled(args.profile):
+            return run()
+    finally:
+        metrics.report(args)
+
+
+def run():
+    """
+    Convert and send the files given by the command line arguments
+    :return: The exit status
+    """
+    if not args.file:
+        files = collect_files(args)
+        if not files:
+            raise SystemExit('No input files found')
+        return 0 if run_batch(files) else 1
 
-if __name__ == '__main__':
-    p = Parser(Builder(), StandardLogger())
-    p.build()
     file = args.file
+    if args.split_packages:
+        print(f"Attempting to parse the packages of file {file}")
+        package_graph = convert_packages(file)
+        print(f"Converted {len(package_graph.nodes)} packages")
+        for node in package_graph.nodes.values():
+            print_payload(node.payload)
+        return 0 if push_packages(package_graph) else 1
+
+    cache = get_cache()
+    entry = None
+    if cache is not None:
+        key = cache.key(file)
+        entry = cache.get(key)
+    if entry is not None:
+        asset_id = make_asset_id(entry.asset_id)
+        if entry.upload == upload_target(asset_id):
+            print(f"File {file} is unchanged since its last upload, skipping")
+            print(f"You can find the asset at {get_api().asset_url(args.repo, args.channel, asset_id)}")
+            return 0
+        print(f"Using the cached conversion of file {file}")
+        asset_payload = entry.load_payload()
+        print_payload(asset_payload)
+        printsep()
+
+        send_asset(entry.asset_id, asset_payload, entry)
+        return 0
+
     print(f"Attempting to parse file {file}")
-    with open(file) as f:
-        data = f.read()
-        document, error = p.parse(data)
-        if not error:
-            print('Parsing Successful. Summary:')
-            printsep()
+    metrics.count('input_bytes', os.path.getsize(file))
+    asset_payload = None
+    if is_spdx_json(file):
+        document, error, asset_payload = convert_json_file(file)
+    elif is_multi_package(file):
+        document, error, asset_payload = convert_multi_package(file, args.jobs, args.license_table,
+                                                               not args.full_parser, metrics)
+    elif args.stream:
+        # Files and snippets are converted as they are parsed, so the conversion counts as parsing
+        with metrics.stage('parse'):
+            document, error, asset_payload = stream_file(file, args.license_table)
+    elif not args.full_parser:
+        document, error, asset_payload = convert_single_package(file, args.jobs, args.license_table, True, metrics)
+    else:
+        with metrics.stage('parse'):
+            document, error = parse_file(file)
+    if not error:
+        print('Parsing Successful. Summary:')
+        printsep()
+        if isinstance(document, dict):
+            print('Document Version {0}'.format(document['spdxVersion'].replace('SPDX-', '')))
+            print('Package name : {0}'.format(document['packages'][0]['name']))
+        else:
             print('Document Version {0}.{1}'.format(document.version.major,
                                                     document.version.minor))
             print('Package name : {0}'.format(document.package.name))
-            print('Creators : ')
+        if asset_payload is not None and 'packages' in asset_payload['assetMetadata']:
+            print('Other packages : {0}'.format(len(asset_payload['assetMetadata']['packages'])))
+        print('Creators : ')
+        if isinstance(document, dict):
+            for creator in document['creationInfo']['creators']:
+                print(creator_name(creator))
+        else:
             for creator in document.creation_info.creators:
                 print(creator.name)
-            printsep()
+        printsep()
 
-            print("Creating DBOM Asset Payload")
-            asset_payload = create_dbom_asset_payload(document)
-            print("Success. Payload:")
-            printsep()
-            print(json.dumps(asset_payload, indent=True))
-            printsep()
+        print("Creating DBOM Asset Payload")
+        if asset_payload is None:
+            with metrics.stage('convert'):
+                asset_payload = create_dbom_asset_payload(document, LicenseTable(args.license_table), records=True)
+        print("Success")
+        print_payload(asset_payload)
+        printsep()
 
-            print("Sending BoM to gateway")
-            create_asset(document.package.spdx_id, asset_payload)
-        else:
-            print('Errors encountered while parsing')
+        spdx_id = asset_payload['assetMetadata']['package']['id']
+        if cache is not None:
+            entry = cache.put(key, spdx_id, asset_payload)
+
+        send_asset(spdx_id, asset_payload, entry)
+    else:
+        print('Errors encountered while parsing')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Tests of convert_spdx_to_payload on documents using the NOASSERTION and NONE values, and of its errors
+"""
+
+import json
+import os
+
+import pytest
+
+from conftest import ROOT
+from dbom_wrapper.convert import ConversionError, convert_spdx_to_payload
+
+REPLACEMENTS = [
+    ('PackageDownloadLocation: http://org1.com/example', 'PackageDownloadLocation: NOASSERTION'),
+    ('PackageSupplier: Organization: org1', 'PackageSupplier: NOASSERTION'),
+    ('PackageCopyrightText: <text> Copyright 2019,20 org1 Inc</text>', 'PackageCopyrightText: NOASSERTION'),
+    ('PackageLicenseDeclared: (Apache-2.0 AND MPL-1.1)', 'PackageLicenseDeclared: NONE'),
+    ('PackageLicenseConcluded: (Apache-1.0 AND Apache-2.0 AND MPL-1.1)', 'PackageLicenseConcluded: NOASSERTION'),
+    ('PackageLicenseInfoFromFiles: MPL-1.1', 'PackageLicenseInfoFromFiles: NONE'),
+    ('LicenseConcluded: Apache-2.0\nLicenseInfoInFile: Apache-2.0\n'
+     'FileCopyrightText: <text>Copyright 2010, 2011 Source Auditor Inc.</text>',
+     'LicenseConcluded: NONE\nLicenseInfoInFile: NOASSERTION\nFileCopyrightText: NONE'),
+]
+
+
+def license(identifier):
+    return {'id': identifier, 'url': f"http://spdx.org/licenses/{identifier}", 'name': identifier}
+
+
+@pytest.fixture(scope='module')
+def unasserted():
+    with open(os.path.join(ROOT, 'sbom.tag'), encoding='utf-8') as f:
+        text = f.read()
+    for old, new in REPLACEMENTS:
+        assert old in text
+        text = text.replace(old, new)
+    return text
+
+
+@pytest.mark.parametrize('shared_licenses', [False, True])
+def test_noassertion_and_none_are_kept_as_strings(unasserted, shared_licenses):
+    payload = convert_spdx_to_payload(unasserted, shared_licenses=shared_licenses)
+
+    # Plain JSON, without any spdx-tools object left in it
+    assert json.loads(json.dumps(payload)) == payload
+    metadata = payload['assetMetadata']
+    package = metadata['package']
+    assert metadata['license'] == 'NONE'
+    assert (package['downloadLocation'], package['copyright']) == ('NOASSERTION', 'NOASSERTION')
+    assert (package['supplierName'], package['supplierEmail']) == (None, None)
+    assert payload['assetManufacturer'] == 'Example Team [None]'
+    assert package['files'][0]['copyright'] == 'NONE'
+    if not shared_licenses:
+        assert package['license']['declared'] == license('NONE')
+        assert package['license']['concluded'] == license('NOASSERTION')
+        assert package['license']['fromFile'][2] == license('NONE')
+        assert package['files'][0]['license']['concluded'] == license('NONE')
+        assert package['files'][0]['license']['fromFile'] == [license('NOASSERTION')]
+    else:
+        assert package['license']['declared'] == 'NONE'
+        assert license('NOASSERTION') in metadata['licenses']
+
+
+def test_unexpected_errors_are_conversion_errors():
+    with pytest.raises(ConversionError, match='UnicodeDecodeError'):
+        convert_spdx_to_payload(b'SPDXVersion: SPDX-2.1\n\xff\n')
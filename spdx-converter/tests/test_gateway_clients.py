@@ -0,0 +1,218 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Tests of GatewayAPI and AsyncGatewayAPI against the stub gateway: both clients must store and retrieve the same
+assets, retry failed requests and report the error of a failed asset without stopping the others
+"""
+
+import asyncio
+import dataclasses
+import json
+import os
+
+import pytest
+import requests
+
+from conftest import ROOT
+from dbom_wrapper.api import APIException, GatewayAPI
+from dbom_wrapper.async_api import AsyncGatewayAPI
+from dbom_wrapper.convert import convert_spdx_to_payload
+from dbom_wrapper.jsonstream import iterencode
+from dbom_wrapper.retry import RetryPolicy
+
+REPO, CHANNEL = 'repo', 'chan'
+POLICY = RetryPolicy(max_attempts=3, backoff=0.01, jitter=False, timeout=10.0)
+
+
+@pytest.fixture(scope='module')
+def payload():
+    with open(os.path.join(ROOT, 'sbom.tag'), 'rb') as f:
+        return convert_spdx_to_payload(f)
+
+
+def assets(payload, count=5):
+    return [(f"asset-{i}", dict(payload, assetName=f"asset-{i}")) for i in range(count)]
+
+
+def run_sync(gateway, action, compress=False):
+    with GatewayAPI(gateway.address, pool_size=4, retry_policy=POLICY, compress=compress) as api:
+        return action(api)
+
+
+def run_async(gateway, action, compress=False):
+    async def main():
+        async with AsyncGatewayAPI(gateway.address, max_in_flight=4, retry_policy=POLICY, compress=compress) as api:
+            return await action(api)
+
+    return asyncio.run(main())
+
+
+def upload(gateway, client, items, compress=False):
+    if client == 'sync':
+        return run_sync(gateway, lambda api: api.create_assets(REPO, CHANNEL, items), compress)
+    return run_async(gateway, lambda api: api.create_assets(REPO, CHANNEL, items), compress)
+
+
+def download(gateway, client, asset_ids):
+    if client == 'sync':
+        return run_sync(gateway, lambda api: list(api.retreive_assets(REPO, CHANNEL, asset_ids)))
+    return run_async(gateway, lambda api: api.retreive_assets(REPO, CHANNEL, asset_ids))
+
+
+def stored(gateway, asset_id):
+    return gateway.assets[GatewayAPI('').asset_url(REPO, CHANNEL, asset_id)]
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_clients_store_the_same_assets(gateway, payload, compress):
+    items = assets(payload)
+    sync_results = upload(gateway, 'sync', items, compress)
+    sync_bodies = [stored(gateway, asset_id) for asset_id, _ in items]
+    gateway.assets.clear()
+    async_results = upload(gateway, 'async', items, compress)
+
+    for results in sync_results, async_results:
+        assert [r.asset_id for r in results] == [asset_id for asset_id, _ in items]
+        assert all(r.success and r.status_code == 200 for r in results)
+    # The chunked, and possibly gzip compressed, bodies decode to the payload as iterencode writes it
+    assert [stored(gateway, asset_id) for asset_id, _ in items] == sync_bodies
+    assert sync_bodies[0].decode('utf-8') == ''.join(iterencode(items[0][1]))
+
+
+@pytest.mark.parametrize('client', ['sync', 'async'])
+def test_retrieve_assets(gateway, payload, client):
+    items = assets(payload, 3)
+    upload(gateway, 'sync', items)
+    gateway.compress = True
+
+    results = download(gateway, client, [asset_id for asset_id, _ in items] + ['missing'])
+
+    assert [r.asset_id for r in results] == [asset_id for asset_id, _ in items] + ['missing']
+    for (_, sent), result in zip(items, results):
+        assert result.success and result.asset == json.loads(''.join(iterencode(sent)))
+    assert not results[-1].success and results[-1].status_code == 404
+
+
+@pytest.mark.parametrize('client', ['sync', 'async'])
+@pytest.mark.parametrize('failure, methods', [
+    # The upload may have been stored before failing, which is checked before sending it again
+    (503, ['POST', 'GET', 'POST']),
+    ((429, {'Retry-After': '0'}), ['POST', 'POST']),
+])
+def test_failed_upload_is_retried(gateway, payload, client, failure, methods):
+    gateway.fail_next(failure)
+
+    results = upload(gateway, client, assets(payload, 1))
+
+    assert results[0].success and results[0].status_code == 200
+    assert [method for method, _ in gateway.requests] == methods
+    assert len(gateway.assets) == 1
+
+
+@pytest.mark.parametrize('client', ['sync', 'async'])
+@pytest.mark.parametrize('stored_name, methods', [
+    # The upload was stored but its response was lost
+    ('asset-0', ['POST', 'GET']),
+    # An update failed, the version stored before it does not count as the upload
+    ('older', ['POST', 'GET', 'POST']),
+])
+def test_retry_checks_the_stored_asset(gateway, payload, client, stored_name, methods):
+    asset_id, sent = assets(payload, 1)[0]
+    url = GatewayAPI('').asset_url(REPO, CHANNEL, asset_id)
+    gateway.assets[url] = ''.join(iterencode(dict(sent, assetName=stored_name))).encode('utf-8')
+    gateway.fail_next(503)
+
+    results = upload(gateway, client, [(asset_id, sent)])
+
+    assert results[0].success and results[0].status_code == 200
+    assert [method for method, _ in gateway.requests] == methods
+    assert json.loads(gateway.assets[url]) == json.loads(''.join(iterencode(sent)))
+
+
+def test_failed_streamed_responses_release_their_connection(gateway, payload):
+    upload(gateway, 'sync', assets(payload, 1))
+    gateway.fail_next(503, 503)
+
+    with GatewayAPI(gateway.address, pool_size=1, retry_policy=POLICY) as api:
+        body = b''.join(api.retreive_asset_stream(REPO, CHANNEL, 'asset-0'))
+        pool = api.session.get_adapter(gateway.address).poolmanager.connection_from_url(gateway.address)
+
+    assert json.loads(body) == json.loads(''.join(iterencode(assets(payload, 1)[0][1])))
+    # All three attempts went over the one pooled connection
+    assert pool.num_connections == 1
+
+
+@pytest.mark.parametrize('client', ['sync', 'async'])
+def test_expired_deadline(gateway, payload, client):
+    policy = dataclasses.replace(POLICY, deadline=0)
+
+    if client == 'sync':
+        with GatewayAPI(gateway.address, retry_policy=policy) as api:
+            with pytest.raises(requests.Timeout):
+                api.create_asset(REPO, CHANNEL, 'asset-0', payload, verbose=False)
+    else:
+        async def main():
+            async with AsyncGatewayAPI(gateway.address, retry_policy=policy) as api:
+                await api.create_asset(REPO, CHANNEL, 'asset-0', payload)
+
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(main())
+    assert not gateway.requests
+
+
+@pytest.mark.parametrize('client', ['sync', 'async'])
+def test_deadline_spent_by_the_idempotency_check(gateway, payload, client):
+    gateway.latency = 0.2
+    gateway.fail_next(503)
+    policy = dataclasses.replace(POLICY, deadline=0.3)
+
+    if client == 'sync':
+        with GatewayAPI(gateway.address, retry_policy=policy) as api:
+            results = api.create_assets(REPO, CHANNEL, assets(payload, 1))
+    else:
+        async def main():
+            async with AsyncGatewayAPI(gateway.address, retry_policy=policy) as api:
+                return await api.create_assets(REPO, CHANNEL, assets(payload, 1))
+
+        results = asyncio.run(main())
+    # The check timed out on the deadline, the response of the upload is the outcome
+    assert results[0].status_code == 503 and isinstance(results[0].error, APIException)
+    assert [method for method, _ in gateway.requests] == ['POST', 'GET']
+
+
+@pytest.mark.parametrize('client', ['sync', 'async'])
+def test_errors_are_reported_per_asset(gateway, payload, client):
+    items = assets(payload, 3)
+    upload(gateway, 'sync', items)
+    # A body the gateway should never send back
+    gateway.assets[GatewayAPI('').asset_url(REPO, CHANNEL, 'asset-1')] = b'{"truncated'
+
+    results = download(gateway, client, [asset_id for asset_id, _ in items])
+
+    assert [r.success for r in results] == [True, False, True]
+    assert isinstance(results[1].error, ValueError)
+
+
+@pytest.mark.parametrize('client', ['sync', 'async'])
+def test_unencodable_payload_does_not_stop_the_batch(gateway, payload, client):
+    items = assets(payload, 3)
+    items[1] = ('asset-1', dict(payload, assetName=object()))
+
+    results = upload(gateway, client, items)
+
+    assert [r.success for r in results] == [True, False, True]
+    assert sorted(gateway.assets) == sorted(GatewayAPI('').asset_url(REPO, CHANNEL, a) for a in ('asset-0', 'asset-2'))
@@ -0,0 +1,103 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Tests of PayloadCache: entries and uploads survive from one run to the next, the least recently used entries are
+evicted, and the directory is only scanned once per run
+"""
+
+import os
+
+import pytest
+
+from dbom_wrapper import cache as cache_module
+from dbom_wrapper.cache import PayloadCache
+
+VERSION = 'test'
+PAYLOAD = {'assetName': 'asset', 'assetMetadata': {'files': ['a' * 100]}}
+
+
+def target(asset_id):
+    return PayloadCache.upload_target('http://gateway/', 'repo', 'chan', asset_id)
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return str(tmp_path / 'cache')
+
+
+def test_entries_and_uploads_are_found_by_the_next_run(directory):
+    cache = PayloadCache(directory, 1024 * 1024, VERSION)
+    entry = cache.put('key-1', 'asset-1', PAYLOAD)
+    cache.record_upload(entry, target('asset-1'))
+    cache.put('key-2', 'asset-2', PAYLOAD)
+
+    cache = PayloadCache(directory, 1024 * 1024, VERSION)
+
+    assert cache.get('key-1').upload == target('asset-1')
+    assert cache.get('key-2').upload is None
+    assert cache.get('key-3') is None
+    assert cache.find_upload(target('asset-1')).key == 'key-1'
+    assert cache.find_upload(target('asset-2')) is None
+    assert cache.find_upload(target('asset-1')).load_payload() == PAYLOAD
+
+
+def test_find_upload_returns_the_last_payload_sent(directory):
+    cache = PayloadCache(directory, 1024 * 1024, VERSION)
+    for key in 'key-1', 'key-2':
+        cache.record_upload(cache.put(key, 'asset', PAYLOAD), target('asset'))
+
+    assert cache.find_upload(target('asset')).key == 'key-2'
+    assert PayloadCache(directory, 1024 * 1024, VERSION).find_upload(target('asset')).key == 'key-2'
+
+
+def test_least_recently_used_entries_are_evicted(directory):
+    cache = PayloadCache(directory, 1024 * 1024, VERSION)
+    size = os.path.getsize(cache.put('key-0', 'asset', PAYLOAD).payload_path)
+    cache = PayloadCache(directory, 3 * size, VERSION)
+    cache.put('key-1', 'asset', PAYLOAD)
+    cache.put('key-2', 'asset', PAYLOAD)
+    cache.get('key-0')
+
+    cache.put('key-3', 'asset', PAYLOAD)
+
+    assert [key for key in ('key-0', 'key-1', 'key-2', 'key-3') if cache.get(key)] == ['key-0', 'key-2', 'key-3']
+    assert sorted(os.listdir(directory)) == sorted(f"key-{i}{suffix}" for i in (0, 2, 3)
+                                                   for suffix in (cache_module.META_SUFFIX, cache_module.PAYLOAD_SUFFIX))
+
+
+def test_entries_added_by_a_concurrent_run_are_found(directory):
+    cache = PayloadCache(directory, 1024 * 1024, VERSION)
+    cache.get('key-1')
+
+    PayloadCache(directory, 1024 * 1024, VERSION).put('key-1', 'asset-1', PAYLOAD)
+
+    assert cache.get('key-1').asset_id == 'asset-1'
+
+
+def test_directory_is_scanned_once_per_run(directory, monkeypatch):
+    scans = []
+    listdir = os.listdir
+    monkeypatch.setattr(cache_module.os, 'listdir', lambda path: scans.append(path) or listdir(path))
+    cache = PayloadCache(directory, 1024 * 1024, VERSION)
+
+    for i in range(20):
+        entry = cache.put(f"key-{i}", f"asset-{i}", PAYLOAD)
+        cache.record_upload(entry, target(f"asset-{i}"))
+        assert cache.find_upload(target(f"asset-{i}")).key == f"key-{i}"
+    cache.evict()
+
+    assert scans == [directory]
@@ -0,0 +1,50 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Tests of the SPDX JSON conversion: sbom.spdx.json must give the payload sbom.tag gives
+"""
+
+import json
+import os
+
+import pytest
+
+from conftest import ROOT
+from dbom_wrapper.convert import convert_spdx_to_payload
+from dbom_wrapper.spdxjson import make_annotation_list
+
+
+def convert(name, **kwargs):
+    with open(os.path.join(ROOT, name), 'rb') as f:
+        return convert_spdx_to_payload(f, **kwargs)
+
+
+@pytest.mark.parametrize('shared_licenses', [False, True])
+@pytest.mark.parametrize('fast_reader', [True, False])
+def test_json_and_tag_value_give_the_same_payload(shared_licenses, fast_reader):
+    tag_value = convert('sbom.tag', shared_licenses=shared_licenses, fast_reader=fast_reader)
+
+    assert convert('sbom.spdx.json', shared_licenses=shared_licenses) == tag_value
+    assert json.dumps(convert('sbom.spdx.json', shared_licenses=shared_licenses)) == json.dumps(tag_value)
+
+
+def test_annotations_are_about_the_element_they_name():
+    annotation = {'annotator': 'Person: Jim Annotator', 'annotationType': 'REVIEW',
+                  'annotationDate': '2020-03-11T00:00:00Z', 'comment': 'Comment'}
+    document = {'SPDXID': 'SPDXRef-DOCUMENT', 'annotations': [annotation, dict(annotation, id='SPDXRef-45')]}
+
+    assert [a.id for a in make_annotation_list([document])] == ['SPDXRef-DOCUMENT', 'SPDXRef-45']
@@ -0,0 +1,107 @@
+"""
+Copyright 2020 Unisys Corporation
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Differential tests of the fast tag-value reader (dbom_wrapper.tagreader) against the spdx-tools parser: both must
+give the same payload, and documents the fast reader does not support must be parsed by spdx-tools
+"""
+
+import os
+import sys
+
+import pytest
+
+from conftest import ROOT
+from dbom_wrapper import convert as convert_module
+from dbom_wrapper.convert import ConversionError, convert_spdx_to_payload, create_dbom_asset_payload, parse_spdx
+from dbom_wrapper.tagreader import read_tag_value
+
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+from synthetic import generate_sbom  # noqa: E402
+
+SEEDS = range(5)
+
+
+def sample(name):
+    if name == 'sbom.tag':
+        with open(os.path.join(ROOT, name), encoding='utf-8') as f:
+            return f.read()
+    if name == 'multi-package':
+        return ''.join(generate_sbom(files=10, snippets=2, packages=3, seed=1))
+    seed = int(name.split('-')[1])
+    return ''.join(generate_sbom(files=20, snippets=3, license_depth=seed % 4, seed=seed))
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """
+    The documents parsed by spdx-tools during a test
+    """
+    documents = []
+
+    def counted(text):
+        documents.append(text)
+        return parse_spdx(text)
+
+    monkeypatch.setattr(convert_module, 'parse_spdx', counted)
+    return documents
+
+
+@pytest.mark.parametrize('name', ['sbom.tag'] + [f"synthetic-{seed}" for seed in SEEDS])
+def test_read_tag_value_gives_the_payload_of_spdx_tools(name):
+    text = sample(name)
+
+    read = read_tag_value(text)
+
+    assert read is not None
+    assert read[1] == create_dbom_asset_payload(parse_spdx(text))
+
+
+@pytest.mark.parametrize('shared_licenses', [False, True])
+@pytest.mark.parametrize('name', ['sbom.tag', 'multi-package'] + [f"synthetic-{seed}" for seed in SEEDS])
+def test_fast_reader_gives_the_payload_of_spdx_tools(name, shared_licenses, parses):
+    text = sample(name)
+
+    fast = convert_spdx_to_payload(text, shared_licenses=shared_licenses)
+    assert not parses
+    assert convert_spdx_to_payload(text, shared_licenses=shared_licenses, fast_reader=False) == fast
+    assert parses
+
+
+@pytest.mark.parametrize('old, new', [
+    ('PackageLicenseDeclared: (Apache-2.0 AND MPL-1.1)', 'PackageLicenseDeclared: MIT WITH Classpath-exception-2.0'),
+    ('PackageDownloadLocation: http://org1.com/example', 'PackageDownloadLocation: NOASSERTION'),
+])
+def test_unsupported_documents_are_parsed_by_spdx_tools(old, new, parses):
+    text = sample('sbom.tag')
+    assert old in text
+    text = text.replace(old, new)
+
+    assert read_tag_value(text) is None
+    fast = convert_spdx_to_payload(text)
+    assert parses == [text]
+    assert convert_spdx_to_payload(text, fast_reader=False) == fast
+
+
+def test_errors_are_reported_by_spdx_tools():
+    text = sample('sbom.tag').replace('PackageName:', 'PackageHomePage: https://example.com\nPackageName:', 1)
+
+    assert read_tag_value(text) is None
+    with pytest.raises(ConversionError) as fast:
+        convert_spdx_to_payload(text)
+    with pytest.raises(ConversionError) as full:
+        convert_spdx_to_payload(text, fast_reader=False)
+    assert fast.value.args == full.value.args